@@ -1,12 +1,43 @@
 import os
-from fastapi import FastAPI, HTTPException
+import math
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, EmailStr
-from .db import init_db, add_user, get_user, update_user, remove_user
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel, EmailStr, Field
+from .db import (
+    init_db,
+    close,
+    add_user,
+    get_user,
+    update_user,
+    remove_user,
+    transaction,
+    allowed_freq,
+    allowed_salutation,
+    LUNAR_PREFIX,
+    NAME_MAX,
+    clean_name,
+    _parse_birthday,
+)
+from . import metrics, migrations, ratelimit
 from .verify import generate_code, verify_code
-from .email_sender import send_verification_email
+from .mail_queue import verification_queue
+
+
+@asynccontextmanager
+async def lifespan(app):
+    init_db(background=True)
+    try:
+        yield
+    finally:
+        migrations.stop()
+        verification_queue.stop()
+        close()
 
-app = FastAPI()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -16,10 +47,47 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-init_db()
 
-allowed_freq = {"monthly", "weekly", "holiday"}
-allowed_salutation = {"哥哥", "姐姐"}
+async def record_latency(request: Request, call_next):
+    t = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        metrics.observe(
+            "http_server_seconds",
+            time.perf_counter() - t,
+            method=request.method,
+            route=getattr(route, "path", "unmatched"),
+            status=status,
+        )
+
+
+if metrics.enabled:
+    app.middleware("http")(record_latency)
+
+
+def _client_ip(request: Request) -> str:
+    hops = int(os.environ.get("RATE_LIMIT_PROXY", "0"))
+    forwarded = request.headers.get("x-forwarded-for") if hops > 0 else None
+    if forwarded:
+        addrs = [a.strip() for a in forwarded.split(",")]
+        if len(addrs) >= hops:
+            return addrs[-hops]
+    return request.client.host if request.client else "unknown"
+
+
+def _throttle(request: Request, group: str, email: str):
+    wait = ratelimit.limit(group, _client_ip(request), email)
+    if wait:
+        raise HTTPException(
+            status_code=429,
+            detail="too many requests",
+            headers={"Retry-After": str(math.ceil(wait))},
+        )
 
 
 class VerifySendRequest(BaseModel):
@@ -32,6 +100,8 @@ class SubscribeRequest(BaseModel):
     frequency: str
     salutation: str
     birthday: str | None = None
+    calendar: str | None = None
+    name: str | None = Field(default=None, max_length=NAME_MAX)
     code: str
 
 
@@ -45,66 +115,106 @@ class UpdateRequest(BaseModel):
     frequency: str | None = None
     salutation: str | None = None
     birthday: str | None = None
+    calendar: str | None = None
+    name: str | None = Field(default=None, max_length=NAME_MAX)
     code: str
 
 
+def _birthday(birthday: str | None, calendar: str | None) -> str | None:
+    if calendar not in {None, "solar", "lunar"}:
+        raise HTTPException(status_code=400, detail="invalid calendar")
+    if not birthday:
+        return birthday
+    if calendar == "lunar" and not birthday.startswith(LUNAR_PREFIX):
+        birthday = LUNAR_PREFIX + birthday
+    if not _parse_birthday(birthday):
+        raise HTTPException(status_code=400, detail="invalid birthday")
+    return birthday
+
+
 @app.get("/health")
 def health():
     return {"ok": True}
 
 
 @app.post("/verify/send")
-def verify_send(req: VerifySendRequest):
+def verify_send(req: VerifySendRequest, request: Request):
+    _throttle(request, "send", req.email)
     if req.action not in {"subscribe", "unsubscribe", "update"}:
         raise HTTPException(status_code=400, detail="invalid action")
     code = generate_code(req.email, req.action)
-    send_verification_email(req.email, code, req.action)
+    if code is None:
+        raise HTTPException(status_code=429, detail="too many requests")
+    if not verification_queue.enqueue(req.email, code, req.action):
+        raise HTTPException(status_code=503, detail="mail queue full")
     return {"ok": True}
 
 
+@app.get("/metrics")
+def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/verify/stats")
+def verify_stats():
+    return verification_queue.stats()
+
+
 @app.post("/subscribe")
-def subscribe(req: SubscribeRequest):
+def subscribe(req: SubscribeRequest, request: Request):
+    _throttle(request, "code", req.email)
     if req.frequency not in allowed_freq:
         raise HTTPException(status_code=400, detail="invalid frequency")
     if req.salutation not in allowed_salutation:
         raise HTTPException(status_code=400, detail="invalid salutation")
+    birthday = _birthday(req.birthday, req.calendar)
     if not verify_code(req.email, "subscribe", req.code):
         raise HTTPException(status_code=400, detail="invalid code")
-    if get_user(req.email):
+    if not add_user(
+        req.email, req.frequency, req.salutation, birthday, clean_name(req.name)
+    ):
         raise HTTPException(status_code=400, detail="already subscribed")
-    add_user(req.email, req.frequency, req.salutation, req.birthday)
     return {"ok": True}
 
 
 @app.post("/unsubscribe")
-def unsubscribe(req: UnsubscribeRequest):
+def unsubscribe(req: UnsubscribeRequest, request: Request):
+    _throttle(request, "code", req.email)
     if not verify_code(req.email, "unsubscribe", req.code):
         raise HTTPException(status_code=400, detail="invalid code")
-    if not get_user(req.email):
+    if not remove_user(req.email):
         raise HTTPException(status_code=400, detail="not subscribed")
-    remove_user(req.email)
     return {"ok": True}
 
 
 @app.post("/update")
-def update(req: UpdateRequest):
+def update(req: UpdateRequest, request: Request):
+    _throttle(request, "code", req.email)
+    birthday = _birthday(req.birthday, req.calendar)
     if not verify_code(req.email, "update", req.code):
         raise HTTPException(status_code=400, detail="invalid code")
-    current = get_user(req.email)
-    if not current:
-        raise HTTPException(status_code=400, detail="not subscribed")
-    new_frequency = current["frequency"]
-    new_salutation = current["salutation"]
-    new_birthday = current["birthday"]
-    if req.frequency is not None:
-        if req.frequency not in allowed_freq:
-            raise HTTPException(status_code=400, detail="invalid frequency")
-        new_frequency = req.frequency
-    if req.salutation is not None:
-        if req.salutation not in allowed_salutation:
-            raise HTTPException(status_code=400, detail="invalid salutation")
-        new_salutation = req.salutation
-    if req.birthday is not None:
-        new_birthday = req.birthday
-    update_user(req.email, new_frequency, new_salutation, new_birthday)
+    with transaction():
+        current = get_user(req.email)
+        if not current:
+            raise HTTPException(status_code=400, detail="not subscribed")
+        new_frequency = current["frequency"]
+        new_salutation = current["salutation"]
+        new_birthday = current["birthday"]
+        if req.frequency is not None:
+            if req.frequency not in allowed_freq:
+                raise HTTPException(status_code=400, detail="invalid frequency")
+            new_frequency = req.frequency
+        if req.salutation is not None:
+            if req.salutation not in allowed_salutation:
+                raise HTTPException(status_code=400, detail="invalid salutation")
+            new_salutation = req.salutation
+        if birthday is not None:
+            new_birthday = birthday
+        update_user(
+            req.email,
+            new_frequency,
+            new_salutation,
+            new_birthday,
+            clean_name(req.name),
+        )
     return {"ok": True}
@@ -0,0 +1,158 @@
+import re
+import sys
+import csv
+import json
+import time
+import argparse
+from functools import lru_cache
+from itertools import islice
+from email_validator import validate_email, EmailNotValidError
+from .db import (
+    init_db,
+    iter_users,
+    upsert_users,
+    allowed_freq,
+    allowed_salutation,
+    _freq_to_int,
+    _sal_to_int,
+    _parse_birthday,
+    clean_name,
+)
+
+FIELDS = ["email", "frequency", "salutation", "birthday", "name"]
+_ATOM = re.compile(
+    r"[A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+(\.[A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+)*"
+)
+
+
+@lru_cache(maxsize=65536)
+def _domain(domain: str) -> str:
+    return validate_email("a@" + domain, check_deliverability=False).domain
+
+
+def normalize_email(email: str) -> str:
+    local, _, domain = email.strip().rpartition("@")
+    if local and len(local) <= 64 and len(email) <= 254 and _ATOM.fullmatch(local):
+        return f"{local}@{_domain(domain)}"
+    return validate_email(email.strip(), check_deliverability=False).normalized
+
+
+def _format(path: str, fmt: str | None) -> str:
+    if fmt:
+        return fmt
+    return "jsonl" if path.endswith((".jsonl", ".ndjson")) else "csv"
+
+
+def read_records(f, fmt: str):
+    if fmt == "csv":
+        yield from csv.DictReader(f)
+    else:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def to_row(rec: dict):
+    try:
+        email = normalize_email(str(rec.get("email") or ""))
+    except EmailNotValidError as e:
+        raise ValueError(f"invalid email: {e}")
+    freq = rec.get("frequency")
+    if freq not in allowed_freq:
+        raise ValueError(f"invalid frequency: {freq!r}")
+    sal = rec.get("salutation")
+    if sal not in allowed_salutation:
+        raise ValueError(f"invalid salutation: {sal!r}")
+    birthday = rec.get("birthday") or None
+    b = _parse_birthday(birthday)
+    if birthday and not b:
+        raise ValueError(f"invalid birthday: {birthday!r}")
+    b = b or (None, None, None, 0)
+    name = clean_name(rec.get("name")) or None
+    return (email, _freq_to_int(freq), _sal_to_int(sal), b[0], b[1], b[2], name, b[3])
+
+
+def import_users(f, fmt: str, batch: int = 50000, err=sys.stderr):
+    init_db()
+    total = invalid = 0
+    t = time.perf_counter()
+
+    def rows():
+        nonlocal invalid
+        for n, rec in enumerate(read_records(f, fmt), 1):
+            try:
+                yield to_row(rec)
+            except ValueError as e:
+                invalid += 1
+                if invalid <= 20:
+                    print(f"record {n}: {e}", file=err)
+
+    it = rows()
+    while True:
+        chunk = list(islice(it, batch))
+        if not chunk:
+            break
+        upsert_users(chunk)
+        total += len(chunk)
+        elapsed = time.perf_counter() - t
+        print(f"imported {total} rows ({total / elapsed:.0f} rows/s)", file=err)
+    return total, invalid, time.perf_counter() - t
+
+
+def export_users(f, fmt: str, err=sys.stderr):
+    total = 0
+    t = time.perf_counter()
+    if fmt == "csv":
+        w = csv.DictWriter(f, FIELDS, extrasaction="ignore")
+        w.writeheader()
+        for u in iter_users():
+            w.writerow(u)
+            total += 1
+    else:
+        for u in iter_users():
+            f.write(json.dumps({k: u[k] for k in FIELDS}, ensure_ascii=False))
+            f.write("\n")
+            total += 1
+    elapsed = time.perf_counter() - t
+    print(f"exported {total} rows ({total / max(elapsed, 1e-9):.0f} rows/s)", file=err)
+    return total, elapsed
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m backend.bulk")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    imp = sub.add_parser("import")
+    imp.add_argument("path", help="CSV or JSONL file, - for stdin")
+    imp.add_argument("--format", choices=["csv", "jsonl"])
+    imp.add_argument("--batch", type=int, default=50000)
+    exp = sub.add_parser("export")
+    exp.add_argument("path", help="CSV or JSONL file, - for stdout")
+    exp.add_argument("--format", choices=["csv", "jsonl"])
+    args = ap.parse_args(argv)
+    fmt = _format(args.path, args.format)
+    if args.cmd == "import":
+        f = (
+            sys.stdin
+            if args.path == "-"
+            else open(args.path, "r", encoding="utf-8", newline="")
+        )
+        with f:
+            total, invalid, elapsed = import_users(f, fmt, args.batch)
+        print(
+            f"done: {total} rows upserted, {invalid} invalid, {total / max(elapsed, 1e-9):.0f} rows/s",
+            file=sys.stderr,
+        )
+        return 1 if invalid else 0
+    f = (
+        sys.stdout
+        if args.path == "-"
+        else open(args.path, "w", encoding="utf-8", newline="")
+    )
+    with f:
+        export_users(f, fmt)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,24 +1,85 @@
 import os
 import sqlite3
 import datetime
+import threading
+import unicodedata
+from contextlib import contextmanager
+from . import metrics
 
 DB_PATH = os.environ.get("DB_PATH", os.path.join(os.getcwd(), "data", "data.db"))
-os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-_conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-_conn.execute("PRAGMA foreign_keys = ON")
+_local = threading.local()
 
+allowed_freq = {"monthly", "weekly", "holiday"}
+allowed_salutation = {"哥哥", "姐姐"}
+LUNAR_PREFIX = "农历"
+NAME_MAX = 32
 
-def init_db():
-    _conn.execute(
-        "CREATE TABLE IF NOT EXISTS users (email TEXT PRIMARY KEY, frequency INTEGER NOT NULL, salutation INTEGER NOT NULL, birth_year INTEGER, birth_month INTEGER, birth_day INTEGER)"
+
+def clean_name(name: str | None) -> str | None:
+    if not name:
+        return name
+    name = "".join(
+        c if not unicodedata.category(c).startswith("C") else " " for c in name
+    )
+    return " ".join(name.split())[:NAME_MAX]
+
+
+def connect(path: str):
+    conn = sqlite3.connect(
+        path,
+        timeout=int(os.environ.get("DB_BUSY_TIMEOUT", "5000")) / 1000,
+        isolation_level=None,
+        cached_statements=256,
     )
-    _conn.commit()
-    cur = _conn.execute("PRAGMA table_info(users)")
-    cols = {row[1] for row in cur.fetchall()}
-    for col in ["birth_year", "birth_month", "birth_day"]:
-        if col not in cols:
-            _conn.execute(f"ALTER TABLE users ADD COLUMN {col} INTEGER")
-    _conn.commit()
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("PRAGMA foreign_keys = ON")
+    return conn
+
+
+def _conn():
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+        conn = _local.conn = connect(DB_PATH)
+        _local.depth = 0
+    return conn
+
+
+def close():
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        conn.close()
+        _local.conn = None
+
+
+@contextmanager
+def transaction():
+    conn = _conn()
+    if _local.depth:
+        _local.depth += 1
+        try:
+            yield conn
+        finally:
+            _local.depth -= 1
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    _local.depth = 1
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    else:
+        conn.execute("COMMIT")
+    finally:
+        _local.depth = 0
+
+
+def init_db(background: bool = False):
+    from .migrations import migrate
+
+    migrate(background=background)
 
 
 def _freq_to_int(f: str | int) -> int:
@@ -33,38 +94,123 @@ def _sal_to_int(s: str | int) -> int:
     return {"哥哥": 0, "姐姐": 1}.get(s, 1)
 
 
+def _lunar_month(y: int, m: int):
+    from lunar_python import LunarYear
+
+    year = LunarYear.fromYear(y)
+    return year.getMonth(m) or year.getMonth(abs(m))
+
+
+def _lunar_to_solar(y: int, m: int, d: int) -> datetime.date:
+    from lunar_python import Lunar
+
+    month = _lunar_month(y, m)
+    s = Lunar.fromYmd(y, month.getMonth(), min(d, month.getDayCount())).getSolar()
+    return datetime.date(s.getYear(), s.getMonth(), s.getDay())
+
+
+def _lunar_year(d) -> int:
+    from lunar_python import Solar
+
+    return Solar.fromYmd(d.year, d.month, d.day).getLunar().getYear()
+
+
+def next_lunar_birthday(m: int, d: int, today=None) -> datetime.date:
+    today = today or datetime.date.today()
+    today = datetime.date(today.year, today.month, today.day)
+    ly = _lunar_year(today)
+    s = _lunar_to_solar(ly, m, d)
+    return s if s >= today else _lunar_to_solar(ly + 1, m, d)
+
+
 def _parse_birthday(b: str | None):
     if not b:
         return None
     try:
-        y, m, d = b.split("/")
-        return int(y), int(m), int(d)
+        lunar = b.startswith(LUNAR_PREFIX)
+        y, m, d = b[len(LUNAR_PREFIX) if lunar else 0 :].split("/")
+        leap = lunar and m.startswith("闰")
+        y, m, d = int(y), int(m[1:] if leap else m), int(d)
+        if not lunar:
+            return y, m, d, 0
+        month = _lunar_month(y, -m if leap else m)
+        if month is None or month.getMonth() != (-m if leap else m):
+            return None
+        if not 1 <= d <= month.getDayCount():
+            return None
+        return y, month.getMonth(), d, 1
     except Exception:
         return None
 
 
+def _format_birthday(y, m, d, calendar) -> str | None:
+    if not (y and m and d):
+        return None
+    if calendar == 1:
+        return f"{LUNAR_PREFIX}{y}/{'闰' if m < 0 else ''}{abs(m)}/{d}"
+    return f"{y}/{m}/{d}"
+
+
+def _solar_birthday(b, today=None) -> str | None:
+    if not b or b[3] != 1:
+        return None
+    return next_lunar_birthday(b[1], b[2], today).isoformat()
+
+
+def _on_birthday(d):
+    return (
+        "((calendar=0 AND birth_month IS ? AND birth_day IS ?) OR (calendar=1 AND solar_birthday IS ?))",
+        [d.month, d.day, d.strftime("%Y-%m-%d")],
+    )
+
+
+def _effective_year(d):
+    offset = d.year - _lunar_year(d)
+    return f"CASE WHEN calendar=1 THEN birth_year + {offset} ELSE birth_year END"
+
+
+def refresh_birthdays(today=None) -> int:
+    today = today or datetime.date.today()
+    day = today.strftime("%Y-%m-%d")
+    stale = "calendar=1 AND (solar_birthday IS NULL OR solar_birthday < ?)"
+    n = 0
+    with transaction() as conn:
+        pairs = conn.execute(
+            "SELECT birth_month, birth_day FROM users WHERE calendar=1 AND solar_birthday IS NULL UNION SELECT birth_month, birth_day FROM users WHERE calendar=1 AND solar_birthday < ?",
+            (day,),
+        ).fetchall()
+        for m, d in pairs:
+            n += conn.execute(
+                f"UPDATE users SET solar_birthday=? WHERE birth_month=? AND birth_day=? AND {stale}",
+                (next_lunar_birthday(m, d, today).isoformat(), m, d, day),
+            ).rowcount
+    if n:
+        print(f"Refreshed {n} lunar birthdays from {len(pairs)} distinct dates")
+    return n
+
+
+@metrics.timed("db_query_seconds", op="add_user")
 def add_user(
-    email: str, frequency: str | int, salutation: str | int, birthday: str | None
-):
+    email: str,
+    frequency: str | int,
+    salutation: str | int,
+    birthday: str | None,
+    name: str | None = None,
+) -> bool:
     fy = _freq_to_int(frequency)
     sl = _sal_to_int(salutation)
-    b = _parse_birthday(birthday)
-    if b:
-        _conn.execute(
-            "INSERT INTO users (email, frequency, salutation, birth_year, birth_month, birth_day) VALUES (?, ?, ?, ?, ?, ?)",
-            (email, fy, sl, b[0], b[1], b[2]),
-        )
-    else:
-        _conn.execute(
-            "INSERT INTO users (email, frequency, salutation) VALUES (?, ?, ?)",
-            (email, fy, sl),
-        )
-    _conn.commit()
+    b = _parse_birthday(birthday) or (None, None, None, 0)
+    cur = _conn().execute(
+        "INSERT INTO users (email, frequency, salutation, birth_year, birth_month, birth_day, name, calendar, solar_birthday) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (email) DO NOTHING",
+        (email, fy, sl, b[0], b[1], b[2], name or None, b[3], _solar_birthday(b)),
+    )
+    return cur.rowcount == 1
 
 
+@metrics.timed("db_query_seconds", op="get_user")
 def get_user(email: str):
-    cur = _conn.execute(
-        "SELECT email, frequency, salutation, birth_year, birth_month, birth_day FROM users WHERE email=?",
+    cur = _conn().execute(
+        "SELECT email, frequency, salutation, birth_year, birth_month, birth_day, name, calendar FROM users WHERE email=?",
         (email,),
     )
     row = cur.fetchone()
@@ -73,9 +219,7 @@ def get_user(email: str):
     by = row[3]
     bm = row[4]
     bd = row[5]
-    bstr = None
-    if by and bm and bd:
-        bstr = f"{by}/{bm}/{bd}"
+    bstr = _format_birthday(by, bm, bd, row[7])
     return {
         "email": row[0],
         "frequency": row[1],
@@ -84,31 +228,40 @@ def get_user(email: str):
         "birth_month": bm,
         "birth_day": bd,
         "birthday": bstr,
+        "calendar": "lunar" if row[7] == 1 else "solar",
+        "name": row[6],
     }
 
 
+@metrics.timed("db_query_seconds", op="update_user")
 def update_user(
-    email: str, frequency: str | int, salutation: str | int, birthday: str | None
+    email: str,
+    frequency: str | int,
+    salutation: str | int,
+    birthday: str | None,
+    name: str | None = None,
 ):
     fy = _freq_to_int(frequency)
     sl = _sal_to_int(salutation)
     b = _parse_birthday(birthday)
     if b:
-        _conn.execute(
-            "UPDATE users SET frequency=?, salutation=?, birth_year=?, birth_month=?, birth_day=? WHERE email=?",
-            (fy, sl, b[0], b[1], b[2], email),
+        _conn().execute(
+            "UPDATE users SET frequency=?, salutation=?, birth_year=?, birth_month=?, birth_day=?, calendar=?, solar_birthday=? WHERE email=?",
+            (fy, sl, b[0], b[1], b[2], b[3], _solar_birthday(b), email),
         )
     else:
-        _conn.execute(
+        _conn().execute(
             "UPDATE users SET frequency=?, salutation=? WHERE email=?",
             (fy, sl, email),
         )
-    _conn.commit()
+    if name is not None:
+        _conn().execute("UPDATE users SET name=? WHERE email=?", (name or None, email))
 
 
-def remove_user(email: str):
-    _conn.execute("DELETE FROM users WHERE email=?", (email,))
-    _conn.commit()
+@metrics.timed("db_query_seconds", op="remove_user")
+def remove_user(email: str) -> bool:
+    cur = _conn().execute("DELETE FROM users WHERE email=?", (email,))
+    return cur.rowcount > 0
 
 
 def _freq_to_str(f: int) -> str:
@@ -121,34 +274,57 @@ def _sal_to_str(s: int) -> str:
     return {0: "哥哥", 1: "姐姐"}.get(int(s) if s is not None else 1, "姐姐")
 
 
+def _user_row(r):
+    by, bm, bd = r[3], r[4], r[5]
+    bstr = _format_birthday(by, bm, bd, r[7])
+    return {
+        "email": r[0],
+        "frequency": _freq_to_str(r[1]),
+        "salutation": _sal_to_str(r[2]),
+        "birth_year": by,
+        "birth_month": bm,
+        "birth_day": bd,
+        "birthday": bstr,
+        "calendar": "lunar" if r[7] == 1 else "solar",
+        "name": r[6],
+    }
+
+
 def list_users():
-    cur = _conn.execute(
-        "SELECT email, frequency, salutation, birth_year, birth_month, birth_day FROM users"
+    return list(iter_users())
+
+
+def iter_users(size: int = 1000):
+    cur = _conn().execute(
+        "SELECT email, frequency, salutation, birth_year, birth_month, birth_day, name, calendar FROM users"
     )
-    rows = cur.fetchall()
-    res = []
-    for r in rows:
-        by, bm, bd = r[3], r[4], r[5]
-        bstr = f"{by}/{bm}/{bd}" if by and bm and bd else None
-        res.append(
-            {
-                "email": r[0],
-                "frequency": _freq_to_str(r[1]),
-                "salutation": _sal_to_str(r[2]),
-                "birth_year": by,
-                "birth_month": bm,
-                "birth_day": bd,
-                "birthday": bstr,
-            }
+    while True:
+        rows = cur.fetchmany(size)
+        if not rows:
+            return
+        for r in rows:
+            yield _user_row(r)
+
+
+@metrics.timed("db_query_seconds", op="upsert_users")
+def upsert_users(rows) -> int:
+    with transaction() as conn:
+        cur = conn.executemany(
+            "INSERT INTO users (email, frequency, salutation, birth_year, birth_month, birth_day, name, calendar) VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (email) DO UPDATE SET frequency=excluded.frequency, salutation=excluded.salutation, birth_year=excluded.birth_year, birth_month=excluded.birth_month, birth_day=excluded.birth_day, name=excluded.name, calendar=excluded.calendar, solar_birthday=NULL",
+            rows,
         )
-    return res
+        n = cur.rowcount
+        refresh_birthdays()
+        return n
 
 
 def list_birthday_today_group():
     d = datetime.date.today()
-    cur = _conn.execute(
-        "SELECT birth_year, email, frequency, salutation FROM users WHERE birth_month=? AND birth_day=? ORDER BY birth_year",
-        (d.month, d.day),
+    match, params = _on_birthday(d)
+    year = _effective_year(d)
+    cur = _conn().execute(
+        f"SELECT {year}, email, frequency, salutation FROM users WHERE {match} ORDER BY 1",
+        params,
     )
     rows = cur.fetchall()
     groups: dict[str, list[dict]] = {}
@@ -163,3 +339,101 @@ def list_birthday_today_group():
             }
         )
     return groups
+
+
+def iter_email_batches(
+    frequencies: list[str],
+    salutation: str | int,
+    exclude_birthday: datetime.date | None = None,
+    size: int = 1000,
+):
+    if not frequencies:
+        return
+    freqs = [_freq_to_int(f) for f in frequencies]
+    sql = f"SELECT email FROM users WHERE frequency IN ({','.join('?' * len(freqs))}) AND salutation=?"
+    params = [*freqs, _sal_to_int(salutation)]
+    if exclude_birthday is not None:
+        match, extra = _on_birthday(exclude_birthday)
+        sql += f" AND NOT {match}"
+        params += extra
+    sql += " ORDER BY email"
+    cur = _conn().execute(sql, params)
+    while True:
+        rows = cur.fetchmany(size)
+        if not rows:
+            return
+        yield [r[0] for r in rows]
+
+
+def iter_birthday_groups(d: datetime.date | None = None):
+    d = d or datetime.date.today()
+    match, params = _on_birthday(d)
+    year = _effective_year(d)
+    cur = _conn().execute(
+        f"SELECT salutation, {year} AS year, CASE WHEN birth_year THEN ? - {year} ELSE 0 END, email FROM users WHERE {match} ORDER BY salutation, year, email",
+        [d.year, *params],
+    )
+    group = None
+    last = None
+    for sal, by, age, email in cur:
+        if group is None or last != (sal, by):
+            if group is not None:
+                yield group
+            last = (sal, by)
+            group = {
+                "salutation": _sal_to_str(sal),
+                "group": str(by) if by else "unknown",
+                "age": age,
+                "recipients": [],
+            }
+        group["recipients"].append(email)
+    if group is not None:
+        yield group
+
+
+def iter_recipients(
+    frequencies: list[str],
+    exclude_birthday: datetime.date | None = None,
+    size: int = 1000,
+):
+    if not frequencies:
+        return
+    freqs = [_freq_to_int(f) for f in frequencies]
+    sql = f"SELECT email, salutation, frequency, name FROM users WHERE frequency IN ({','.join('?' * len(freqs))})"
+    params = list(freqs)
+    if exclude_birthday is not None:
+        match, extra = _on_birthday(exclude_birthday)
+        sql += f" AND NOT {match}"
+        params += extra
+    cur = _conn().execute(sql, params)
+    while True:
+        rows = cur.fetchmany(size)
+        if not rows:
+            return
+        for email, sal, freq, name in rows:
+            yield {
+                "email": email,
+                "salutation": _sal_to_str(sal),
+                "frequency": _freq_to_str(freq),
+                "name": name,
+            }
+
+
+def iter_birthdays(d: datetime.date | None = None, size: int = 1000):
+    d = d or datetime.date.today()
+    match, params = _on_birthday(d)
+    cur = _conn().execute(
+        f"SELECT email, salutation, CASE WHEN birth_year THEN ? - {_effective_year(d)} ELSE 0 END, name FROM users WHERE {match}",
+        [d.year, *params],
+    )
+    while True:
+        rows = cur.fetchmany(size)
+        if not rows:
+            return
+        for email, sal, age, name in rows:
+            yield {
+                "email": email,
+                "salutation": _sal_to_str(sal),
+                "age": age,
+                "name": name,
+            }
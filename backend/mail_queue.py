@@ -0,0 +1,134 @@
+import os
+import time
+import queue
+import threading
+from collections import deque
+from . import metrics
+from .shaper import get_shaper
+from .smtp import SMTPPool, send_batch
+from .email_sender import compose_verification_email
+
+
+def _workers():
+    return max(1, int(os.environ.get("VERIFY_MAIL_WORKERS", "2")))
+
+
+def _maxsize():
+    return max(0, int(os.environ.get("VERIFY_QUEUE_SIZE", "10000")))
+
+
+def _max_wait():
+    return float(os.environ.get("VERIFY_MAIL_MAX_WAIT", "120"))
+
+
+class MailQueue:
+    def __init__(
+        self, workers: int | None = None, maxsize: int | None = None, pool=None
+    ):
+        self.workers = workers or _workers()
+        self._q = queue.Queue(_maxsize() if maxsize is None else maxsize)
+        self._pool = pool
+        self._threads: list[threading.Thread] = []
+        self._lock = threading.Lock()
+        self._latency = deque(maxlen=1000)
+        self.enqueued = 0
+        self.sent = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            if self._pool is None:
+                self._pool = SMTPPool(size=self.workers)
+            for _ in range(self.workers):
+                t = threading.Thread(target=self._run, daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def stop(self, timeout: float = 10):
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for _ in threads:
+            self._q.put(None)
+        for t in threads:
+            t.join(timeout)
+        if self._pool is not None:
+            self._pool.close()
+
+    def enqueue(self, to_email: str, code: str, action: str) -> bool:
+        if not os.environ.get("SMTP_EMAIL", "") or not os.environ.get("SMTP_KEY", ""):
+            raise RuntimeError("SMTP_EMAIL or SMTP_KEY missing")
+        self.start()
+        try:
+            self._q.put_nowait((time.monotonic(), to_email, code, action))
+        except queue.Full:
+            with self._lock:
+                self.rejected += 1
+            return False
+        with self._lock:
+            self.enqueued += 1
+        return True
+
+    def join(self):
+        self._q.join()
+
+    def _run(self):
+        sender = os.environ.get("SMTP_EMAIL", "")
+        while True:
+            job = self._q.get()
+            if job is None:
+                self._q.task_done()
+                return
+            queued_at, to_email, code, action = job
+            t = time.perf_counter()
+            try:
+                shaper = get_shaper()
+                deadline = shaper.clock() + _max_wait() - (time.monotonic() - queued_at)
+                if not shaper.acquire(
+                    1, kind="verify", priority=True, deadline=deadline
+                ):
+                    raise RuntimeError("send budget exhausted")
+                refused = send_batch(
+                    self._pool,
+                    sender,
+                    [to_email],
+                    compose_verification_email(to_email, code, action),
+                )
+                if refused:
+                    raise RuntimeError(f"recipient refused: {refused!r}")
+            except Exception as e:
+                print(f"Failed to send verification mail to {to_email}: {e!r}")
+                with self._lock:
+                    self.failed += 1
+                metrics.inc("verify_mail", result="failed")
+            else:
+                latency = time.monotonic() - queued_at
+                with self._lock:
+                    self.sent += 1
+                    self._latency.append(latency)
+                metrics.inc("verify_mail", result="sent")
+                metrics.observe("verify_mail_send_seconds", time.perf_counter() - t)
+                metrics.observe("verify_mail_queue_seconds", latency)
+            finally:
+                self._q.task_done()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lat = sorted(self._latency)
+            res = {
+                "depth": self._q.qsize(),
+                "enqueued": self.enqueued,
+                "sent": self.sent,
+                "failed": self.failed,
+                "rejected": self.rejected,
+            }
+        if lat:
+            res["latency_p50"] = lat[len(lat) // 2]
+            res["latency_p95"] = lat[min(len(lat) - 1, int(len(lat) * 0.95))]
+            res["latency_max"] = lat[-1]
+        return res
+
+
+verification_queue = MailQueue()
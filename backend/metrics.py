@@ -0,0 +1,222 @@
+import os
+import time
+import bisect
+import threading
+from contextlib import nullcontext
+from functools import wraps
+
+BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    120.0,
+    300.0,
+)
+
+enabled = os.environ.get("METRICS", "1") != "0"
+_lock = threading.Lock()
+_counters: dict[tuple, float] = {}
+_histograms: dict[tuple, list] = {}
+_NULL = nullcontext()
+_INF = 'le="+Inf"'
+
+
+def _key(name: str, labels: dict) -> tuple:
+    return (name, tuple(sorted(labels.items())))
+
+
+def inc(name: str, value: float = 1, **labels):
+    if not enabled:
+        return
+    k = _key(name, labels)
+    with _lock:
+        _counters[k] = _counters.get(k, 0) + value
+
+
+def observe(name: str, value: float, **labels):
+    if not enabled:
+        return
+    k = _key(name, labels)
+    i = bisect.bisect_left(BUCKETS, value)
+    with _lock:
+        h = _histograms.get(k)
+        if h is None:
+            h = _histograms[k] = [[0] * (len(BUCKETS) + 1), 0, 0.0, 0.0]
+        h[0][i] += 1
+        h[1] += 1
+        h[2] += value
+        h[3] = max(h[3], value)
+
+
+class _Timer:
+    __slots__ = ("name", "labels", "t")
+
+    def __init__(self, name: str, labels: dict):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.t = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.name, time.perf_counter() - self.t, **self.labels)
+
+
+def timer(name: str, **labels):
+    return _Timer(name, labels) if enabled else _NULL
+
+
+def timed(name: str, **labels):
+    def wrap(fn):
+        if not enabled:
+            return fn
+
+        @wraps(fn)
+        def inner(*args, **kwargs):
+            t = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                observe(name, time.perf_counter() - t, **labels)
+
+        return inner
+
+    return wrap
+
+
+def _escape(v) -> str:
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(pairs, extra: str = "") -> str:
+    parts = [f'{k}="{_escape(v)}"' for k, v in pairs]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def render() -> str:
+    with _lock:
+        counters = sorted(_counters.items())
+        histograms = sorted((k, [list(h[0]), *h[1:]]) for k, h in _histograms.items())
+    lines = []
+    seen = set()
+    for (name, pairs), v in counters:
+        if name not in seen:
+            seen.add(name)
+            lines.append(f"# TYPE {name}_total counter")
+        lines.append(f"{name}_total{_labels(pairs)} {v:g}")
+    for (name, pairs), (buckets, count, total, _) in histograms:
+        if name not in seen:
+            seen.add(name)
+            lines.append(f"# TYPE {name} histogram")
+        acc = 0
+        for le, n in zip(BUCKETS, buckets):
+            acc += n
+            bound = f'le="{le:g}"'
+            lines.append(f"{name}_bucket{_labels(pairs, bound)} {acc}")
+        lines.append(f"{name}_bucket{_labels(pairs, _INF)} {count}")
+        lines.append(f"{name}_sum{_labels(pairs)} {total:.6f}")
+        lines.append(f"{name}_count{_labels(pairs)} {count}")
+    return "\n".join(lines) + "\n"
+
+
+def _label_str(name: str, pairs) -> str:
+    return name + _labels(pairs)
+
+
+def snapshot() -> dict:
+    with _lock:
+        return {
+            "counters": {_label_str(*k): v for k, v in _counters.items()},
+            "histograms": {
+                _label_str(*k): {
+                    "buckets": list(h[0]),
+                    "count": h[1],
+                    "sum": h[2],
+                    "max": h[3],
+                }
+                for k, h in _histograms.items()
+            },
+        }
+
+
+def _quantile(buckets: list[int], count: int, q: float, top: float) -> float:
+    target = q * count
+    acc = 0
+    for le, n in zip(BUCKETS + (top,), buckets):
+        acc += n
+        if acc >= target:
+            return min(le, top)
+    return top
+
+
+def report(before: dict | None = None) -> dict:
+    after = snapshot()
+    before = before or {"counters": {}, "histograms": {}}
+    counters = {
+        k: v - before["counters"].get(k, 0)
+        for k, v in sorted(after["counters"].items())
+        if v != before["counters"].get(k, 0)
+    }
+    timings = {}
+    for k, h in sorted(after["histograms"].items()):
+        b = before["histograms"].get(k)
+        count = h["count"] - (b["count"] if b else 0)
+        if not count:
+            continue
+        buckets = (
+            [x - y for x, y in zip(h["buckets"], b["buckets"])] if b else h["buckets"]
+        )
+        total = h["sum"] - (b["sum"] if b else 0.0)
+        timings[k] = {
+            "count": count,
+            "total": round(total, 6),
+            "avg": round(total / count, 6),
+            "p50": _quantile(buckets, count, 0.5, h["max"]),
+            "p95": _quantile(buckets, count, 0.95, h["max"]),
+            "max": (
+                round(h["max"], 6)
+                if not b
+                else _quantile(buckets, count, 1.0, h["max"])
+            ),
+        }
+    return {"counters": counters, "timings": timings}
+
+
+def merge(reports: list[dict]) -> dict:
+    counters: dict[str, float] = {}
+    timings: dict[str, dict] = {}
+    for r in reports:
+        for k, v in r.get("counters", {}).items():
+            counters[k] = counters.get(k, 0) + v
+        for k, t in r.get("timings", {}).items():
+            m = timings.get(k)
+            if m is None:
+                timings[k] = dict(t)
+                continue
+            m["count"] += t["count"]
+            m["total"] = round(m["total"] + t["total"], 6)
+            m["avg"] = round(m["total"] / m["count"], 6)
+            for q in ("p50", "p95", "max"):
+                m[q] = max(m[q], t[q])
+    return {"counters": counters, "timings": timings}
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
@@ -0,0 +1,191 @@
+import os
+import time
+import sqlite3
+import threading
+from . import metrics
+from .db import _conn, close, transaction
+
+_stop = threading.Event()
+_thread = None
+
+
+def _batch():
+    return max(1, int(os.environ.get("DB_MIGRATE_BATCH", "5000")))
+
+
+def _pause():
+    return float(os.environ.get("DB_MIGRATE_PAUSE", "0.01"))
+
+
+class Migration:
+    def __init__(self, version: int, name: str, apply, backfill=None, table="users"):
+        self.version = version
+        self.name = name
+        self.apply = apply
+        self.backfill = backfill
+        self.table = table
+
+
+def sql_backfill(assign: str, where: str, table: str = "users"):
+    def run(conn, lo, hi):
+        return conn.execute(
+            f"UPDATE {table} SET {assign} WHERE rowid > ? AND rowid <= ? AND ({where})",
+            (lo, hi),
+        ).rowcount
+
+    return run
+
+
+def _users(conn):
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS users (email TEXT PRIMARY KEY, frequency INTEGER NOT NULL, salutation INTEGER NOT NULL, birth_year INTEGER, birth_month INTEGER, birth_day INTEGER, name TEXT)"
+    )
+    cols = {row[1] for row in conn.execute("PRAGMA table_info(users)")}
+    for col, typ in [
+        ("birth_year", "INTEGER"),
+        ("birth_month", "INTEGER"),
+        ("birth_day", "INTEGER"),
+        ("name", "TEXT"),
+    ]:
+        if col not in cols:
+            conn.execute(f"ALTER TABLE users ADD COLUMN {col} {typ}")
+    conn.execute("CREATE INDEX IF NOT EXISTS users_frequency ON users (frequency)")
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS users_birthday ON users (birth_month, birth_day)"
+    )
+
+
+def _lunar_birthdays(conn):
+    conn.execute("ALTER TABLE users ADD COLUMN calendar INTEGER NOT NULL DEFAULT 0")
+    conn.execute("ALTER TABLE users ADD COLUMN solar_birthday TEXT")
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS users_solar_birthday ON users (solar_birthday) WHERE calendar=1"
+    )
+
+
+MIGRATIONS = [
+    Migration(1, "users", _users),
+    Migration(2, "lunar_birthdays", _lunar_birthdays),
+]
+
+
+def current(conn=None) -> tuple[int, bool]:
+    conn = conn or _conn()
+    try:
+        row = conn.execute(
+            "SELECT version, backfilled_at FROM schema_version ORDER BY version DESC LIMIT 1"
+        ).fetchone()
+    except sqlite3.OperationalError:
+        return 0, True
+    return (row[0], row[1] is not None) if row else (0, True)
+
+
+def head(migrations=None) -> int:
+    return max(m.version for m in migrations or MIGRATIONS)
+
+
+def _apply(m: Migration) -> bool:
+    with metrics.timer("db_migration_seconds", version=m.version, phase="apply"):
+        with transaction() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS schema_version (version INTEGER PRIMARY KEY, name TEXT NOT NULL, applied_at TEXT NOT NULL, backfilled_at TEXT)"
+            )
+            if current(conn)[0] >= m.version:
+                return False
+            m.apply(conn)
+            conn.execute(
+                "INSERT INTO schema_version (version, name, applied_at, backfilled_at) VALUES (?, ?, datetime('now'), CASE WHEN ? THEN NULL ELSE datetime('now') END)",
+                (m.version, m.name, m.backfill is not None),
+            )
+    metrics.inc("db_migrations", version=m.version, phase="apply")
+    return True
+
+
+def _backfill(m: Migration, batch: int, pause: float) -> bool:
+    conn = _conn()
+    row = conn.execute(
+        "SELECT backfilled_at FROM schema_version WHERE version=?", (m.version,)
+    ).fetchone()
+    if row is None or row[0] is not None:
+        return True
+    t = time.perf_counter()
+    lo = 0
+    while not _stop.is_set():
+        with transaction() as conn:
+            hi = conn.execute(
+                f"SELECT MAX(rowid) FROM (SELECT rowid FROM {m.table} WHERE rowid > ? ORDER BY rowid LIMIT ?)",
+                (lo, batch),
+            ).fetchone()[0]
+            if hi is None:
+                conn.execute(
+                    "UPDATE schema_version SET backfilled_at=datetime('now') WHERE version=?",
+                    (m.version,),
+                )
+                break
+            n = m.backfill(conn, lo, hi) or 0
+        metrics.inc("db_backfill_rows", n, version=m.version)
+        lo = hi
+        if pause:
+            time.sleep(pause)
+    else:
+        metrics.inc("db_migrations", version=m.version, phase="backfill_stopped")
+        return False
+    metrics.observe(
+        "db_migration_seconds",
+        time.perf_counter() - t,
+        version=m.version,
+        phase="backfill",
+    )
+    metrics.inc("db_migrations", version=m.version, phase="backfill")
+    return True
+
+
+def migrate(
+    migrations=None,
+    batch: int | None = None,
+    pause: float | None = None,
+    background: bool = False,
+) -> int:
+    global _thread
+    migrations = sorted(migrations or MIGRATIONS, key=lambda m: m.version)
+    version, done = current()
+    if version >= migrations[-1].version and done:
+        return version
+    batch = batch or _batch()
+    pause = _pause() if pause is None else pause
+    for m in migrations:
+        if m.version < version:
+            continue
+        if m.version > version:
+            _apply(m)
+        if m.backfill is not None:
+            if background:
+                _stop.clear()
+                _thread = threading.Thread(
+                    target=_run, args=(migrations, batch, pause), daemon=True
+                )
+                _thread.start()
+                return m.version
+            if not _backfill(m, batch, pause):
+                return m.version
+        version = m.version
+    return version
+
+
+def _run(migrations, batch: int, pause: float):
+    try:
+        migrate(migrations, batch, pause)
+    except Exception as e:
+        print(f"Background migration failed: {e!r}")
+    finally:
+        close()
+
+
+def stop(timeout: float = 10):
+    _stop.set()
+    if _thread is not None:
+        _thread.join(timeout)
+
+
+if __name__ == "__main__":
+    print(f"schema version {migrate()} (head {head()})")
@@ -0,0 +1,150 @@
+import os
+import time
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from . import metrics
+from .db import connect
+
+_RULES = {
+    "send": [
+        ("ip", "RATE_LIMIT_SEND_IP", "5/60"),
+        ("email", "RATE_LIMIT_SEND_EMAIL", "3/600"),
+    ],
+    "code": [("ip", "RATE_LIMIT_IP", "30/60"), ("email", "RATE_LIMIT_EMAIL", "10/600")],
+}
+
+
+def _enabled():
+    return os.environ.get("RATE_LIMIT", "1") not in {"0", "off", "false"}
+
+
+def _parse(spec: str) -> tuple[float, float]:
+    n, per = spec.split("/")
+    return float(n) / float(per), float(n)
+
+
+def rules() -> dict[str, list[tuple[str, float, float]]]:
+    return {
+        group: [(kind, *_parse(os.environ.get(var, spec))) for kind, var, spec in items]
+        for group, items in _RULES.items()
+    }
+
+
+class Limiter(ABC):
+    @abstractmethod
+    def hit(self, key: str, rate: float, capacity: float, cost: float = 1) -> float: ...
+
+    @abstractmethod
+    def __len__(self): ...
+
+
+class MemoryLimiter(Limiter):
+    def __init__(self, max_keys: int | None = None, clock=time.monotonic):
+        self.max_keys = max_keys or int(os.environ.get("RATE_LIMIT_MAX_KEYS", "100000"))
+        self._clock = clock
+        self._buckets: OrderedDict[str, list] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key: str, rate: float, capacity: float, cost: float = 1) -> float:
+        now = self._clock()
+        with self._lock:
+            b = self._buckets.get(key)
+            if b is None:
+                b = self._buckets[key] = [capacity, now]
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                b[0] = min(capacity, b[0] + (now - b[1]) * rate)
+                b[1] = now
+            if b[0] >= cost:
+                b[0] -= cost
+                return 0.0
+            return (cost - b[0]) / rate
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class SqliteLimiter(Limiter):
+    def __init__(self, path: str | None = None, sweep_every: int = 10000):
+        self.path = path or os.environ.get(
+            "RATE_LIMIT_DB_PATH", os.path.join(os.getcwd(), "data", "ratelimit.db")
+        )
+        self.sweep_every = sweep_every
+        self._hits = 0
+        self._idle = 0.0
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, stamp REAL NOT NULL) WITHOUT ROWID"
+        )
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = connect(self.path)
+        return conn
+
+    def hit(self, key: str, rate: float, capacity: float, cost: float = 1) -> float:
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            cur = conn.execute(
+                "INSERT INTO buckets (key, tokens, stamp) VALUES (?1, ?3 - ?4, ?5) ON CONFLICT (key) DO UPDATE "
+                "SET tokens=MIN(?3, tokens + (?5 - stamp) * ?2) - ?4, stamp=?5 WHERE MIN(?3, tokens + (?5 - stamp) * ?2) >= ?4",
+                (key, rate, capacity, cost, now),
+            )
+            row = None
+            if cur.rowcount == 0:
+                row = conn.execute(
+                    "SELECT MIN(?2, tokens + (?3 - stamp) * ?1) FROM buckets WHERE key=?4",
+                    (rate, capacity, now, key),
+                ).fetchone()
+        self._hits += 1
+        self._idle = max(self._idle, capacity / rate)
+        if self._hits % self.sweep_every == 0:
+            self.evict()
+        return (cost - row[0]) / rate if row else 0.0
+
+    def evict(self) -> int:
+        conn = self._conn()
+        with conn:
+            return conn.execute(
+                "DELETE FROM buckets WHERE stamp<?", (time.time() - self._idle,)
+            ).rowcount
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM buckets").fetchone()[0]
+
+
+_limiter: Limiter | None = None
+_rules = None
+_lock = threading.Lock()
+
+
+def get_limiter() -> Limiter:
+    global _limiter, _rules
+    if _limiter is None:
+        with _lock:
+            if _limiter is None:
+                _rules = rules()
+                kind = os.environ.get("RATE_LIMIT_STORE", "memory")
+                _limiter = SqliteLimiter() if kind == "sqlite" else MemoryLimiter()
+    return _limiter
+
+
+def limit(group: str, ip: str, email: str | None = None) -> float:
+    if not _enabled():
+        return 0.0
+    limiter = get_limiter()
+    for kind, rate, capacity in _rules[group]:
+        value = ip if kind == "ip" else email
+        if value is None:
+            continue
+        wait = limiter.hit(f"{group}:{kind}:{value}", rate, capacity)
+        if wait:
+            metrics.inc("rate_limited", group=group, kind=kind)
+            return wait
+    return 0.0
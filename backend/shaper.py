@@ -0,0 +1,178 @@
+import os
+import time
+import datetime
+import threading
+from . import metrics
+from .db import connect
+
+_WINDOWS = [
+    (60, "SMTP_PER_MINUTE"),
+    (3600, "SMTP_PER_HOUR"),
+    (86400, "SMTP_PER_DAY"),
+]
+
+
+def send_window():
+    return float(os.environ.get("SMTP_SEND_WINDOW", "12600"))
+
+
+def _reserve():
+    return float(os.environ.get("SMTP_PRIORITY_RESERVE", "0.1"))
+
+
+def _backlog_days():
+    return int(os.environ.get("SMTP_BACKLOG_DAYS", "3"))
+
+
+class Shaper:
+    def __init__(
+        self,
+        path: str | None = None,
+        limits: dict[int, int] | None = None,
+        reserve: float | None = None,
+        clock=time.time,
+        sleep=time.sleep,
+    ):
+        self.path = path or os.environ.get(
+            "SMTP_SHAPER_DB_PATH", os.path.join(os.getcwd(), "data", "shaper.db")
+        )
+        if limits is None:
+            limits = {s: int(os.environ.get(var, "0")) for s, var in _WINDOWS}
+        self.limits = sorted((s, n) for s, n in limits.items() if n > 0)
+        self.reserve = _reserve() if reserve is None else reserve
+        self.clock = clock
+        self.sleep = sleep
+        self._local = threading.local()
+        self._ready = False
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = self._local.conn = connect(self.path)
+            if not self._ready:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS sends (at REAL NOT NULL, n INTEGER NOT NULL, kind TEXT NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS sends_at ON sends (at)")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS backlog (date TEXT PRIMARY KEY, added REAL NOT NULL)"
+                )
+                self._ready = True
+        return conn
+
+    def _cap(self, cap: int, priority: bool) -> int:
+        return cap if priority else max(1, int(cap * (1 - self.reserve)))
+
+    def max_batch(self, size: int, priority: bool = False) -> int:
+        return min([size] + [self._cap(cap, priority) for _, cap in self.limits])
+
+    def try_acquire(self, n: int, kind: str = "bulk", priority: bool = False) -> float:
+        if not self.limits:
+            return 0.0
+        if n > self.max_batch(n, priority):
+            raise ValueError(f"batch of {n} exceeds the {kind} send budget")
+        now = self.clock()
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            wait = 0.0
+            for seconds, cap in self.limits:
+                cap = self._cap(cap, priority)
+                rows = conn.execute(
+                    "SELECT at, n FROM sends WHERE at > ? ORDER BY at",
+                    (now - seconds,),
+                ).fetchall()
+                used = sum(r[1] for r in rows)
+                if used + n <= cap:
+                    continue
+                for at, k in rows:
+                    used -= k
+                    if used + n <= cap:
+                        wait = max(wait, at + seconds - now)
+                        break
+            if wait > 0:
+                return wait
+            conn.execute(
+                "INSERT INTO sends (at, n, kind) VALUES (?, ?, ?)", (now, n, kind)
+            )
+            conn.execute("DELETE FROM sends WHERE at <= ?", (now - self.limits[-1][0],))
+        return 0.0
+
+    def acquire(
+        self,
+        n: int,
+        kind: str = "bulk",
+        priority: bool = False,
+        deadline: float | None = None,
+    ) -> bool:
+        waited = 0.0
+        while True:
+            wait = self.try_acquire(n, kind, priority)
+            if wait <= 0:
+                metrics.inc("mail_shaper", n, kind=kind, result="sent")
+                if waited:
+                    metrics.observe("mail_shaper_wait_seconds", waited, kind=kind)
+                return True
+            if deadline is not None and self.clock() + wait > deadline:
+                metrics.inc("mail_shaper", n, kind=kind, result="deferred")
+                return False
+            self.sleep(wait)
+            waited += wait
+
+    def usage(self) -> dict[int, int]:
+        now = self.clock()
+        conn = self._conn()
+        return {
+            s: conn.execute(
+                "SELECT COALESCE(SUM(n), 0) FROM sends WHERE at > ?", (now - s,)
+            ).fetchone()[0]
+            for s, _ in self.limits
+        }
+
+    def defer(self, date: str):
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO backlog (date, added) VALUES (?, ?)",
+                (date, self.clock()),
+            )
+
+    def done(self, date: str):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM backlog WHERE date=?", (date,))
+
+    def backlog(self, today: str | None = None) -> list[str]:
+        dates = [
+            r[0] for r in self._conn().execute("SELECT date FROM backlog ORDER BY date")
+        ]
+        if today is None:
+            return dates
+        keep = []
+        for d in dates:
+            if d == today:
+                continue
+            if _age(d, today) > _backlog_days():
+                print(
+                    f"Dropping deferred mail for {d}: older than {_backlog_days()} days"
+                )
+                self.done(d)
+                continue
+            keep.append(d)
+        return keep
+
+
+def _age(date: str, today: str) -> int:
+    return (datetime.date.fromisoformat(today) - datetime.date.fromisoformat(date)).days
+
+
+_shaper = None
+_shaper_lock = threading.Lock()
+
+
+def get_shaper() -> Shaper:
+    global _shaper
+    if _shaper is None:
+        with _shaper_lock:
+            if _shaper is None:
+                _shaper = Shaper()
+    return _shaper
@@ -0,0 +1,143 @@
+import os
+import time
+import queue
+import threading
+from contextlib import contextmanager
+from . import metrics
+
+
+def _broken(e: BaseException) -> bool:
+    import smtplib
+
+    if isinstance(e, smtplib.SMTPServerDisconnected):
+        return True
+    return isinstance(e, OSError) and not isinstance(e, smtplib.SMTPException)
+
+
+def _transient(e: BaseException) -> bool:
+    import smtplib
+
+    if isinstance(e, smtplib.SMTPResponseException):
+        return 400 <= e.smtp_code < 500
+    return _broken(e)
+
+
+def _pool_size():
+    return max(1, int(os.environ.get("SMTP_POOL_SIZE", "4")))
+
+
+def _retries():
+    return max(0, int(os.environ.get("SMTP_RETRIES", "3")))
+
+
+class SMTPPool:
+    def __init__(
+        self,
+        size: int | None = None,
+        host: str | None = None,
+        port: int | None = None,
+        user: str | None = None,
+        password: str | None = None,
+        ssl: bool | None = None,
+        timeout: float = 60,
+    ):
+        self.size = size or _pool_size()
+        self.host = host if host is not None else os.environ.get("SMTP_SERVER", "")
+        self.port = port or int(os.environ.get("SMTP_PORT", 465))
+        self.user = user if user is not None else os.environ.get("SMTP_EMAIL", "")
+        self.password = (
+            password if password is not None else os.environ.get("SMTP_KEY", "")
+        )
+        self.ssl = ssl if ssl is not None else os.environ.get("SMTP_SSL", "1") != "0"
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(self.size)
+
+    def _connect(self):
+        import smtplib
+
+        cls = smtplib.SMTP_SSL if self.ssl else smtplib.SMTP
+        with metrics.timer("smtp_connect_seconds"):
+            server = cls(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.user and self.password:
+                with metrics.timer("smtp_login_seconds"):
+                    server.login(self.user, self.password)
+        except Exception:
+            _close(server)
+            raise
+        return server
+
+    def acquire(self):
+        self._slots.acquire()
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            return self._connect()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, server, broken: bool = False):
+        if broken:
+            _close(server)
+        else:
+            self._idle.put(server)
+        self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        server = self.acquire()
+        try:
+            yield server
+        except Exception as e:
+            self.release(server, broken=_broken(e))
+            raise
+        else:
+            self.release(server)
+
+    def close(self):
+        while True:
+            try:
+                server = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                server.quit()
+            except Exception:
+                _close(server)
+
+
+def _close(server):
+    try:
+        server.close()
+    except Exception:
+        pass
+
+
+def send_batch(
+    pool: SMTPPool, sender: str, batch: list[str], payload, retries: int | None = None
+):
+    import smtplib
+
+    retries = _retries() if retries is None else retries
+    attempt = 0
+    while True:
+        t = time.perf_counter()
+        try:
+            with pool.connection() as server:
+                refused = server.sendmail(sender, batch, payload)
+            metrics.observe("smtp_send_seconds", time.perf_counter() - t)
+            metrics.inc("smtp_recipients", len(batch) - len(refused), result="sent")
+            return refused
+        except smtplib.SMTPRecipientsRefused as e:
+            metrics.inc("smtp_recipients", len(e.recipients), result="refused")
+            return e.recipients
+        except (smtplib.SMTPException, OSError) as e:
+            metrics.inc("smtp_send_errors")
+            if attempt >= retries or not _transient(e):
+                raise
+            time.sleep(min(30, 0.5 * 2**attempt))
+            attempt += 1
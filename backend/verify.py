@@ -1,24 +1,233 @@
+import os
 import time
 import secrets
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from . import metrics
+from .db import connect
 
-_store: dict[tuple[str, str], dict[str, float | str]] = {}
 _ttl_seconds = 600
 
 
-def generate_code(email: str, action: str) -> str:
-    code = "".join(secrets.choice("0123456789") for _ in range(6))
-    _store[(email, action)] = {"code": code, "expire": time.time() + _ttl_seconds}
-    return code
+def _max_attempts():
+    return int(os.environ.get("VERIFY_MAX_ATTEMPTS", "5"))
 
 
-def verify_code(email: str, action: str, code: str) -> bool:
-    item = _store.get((email, action))
-    if not item:
-        return False
-    if time.time() > float(item["expire"]):
-        _store.pop((email, action), None)
+def _resend_seconds():
+    return float(os.environ.get("VERIFY_RESEND_SECONDS", "60"))
+
+
+def _new_code():
+    return "".join(secrets.choice("0123456789") for _ in range(6))
+
+
+class CodeStore(ABC):
+    @abstractmethod
+    def issue(self, email: str, action: str) -> str | None: ...
+
+    @abstractmethod
+    def check(self, email: str, action: str, code: str) -> bool: ...
+
+    @abstractmethod
+    def evict(self) -> int: ...
+
+    @abstractmethod
+    def __len__(self): ...
+
+
+class MemoryCodeStore(CodeStore):
+    def __init__(
+        self,
+        ttl: float = _ttl_seconds,
+        max_size: int | None = None,
+        max_attempts: int | None = None,
+        resend: float | None = None,
+        sweep_interval: float = 30,
+    ):
+        self.ttl = ttl
+        self.max_size = max_size or int(os.environ.get("VERIFY_MAX_CODES", "100000"))
+        self.max_attempts = max_attempts or _max_attempts()
+        self.resend = _resend_seconds() if resend is None else resend
+        self.sweep_interval = sweep_interval
+        self._codes: OrderedDict[tuple[str, str], list] = OrderedDict()
+        self._sends: OrderedDict[str, float] = OrderedDict()
+        self._lock = threading.Lock()
+        self._sweeper = None
+
+    def _start_sweeper(self):
+        if self._sweeper is None and self.sweep_interval:
+            self._sweeper = threading.Thread(target=self._sweep_forever, daemon=True)
+            self._sweeper.start()
+
+    def _sweep_forever(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            self.evict()
+
+    def issue(self, email: str, action: str) -> str | None:
+        now = time.time()
+        with self._lock:
+            last = self._sends.get(email)
+            if last is not None and now - last < self.resend:
+                return None
+            self._sends[email] = now
+            self._sends.move_to_end(email)
+            code = _new_code()
+            self._codes[(email, action)] = [code, now + self.ttl, 0]
+            self._codes.move_to_end((email, action))
+            while len(self._codes) > self.max_size:
+                self._codes.popitem(last=False)
+            while len(self._sends) > self.max_size:
+                self._sends.popitem(last=False)
+        self._start_sweeper()
+        return code
+
+    def check(self, email: str, action: str, code: str) -> bool:
+        with self._lock:
+            item = self._codes.get((email, action))
+            if not item:
+                return False
+            if time.time() > item[1]:
+                self._codes.pop((email, action), None)
+                return False
+            if item[0] == str(code):
+                self._codes.pop((email, action), None)
+                return True
+            item[2] += 1
+            if item[2] >= self.max_attempts:
+                self._codes.pop((email, action), None)
+            return False
+
+    def evict(self) -> int:
+        now = time.time()
+        n = 0
+        with self._lock:
+            while self._codes:
+                key, item = next(iter(self._codes.items()))
+                if item[1] > now:
+                    break
+                self._codes.popitem(last=False)
+                n += 1
+            while self._sends:
+                email, at = next(iter(self._sends.items()))
+                if now - at < self.resend:
+                    break
+                self._sends.popitem(last=False)
+        return n
+
+    def __len__(self):
+        return len(self._codes)
+
+
+class SqliteCodeStore(CodeStore):
+    def __init__(
+        self,
+        path: str | None = None,
+        ttl: float = _ttl_seconds,
+        max_attempts: int | None = None,
+        resend: float | None = None,
+        sweep_every: int = 1000,
+    ):
+        self.path = path or os.environ.get(
+            "VERIFY_DB_PATH", os.path.join(os.getcwd(), "data", "verify.db")
+        )
+        self.ttl = ttl
+        self.max_attempts = max_attempts or _max_attempts()
+        self.resend = _resend_seconds() if resend is None else resend
+        self.sweep_every = sweep_every
+        self._issued = 0
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS codes (email TEXT NOT NULL, action TEXT NOT NULL, code TEXT NOT NULL, expire REAL NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, PRIMARY KEY (email, action))"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS codes_expire ON codes (expire)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS sends (email TEXT PRIMARY KEY, at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS sends_at ON sends (at)")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = connect(self.path)
+        return conn
+
+    def issue(self, email: str, action: str) -> str | None:
+        now = time.time()
+        conn = self._conn()
+        code = _new_code()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            cur = conn.execute(
+                "INSERT INTO sends (email, at) VALUES (?, ?) ON CONFLICT (email) DO UPDATE SET at=excluded.at WHERE sends.at <= ?",
+                (email, now, now - self.resend),
+            )
+            if cur.rowcount == 0:
+                return None
+            conn.execute(
+                "INSERT OR REPLACE INTO codes (email, action, code, expire, attempts) VALUES (?, ?, ?, ?, 0)",
+                (email, action, code, now + self.ttl),
+            )
+        self._issued += 1
+        if self._issued % self.sweep_every == 0:
+            self.evict()
+        return code
+
+    def check(self, email: str, action: str, code: str) -> bool:
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            cur = conn.execute(
+                "DELETE FROM codes WHERE email=? AND action=? AND code=? AND expire>=?",
+                (email, action, str(code), now),
+            )
+            if cur.rowcount:
+                return True
+            conn.execute(
+                "UPDATE codes SET attempts=attempts+1 WHERE email=? AND action=?",
+                (email, action),
+            )
+            conn.execute(
+                "DELETE FROM codes WHERE email=? AND action=? AND (attempts>=? OR expire<?)",
+                (email, action, self.max_attempts, now),
+            )
         return False
-    ok = str(item["code"]) == str(code)
-    if ok:
-        _store.pop((email, action), None)
-    return ok
+
+    def evict(self) -> int:
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            n = conn.execute("DELETE FROM codes WHERE expire<?", (now,)).rowcount
+            conn.execute("DELETE FROM sends WHERE at<?", (now - self.resend,))
+        return n
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM codes").fetchone()[0]
+
+
+_store: CodeStore | None = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> CodeStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                kind = os.environ.get("VERIFY_STORE", "memory")
+                _store = SqliteCodeStore() if kind == "sqlite" else MemoryCodeStore()
+    return _store
+
+
+@metrics.timed("verify_store_seconds", op="issue")
+def generate_code(email: str, action: str) -> str | None:
+    return get_store().issue(email, action)
+
+
+@metrics.timed("verify_store_seconds", op="check")
+def verify_code(email: str, action: str, code: str) -> bool:
+    return get_store().check(email, action, code)
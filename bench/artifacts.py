@@ -0,0 +1,143 @@
+import os
+import json
+import time
+import random
+import argparse
+import datetime
+import tempfile
+
+
+def _images(rnd: random.Random, items: int, size: int, dup: float):
+    out = []
+    for _ in range(items):
+        if out and rnd.random() < dup:
+            out.append(rnd.choice(out))
+        else:
+            out.append(rnd.randbytes(size))
+    return out
+
+
+def loose(root: str, days: list[str], rnd, args):
+    os.makedirs(root)
+    for d in days:
+        items = []
+        for i, data in enumerate(_images(rnd, args.items, args.size, args.dup)):
+            path = os.path.join(root, f"birthday_{i}_{d}.png")
+            with open(path, "wb") as f:
+                f.write(data)
+            items.append({"key": f"k{i}", "image_path": path, "text": "x" * 800})
+        with open(os.path.join(root, f"{d}.json"), "w", encoding="utf-8") as f:
+            json.dump({"date": d, "items": items}, f, ensure_ascii=False, indent=2)
+
+
+def packed(root: str, days: list[str], rnd, args):
+    from mailer.artifacts import ArtifactStore
+
+    store = ArtifactStore(root)
+    for d in days:
+        items = []
+        for i, data in enumerate(_images(rnd, args.items, args.size, args.dup)):
+            digest = store.put(d, f"image/k{i}", data, "image/png")
+            items.append({"key": f"k{i}", "image_digest": digest, "text": "x" * 800})
+        store.put_json(d, "manifest", {"date": d, "items": items})
+    return store
+
+
+def _du(root: str):
+    files = total = 0
+    for dirpath, _, names in os.walk(root):
+        for n in names:
+            files += 1
+            total += os.path.getsize(os.path.join(dirpath, n))
+    return files, total
+
+
+def _scan(root: str) -> float:
+    t = time.perf_counter()
+    for dirpath, _, names in os.walk(root):
+        for n in names:
+            os.stat(os.path.join(dirpath, n))
+    return time.perf_counter() - t
+
+
+def read_loose(root: str, d: str) -> int:
+    with open(os.path.join(root, f"{d}.json"), "r", encoding="utf-8") as f:
+        cache = json.load(f)
+    n = 0
+    for item in cache["items"]:
+        with open(item["image_path"], "rb") as f:
+            n += len(f.read())
+    return n
+
+
+def read_packed(store, d: str) -> int:
+    cache = store.get_json(d, "manifest")
+    return sum(len(store.get(d, item["image_digest"])) for item in cache["items"])
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--days", type=int, default=120)
+    ap.add_argument("--items", type=int, default=40)
+    ap.add_argument("--size", type=int, default=64 * 1024)
+    ap.add_argument("--dup", type=float, default=0.3)
+    ap.add_argument("--retention", type=int, default=60)
+    args = ap.parse_args()
+    tmp = tempfile.mkdtemp()
+    start = datetime.date(2024, 1, 1)
+    days = [str(start + datetime.timedelta(days=i)) for i in range(args.days)]
+    t = time.perf_counter()
+    loose(os.path.join(tmp, "loose"), days, random.Random(0), args)
+    w_loose = time.perf_counter() - t
+    t = time.perf_counter()
+    store = packed(os.path.join(tmp, "store"), days, random.Random(0), args)
+    w_packed = time.perf_counter() - t
+    print(
+        f"{args.days} days x {args.items} images of {args.size // 1024} KiB, {args.dup:.0%} repeats"
+    )
+    for label, root, w in [
+        ("loose files", os.path.join(tmp, "loose"), w_loose),
+        ("monthly packs", os.path.join(tmp, "store"), w_packed),
+    ]:
+        files, total = _du(root)
+        print(
+            f"{label:14} files={files:6d}  bytes={total / 2**20:8.1f} MiB  write {w:6.2f} s  scan {_scan(root) * 1000:7.1f} ms"
+        )
+    for label, fn, arg in [
+        ("loose read", read_loose, os.path.join(tmp, "loose")),
+        ("mmap read", read_packed, store),
+    ]:
+        t = time.perf_counter()
+        n = sum(fn(arg, d) for d in days)
+        elapsed = time.perf_counter() - t
+        print(f"{label:14} {n / elapsed / 2**20:8.0f} MiB/s")
+    rnd = random.Random(1)
+    for d in days[-20:]:
+        items = [
+            {
+                "key": f"k{i}",
+                "image_digest": store.put(
+                    d, f"image/k{i}", rnd.randbytes(args.size), "image/png"
+                ),
+            }
+            for i in range(args.items)
+        ]
+        store.put_json(d, "manifest", {"date": d, "items": items})
+    from mailer import artifacts
+
+    artifacts._store = store
+    os.environ["ARTIFACT_RETENTION_DAYS"] = str(args.retention)
+    before = _du(store.root)[1]
+    t = time.perf_counter()
+    report = artifacts.gc(
+        datetime.date.fromisoformat(days[-1]), os.path.join(tmp, "none")
+    )
+    print(
+        f"gc (retention {args.retention} days): {time.perf_counter() - t:.2f} s, pruned {report['packs']}, "
+        f"compacted {sorted(report['compacted'])}; {before / 2**20:.1f} -> {_du(store.root)[1] / 2**20:.1f} MiB"
+    )
+    assert read_packed(store, days[-1]) == args.items * args.size
+
+
+if __name__ == "__main__":
+    main()
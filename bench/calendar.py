@@ -0,0 +1,78 @@
+import os
+import time
+import argparse
+import datetime
+import tempfile
+from lunar_python import Solar
+
+
+def legacy_upcoming(today, days: int, csv_path: str):
+    res = []
+    for i in range(days):
+        d = today + datetime.timedelta(days=i)
+        lunar = Solar.fromYmd(d.year, d.month, d.day).getLunar()
+        names = []
+        jq = lunar.getJieQi()
+        if jq:
+            names.append(jq)
+        names += lunar.getFestivals()
+        if names:
+            res.append({"date": d.strftime("%Y-%m-%d"), "name": names[0]})
+    if res:
+        return res
+    out = []
+    with open(csv_path, "r", encoding="utf-8") as f:
+        for line in f:
+            parts = line.strip().split(",")
+            if len(parts) >= 2:
+                out.append({"date": parts[0], "name": parts[1]})
+    upcoming = set(
+        (today + datetime.timedelta(days=i)).strftime("%m-%d")
+        for i in range(1, days + 1)
+    )
+    return [x for x in out if x["date"] in upcoming]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--year", type=int, default=datetime.date.today().year)
+    ap.add_argument("--days", type=int, default=7)
+    args = ap.parse_args()
+    root = os.getcwd()
+    os.environ["CALENDAR_INDEX_DIR"] = tempfile.mkdtemp()
+    os.environ["CALENDAR_API_URL"] = ""
+    import mailer.mailer as m
+    from mailer import calendar_index
+
+    dates = []
+    d = datetime.datetime(args.year, 1, 1)
+    while d.year == args.year:
+        dates.append(d)
+        d += datetime.timedelta(days=1)
+    csv_path = os.path.join(root, "data", "festivals.csv")
+
+    t = time.perf_counter()
+    for d in dates:
+        legacy_upcoming(d, args.days, csv_path)
+    old = time.perf_counter() - t
+
+    t = time.perf_counter()
+    calendar_index.year_table(args.year)
+    calendar_index.year_table(args.year + 1)
+    build = time.perf_counter() - t
+
+    t = time.perf_counter()
+    for d in dates:
+        m._today = lambda d=d: d
+        m.get_upcoming_events(args.days)
+        m.get_today_holiday()
+    new = time.perf_counter() - t
+
+    print(f"dates:                 {len(dates)}")
+    print(f"legacy upcoming:       {old / len(dates) * 1e6:10.1f} us/date")
+    print(f"index build (2 years): {build * 1000:10.1f} ms (once, persisted)")
+    print(f"index today+upcoming:  {new / len(dates) * 1e6:10.1f} us/date")
+
+
+if __name__ == "__main__":
+    main()
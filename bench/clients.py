@@ -0,0 +1,40 @@
+import os
+import time
+import argparse
+import requests
+from mailer import clients
+from .fake_model import FakeModelServer
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests", type=int, default=300)
+    ap.add_argument("--fail-first", type=int, default=2)
+    args = ap.parse_args()
+    os.environ.setdefault("HTTP_BACKOFF", "0.05")
+    with FakeModelServer(0, 0, image=os.urandom(256 * 1024)) as fake:
+        url = f"{fake.url}/files/x.png"
+        t = time.perf_counter()
+        for _ in range(args.requests):
+            requests.get(url, timeout=60).content
+        fresh = time.perf_counter() - t
+        t = time.perf_counter()
+        for _ in range(args.requests):
+            clients.request("download", "GET", url).content
+        pooled = time.perf_counter() - t
+        fake.fail_first = fake.failed + args.fail_first
+        os.environ["MODEL_URL"] = fake.url + "/v1"
+        os.environ["MODEL_KEY"] = "bench"
+        clients.endpoint("chat").call(
+            clients.openai_client().chat.completions.create,
+            model="bench",
+            messages=[{"role": "user", "content": "hi"}],
+        )
+    print(f"fresh requests.get: {fresh / args.requests * 1000:8.2f} ms/request")
+    print(f"shared session:     {pooled / args.requests * 1000:8.2f} ms/request")
+    for name, m in clients.metrics().items():
+        print(f"{name:9} {m}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import os
+import time
+import sqlite3
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+_SCHEMA = "CREATE TABLE IF NOT EXISTS users (email TEXT PRIMARY KEY, frequency INTEGER NOT NULL, salutation INTEGER NOT NULL, birth_year INTEGER, birth_month INTEGER, birth_day INTEGER)"
+
+
+def legacy(path: str, threads: int, ops: int):
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute(_SCHEMA)
+    conn.commit()
+    errors = [0]
+
+    def work(t):
+        for i in range(ops):
+            email = f"user{t}_{i}@example.com"
+            try:
+                if not conn.execute(
+                    "SELECT email FROM users WHERE email=?", (email,)
+                ).fetchone():
+                    conn.execute(
+                        "INSERT INTO users (email, frequency, salutation) VALUES (?, ?, ?)",
+                        (email, 0, 1),
+                    )
+                    conn.commit()
+                conn.execute("UPDATE users SET frequency=? WHERE email=?", (1, email))
+                conn.commit()
+            except (sqlite3.Error, SystemError):
+                errors[0] += 1
+
+    t = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as ex:
+        list(ex.map(work, range(threads)))
+    return time.perf_counter() - t, errors[0]
+
+
+def layered(threads: int, ops: int):
+    from backend import db
+
+    db.init_db()
+    errors = [0]
+
+    def work(t):
+        for i in range(ops):
+            email = f"user{t}_{i}@example.com"
+            try:
+                db.add_user(email, "monthly", "姐姐", None)
+                with db.transaction():
+                    u = db.get_user(email)
+                    db.update_user(email, "weekly", u["salutation"], u["birthday"])
+            except sqlite3.Error:
+                errors[0] += 1
+
+    t = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as ex:
+        list(ex.map(work, range(threads)))
+    return time.perf_counter() - t, errors[0]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--threads", type=int, default=16)
+    ap.add_argument("--ops", type=int, default=500)
+    args = ap.parse_args()
+    tmp = tempfile.mkdtemp()
+    os.environ["DB_PATH"] = os.path.join(tmp, "layered.db")
+    n = args.threads * args.ops
+    old, old_err = legacy(os.path.join(tmp, "legacy.db"), args.threads, args.ops)
+    new, new_err = layered(args.threads, args.ops)
+    print(f"{args.threads} writer threads, {n} subscribe+update pairs")
+    print(
+        f"shared connection, rollback journal: {n / old:10.0f} ops/s  errors={old_err}"
+    )
+    print(
+        f"per-thread connections, WAL:         {n / new:10.0f} ops/s  errors={new_err}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import os
+import time
+import smtplib
+import argparse
+from mailer.delivery import SMTPPool, deliver
+from .smtp_sink import SMTPSink
+
+
+def _payload(size: int):
+    body = ("x" * 76 + "\r\n") * max(1, size // 78)
+    return f"From: bench@example.com\r\nSubject: bench\r\n\r\n{body}"
+
+
+def run_single(sink, recipients, payload):
+    t = time.perf_counter()
+    server = smtplib.SMTP(sink.host, sink.port)
+    server.login("bench@example.com", "x")
+    server.sendmail("bench@example.com", recipients, payload)
+    server.quit()
+    return time.perf_counter() - t
+
+
+def run_pooled(sink, recipients, payload, pool_size, batch_size):
+    pool = SMTPPool(
+        size=pool_size,
+        host=sink.host,
+        port=sink.port,
+        user="bench@example.com",
+        password="x",
+        ssl=False,
+    )
+    t = time.perf_counter()
+    report = deliver(
+        pool, "bench@example.com", recipients, lambda b: payload, batch_size
+    )
+    elapsed = time.perf_counter() - t
+    pool.close()
+    assert report["sent"] == len(recipients), report["failed"][:1]
+    return elapsed
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--recipients", type=int, default=20000)
+    ap.add_argument("--batch-size", type=int, default=50)
+    ap.add_argument(
+        "--pool-size", type=int, default=int(os.environ.get("SMTP_POOL_SIZE", "4"))
+    )
+    ap.add_argument("--message-kb", type=int, default=64)
+    ap.add_argument("--latency", type=float, default=0.005)
+    args = ap.parse_args()
+    recipients = [f"user{i}@example.com" for i in range(args.recipients)]
+    payload = _payload(args.message_kb * 1024)
+    with SMTPSink(latency=args.latency) as sink:
+        single = run_single(sink, recipients, payload)
+        n = len(recipients) // args.batch_size
+        pooled = run_pooled(sink, recipients, payload, 1, args.batch_size)
+        concurrent = run_pooled(
+            sink, recipients, payload, args.pool_size, args.batch_size
+        )
+        print(
+            f"single BCC:        {len(recipients) / single:10.1f} recipients/s (1 message)"
+        )
+        print(
+            f"pool=1 batched:    {n / pooled:10.1f} messages/s  {len(recipients) / pooled:10.1f} recipients/s"
+        )
+        print(
+            f"pool={args.pool_size} batched:    {n / concurrent:10.1f} messages/s  {len(recipients) / concurrent:10.1f} recipients/s"
+        )
+        print(f"sink connections={sink.connections} logins={sink.logins}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+import json
+import time
+import threading
+from urllib.parse import parse_qs, urlparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        fake = self.server.fake
+        q = parse_qs(urlparse(self.path).query)
+        date = (q.get("date") or [""])[0]
+        with fake.lock:
+            fake.calls += 1
+        time.sleep(fake.latency)
+        if (q.get("key") or [""])[0] != fake.key:
+            status, body = 401, {"error": "bad key"}
+        else:
+            name = fake.holidays.get(date)
+            status, body = 200, {"holiday": [{"name": name}] if name else []}
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class FakeCalendarServer:
+    def __init__(
+        self,
+        holidays: dict[str, str] | None = None,
+        latency: float = 0.05,
+        key: str = "bench",
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        self.holidays = holidays or {}
+        self.latency = latency
+        self.key = key
+        self.calls = 0
+        self.lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.fake = self
+        self.host, self.port = self._server.server_address[:2]
+        self.url = f"http://{self.host}:{self.port}/calendar"
+
+    def __enter__(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,131 @@
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_PNG = bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+    "1f15c4890000000d49444154789c63f8cfc0f01f00050001ff89993d1d0000000049454e44ae426082"
+)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status: int, body: bytes, ctype: str = "application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _json(self, obj, status: int = 200):
+        self._send(status, json.dumps(obj, ensure_ascii=False).encode("utf-8"))
+
+    def do_POST(self):
+        fake = self.server.fake
+        n = int(self.headers.get("Content-Length", "0"))
+        req = json.loads(self.rfile.read(n) or b"{}")
+        fake.record(self.path, req)
+        if fake.should_fail():
+            self._json({"error": "unavailable"}, 503)
+        elif self.path.endswith("/chat/completions"):
+            time.sleep(fake.chat_latency)
+            if (req.get("response_format") or {}).get("type") == "json_object":
+                content = json.dumps({"prompt": "a cat", "negative_prompt": "blur"})
+            else:
+                content = f"亲爱的姐姐：\n这是第{fake.calls}封信。\n你永远的，妹妹"
+            self._json(
+                {
+                    "id": f"chatcmpl-{fake.calls}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": req.get("model", ""),
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", "content": content},
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": {
+                        "prompt_tokens": 100,
+                        "completion_tokens": 200,
+                        "total_tokens": 300,
+                    },
+                }
+            )
+        elif self.path.endswith("/images/generations"):
+            time.sleep(fake.image_latency)
+            self._json({"data": [{"url": f"{fake.url}/files/{fake.calls}.png"}]})
+        else:
+            self._json({"error": "not found"}, 404)
+
+    def do_GET(self):
+        fake = self.server.fake
+        fake.record(self.path, None)
+        if self.path.startswith("/files/"):
+            self._send(200, fake.image, "image/png")
+        else:
+            self._json({"error": "not found"}, 404)
+
+
+class FakeModelServer:
+    def __init__(
+        self,
+        chat_latency: float = 0.2,
+        image_latency: float = 0.5,
+        image: bytes = _PNG,
+        fail_first: int = 0,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        self.chat_latency = chat_latency
+        self.image_latency = image_latency
+        self.image = image
+        self.fail_first = fail_first
+        self.failed = 0
+        self.calls = 0
+        self.requests = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.fake = self
+        self.host, self.port = self._server.server_address[:2]
+        self.url = f"http://{self.host}:{self.port}"
+
+    def record(self, path: str, body):
+        with self._lock:
+            self.calls += 1
+            self.requests.append((path, body))
+
+    def should_fail(self) -> bool:
+        with self._lock:
+            if self.failed < self.fail_first:
+                self.failed += 1
+                return True
+        return False
+
+    def __enter__(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+if __name__ == "__main__":
+    import os
+
+    with FakeModelServer(port=int(os.environ.get("PORT", "8900"))) as fake:
+        print(f"fake model server on {fake.url}/v1")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
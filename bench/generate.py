@@ -0,0 +1,76 @@
+import os
+import sys
+import time
+import argparse
+import datetime
+import tempfile
+from .fake_model import FakeModelServer
+
+
+def seed(groups: int, d: datetime.date):
+    from backend.db import init_db, add_user
+
+    init_db()
+    for i in range(groups):
+        for sal in ["哥哥", "姐姐"]:
+            add_user(
+                f"user{i}_{sal}@example.com",
+                "weekly",
+                sal,
+                f"{1990 + i}/{d.month}/{d.day}",
+            )
+            add_user(f"other{i}_{sal}@example.com", "weekly", sal, None)
+
+
+def run(root: str, name: str, concurrency: int, day: datetime.date):
+    from mailer import artifacts, mailer
+
+    os.makedirs(os.path.join(root, name), exist_ok=True)
+    os.chdir(os.path.join(root, name))
+    artifacts._store = None
+    os.environ["GEN_CONCURRENCY"] = str(concurrency)
+    mailer._today = lambda: datetime.datetime(day.year, day.month, day.day)
+    t = time.perf_counter()
+    cache = mailer.generate_today_cache()
+    return time.perf_counter() - t, cache["items"]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--groups", type=int, default=4)
+    ap.add_argument("--concurrency", type=int, default=4)
+    ap.add_argument("--chat-latency", type=float, default=0.2)
+    ap.add_argument("--image-latency", type=float, default=0.5)
+    ap.add_argument("--image-rate", type=float, default=600)
+    ap.add_argument("--date", default="2024-01-08")
+    args = ap.parse_args()
+    day = datetime.date.fromisoformat(args.date)
+    tmp = tempfile.mkdtemp()
+    os.environ["GEN_CACHE"] = "off"
+    os.environ["CALENDAR_INDEX_DIR"] = tmp
+    os.environ["DB_PATH"] = os.path.join(tmp, "data", "data.db")
+    os.environ["IMG_RATE_PER_MINUTE"] = str(args.image_rate)
+    os.environ["IMG_BURST"] = "1"
+    with FakeModelServer(args.chat_latency, args.image_latency) as fake:
+        os.environ["MODEL_URL"] = fake.url + "/v1"
+        os.environ["MODEL_KEY"] = "bench"
+        seed(args.groups, day)
+        from mailer import calendar_index
+
+        calendar_index.year_table(day.year)
+        serial, items = run(tmp, "c1", 1, day)
+        concurrent, _ = run(tmp, f"c{args.concurrency}", args.concurrency, day)
+        _, plain = run(tmp, "general", 1, day + datetime.timedelta(days=7))
+    items += plain
+    general = [i for i in items if i["type"] == "general"]
+    print(f"items: {len(items) - len(plain)} (+{len(plain)} general-only)")
+    print(f"concurrency=1:  {serial:8.2f} s")
+    print(f"concurrency={args.concurrency}:  {concurrent:8.2f} s")
+    print(f"speedup:        {serial / concurrent:8.2f}x")
+    if not general or not all(i["subject"] for i in items):
+        print("expected titled general items")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
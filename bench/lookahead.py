@@ -0,0 +1,137 @@
+import os
+import json
+import time
+import random
+import argparse
+import datetime
+import tempfile
+from .fake_model import FakeModelServer
+
+
+def seed(users: int, start: datetime.date, days: int):
+    from backend import db
+
+    db.init_db()
+    rnd = random.Random(0)
+    rows = []
+    for i in range(users):
+        d = start + datetime.timedelta(days=rnd.randrange(days))
+        rows.append(
+            (
+                f"user{i}@example.com",
+                rnd.randint(0, 2),
+                rnd.randint(0, 1),
+                rnd.randint(1960, 2005),
+                d.month,
+                d.day,
+                None,
+                0,
+            )
+        )
+    db.upsert_users(rows)
+
+
+def _run(root: str, day: datetime.date, fn, *args):
+    from mailer import artifacts, mailer
+
+    os.makedirs(root, exist_ok=True)
+    os.chdir(root)
+    artifacts._store = None
+    mailer._today = lambda: datetime.datetime(day.year, day.month, day.day)
+    t = time.perf_counter()
+    res = fn(*args)
+    return time.perf_counter() - t, res
+
+
+def _usage():
+    from mailer import mailer
+
+    return dict(mailer._usage)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=3000)
+    ap.add_argument("--days", type=int, default=3)
+    ap.add_argument("--date", default="2024-01-01")
+    ap.add_argument("--chat-latency", type=float, default=0.05)
+    ap.add_argument("--image-latency", type=float, default=0.2)
+    ap.add_argument("--image-rate", type=float, default=120)
+    ap.add_argument("--concurrency", type=int, default=4)
+    args = ap.parse_args()
+    day = datetime.date.fromisoformat(args.date)
+    tmp = tempfile.mkdtemp()
+    os.environ.update(
+        GEN_CACHE="off",
+        GEN_CONCURRENCY=str(args.concurrency),
+        CALENDAR_INDEX_DIR=tmp,
+        DB_PATH=os.path.join(tmp, "data.db"),
+        IMG_RATE_PER_MINUTE=str(args.image_rate),
+        IMG_BURST="1",
+        CALENDAR_API_URL="",
+    )
+    from backend import db
+    from mailer import calendar_index, mailer
+
+    with FakeModelServer(args.chat_latency, args.image_latency) as fake:
+        os.environ.update(MODEL_URL=fake.url + "/v1", MODEL_KEY="bench")
+        for y in {day.year, (day - datetime.timedelta(days=1)).year}:
+            calendar_index.year_table(y)
+        seed(args.users, day, args.days)
+        print(f"users={args.users} image rate={args.image_rate}/min days={args.days}")
+
+        cold, cache = _run(os.path.join(tmp, "cold"), day, mailer.generate_today_cache)
+        print(
+            f"without lookahead: {cold:7.2f} s on the day ({len(cache['items'])} variants)"
+        )
+
+        root = os.path.join(tmp, "warm")
+        before = _usage()
+        night, report = _run(
+            root,
+            day - datetime.timedelta(days=1),
+            mailer.generate_lookahead,
+            args.days,
+            0,
+        )
+        calls = {k: v - before[k] for k, v in _usage().items()}
+        print(
+            f"lookahead night:   {night:7.2f} s ({report['generated']} variants, {calls['chat_calls']} chat / {calls['image_calls']} image calls)"
+        )
+        db.add_user(
+            "late1@example.com", "monthly", "哥哥", f"1950/{day.month}/{day.day}"
+        )
+        db.add_user(
+            "late2@example.com", "weekly", "姐姐", f"2010/{day.month}/{day.day}"
+        )
+        before = _usage()
+        warm, cache = _run(root, day, mailer.generate_today_cache)
+        calls = {k: v - before[k] for k, v in _usage().items()}
+        print(
+            f"with lookahead:    {warm:7.2f} s on the day ({len(cache['items'])} variants, "
+            f"{calls['chat_calls']} chat / {calls['image_calls']} image calls for groups added after the lookahead)"
+        )
+
+        root = os.path.join(tmp, "budget")
+        _, report = _run(
+            root,
+            day - datetime.timedelta(days=1),
+            mailer.generate_lookahead,
+            args.days,
+            cold / 2,
+        )
+        done = {}
+        for i in range(1, args.days + 1):
+            d = day + datetime.timedelta(days=i - 1)
+            path = os.path.join(root, "cache", f"{d:%Y-%m-%d}.partial.jsonl")
+            if os.path.isfile(path):
+                with open(path, "r", encoding="utf-8") as f:
+                    done[str(d)] = sum(1 for _ in f)
+        print(
+            f"budget {cold / 2:.1f} s:      generated {report['generated']}, deferred {report['deferred']}; per day {json.dumps(done)}"
+        )
+    print(f"speedup on the day: {cold / warm:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
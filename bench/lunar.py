@@ -0,0 +1,83 @@
+import os
+import time
+import random
+import argparse
+import datetime
+import tempfile
+
+
+def seed(users: int, lunar: float):
+    from backend import db
+
+    db.init_db()
+    rnd = random.Random(0)
+    rows = []
+    for i in range(users):
+        cal = 1 if rnd.random() < lunar else 0
+        rows.append(
+            (
+                f"user{i}@example.com",
+                rnd.randint(0, 2),
+                rnd.randint(0, 1),
+                rnd.randint(1960, 2005),
+                rnd.randint(1, 12),
+                rnd.randint(1, 29 if cal else 28),
+                None,
+                cal,
+            )
+        )
+    db.upsert_users(rows)
+
+
+def per_user(today: datetime.date) -> tuple[float, int]:
+    from backend import db
+
+    t = time.perf_counter()
+    n = 0
+    for m, d in db._conn().execute(
+        "SELECT birth_month, birth_day FROM users WHERE calendar=1"
+    ):
+        if db.next_lunar_birthday(m, d, today) == today:
+            n += 1
+    return time.perf_counter() - t, n
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=50000)
+    ap.add_argument("--lunar", type=float, default=0.3)
+    ap.add_argument("--date", default="2024-02-10")
+    args = ap.parse_args()
+    os.environ["DB_PATH"] = os.path.join(tempfile.mkdtemp(), "data.db")
+    today = datetime.date.fromisoformat(args.date)
+    from backend import db
+
+    t = time.perf_counter()
+    seed(args.users, args.lunar)
+    print(
+        f"seeded {args.users} users ({args.lunar:.0%} lunar) in {time.perf_counter() - t:.1f} s"
+    )
+    naive, n = per_user(today)
+    print(f"convert every lunar user:   {naive:8.3f} s  ({n} birthdays today)")
+    db._conn().execute("UPDATE users SET solar_birthday=NULL")
+    t = time.perf_counter()
+    rows = db.refresh_birthdays(today)
+    bulk = time.perf_counter() - t
+    print(f"bulk refresh by lunar date: {bulk:8.3f} s  ({rows} rows)")
+    t = time.perf_counter()
+    rows = db.refresh_birthdays(today + datetime.timedelta(days=1))
+    print(
+        f"next day refresh:           {time.perf_counter() - t:8.3f} s  ({rows} rows)"
+    )
+    t = time.perf_counter()
+    for _ in range(100):
+        groups = list(db.iter_birthday_groups(today))
+    lookup = (time.perf_counter() - t) / 100
+    print(
+        f"daily birthday lookup:      {lookup * 1000:8.2f} ms  ({sum(len(g['recipients']) for g in groups)} recipients)"
+    )
+    print(f"speedup: {naive / bulk:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+import os
+import time
+import argparse
+from email import encoders
+from email.mime.base import MIMEBase
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+from email.utils import formataddr
+from mailer.message import MessageTemplate
+
+
+def legacy(subject: str, text: str, img: bytes, to_email: str):
+    msg = MIMEMultipart("related")
+    msg["From"] = formataddr(["YourForeverSister", "bench@example.com"])
+    msg["To"] = formataddr(["You", to_email])
+    msg["Subject"] = subject
+    alt = MIMEMultipart("alternative")
+    msg.attach(alt)
+    alt.attach(MIMEText(text, "plain", "utf-8"))
+    html = f'<html><body><p style="white-space: pre-wrap;">{text}</p><img src="cid:img" style="max-width:100%;"></body></html>'
+    alt.attach(MIMEText(html, "html", "utf-8"))
+    mime = MIMEBase("image", "png")
+    mime.set_payload(img)
+    encoders.encode_base64(mime)
+    mime.add_header("Content-ID", "<img>")
+    msg.attach(mime)
+    return msg.as_string()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--image-mb", type=float, default=3)
+    ap.add_argument("--batches", type=int, default=50)
+    args = ap.parse_args()
+    img = os.urandom(int(args.image_mb * 1024 * 1024))
+    text = "亲爱的姐姐：\n妹妹好想你呀！\n你永远的，妹妹" * 20
+    t = time.perf_counter()
+    for i in range(args.batches):
+        legacy("生日快乐！", text, img, f"user{i}@example.com").encode("utf-8")
+    old = time.perf_counter() - t
+    t = time.perf_counter()
+    template = MessageTemplate("生日快乐！", text, img, sender="bench@example.com")
+    for i in range(args.batches):
+        template.render(f"user{i}@example.com")
+    new = time.perf_counter() - t
+    print(f"message size: {len(template) / 1024 / 1024:.2f} MiB")
+    print(f"rebuild per batch: {old / args.batches * 1000:8.2f} ms/batch")
+    print(f"template render:   {new / args.batches * 1000:8.2f} ms/batch")
+    print(f"speedup:           {old / new:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
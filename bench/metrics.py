@@ -0,0 +1,53 @@
+import time
+import argparse
+from backend import metrics
+
+
+def per_call(fn, n: int) -> float:
+    t = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - t) / n * 1e9
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-n", type=int, default=200000)
+    args = ap.parse_args()
+
+    def timer():
+        with metrics.timer("bench_seconds", stage="x"):
+            pass
+
+    def inc():
+        metrics.inc("bench", result="ok")
+
+    @metrics.timed("bench_fn_seconds")
+    def decorated():
+        pass
+
+    def plain():
+        pass
+
+    rows = []
+    for enabled in (True, False):
+        metrics.enabled = enabled
+        off = metrics.timed("bench_fn_seconds")(plain)
+        rows.append(
+            (
+                enabled,
+                per_call(timer, args.n),
+                per_call(inc, args.n),
+                per_call(decorated if enabled else off, args.n),
+            )
+        )
+    print(f"baseline call:     {per_call(plain, args.n):8.1f} ns")
+    for enabled, t, i, d in rows:
+        state = "enabled " if enabled else "disabled"
+        print(f"{state} timer:    {t:8.1f} ns  inc: {i:8.1f} ns  timed fn: {d:8.1f} ns")
+    metrics.enabled = True
+    print(f"render ({len(metrics.render().splitlines())} lines)")
+
+
+if __name__ == "__main__":
+    main()
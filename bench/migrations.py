@@ -0,0 +1,138 @@
+import os
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+import threading
+
+_LEGACY = "CREATE TABLE users (email TEXT PRIMARY KEY, frequency INTEGER NOT NULL, salutation INTEGER NOT NULL, birth_year INTEGER, birth_month INTEGER, birth_day INTEGER)"
+
+
+def seed_legacy(path: str, n: int):
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute(_LEGACY)
+    rnd = random.Random(0)
+    conn.executemany(
+        "INSERT INTO users VALUES (?, ?, ?, ?, ?, ?)",
+        (
+            (
+                f"user{i}@example.com",
+                rnd.randint(0, 2),
+                rnd.randint(0, 1),
+                rnd.randint(1950, 2010),
+                rnd.randint(1, 12),
+                rnd.randint(1, 28),
+            )
+            for i in range(n)
+        ),
+    )
+    conn.commit()
+    conn.close()
+
+
+def legacy_check():
+    from backend import db
+
+    with db.transaction() as conn:
+        cols = {row[1] for row in conn.execute("PRAGMA table_info(users)")}
+        for col in ["birth_year", "birth_month", "birth_day", "name"]:
+            assert col in cols
+        conn.execute("CREATE INDEX IF NOT EXISTS users_frequency ON users (frequency)")
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS users_birthday ON users (birth_month, birth_day)"
+        )
+
+
+def per_call(fn, repeat: int) -> float:
+    t = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - t) / repeat
+
+
+def probe(n: int, stop: threading.Event, lat: list, errors: list):
+    from backend import db
+
+    rnd = random.Random(2)
+    while not stop.is_set():
+        email = f"user{rnd.randrange(n)}@example.com"
+        t = time.perf_counter()
+        try:
+            u = db.get_user(email)
+            db.update_user(email, "weekly", u["salutation"], u["birthday"])
+        except sqlite3.OperationalError:
+            errors.append(email)
+        lat.append(time.perf_counter() - t)
+        time.sleep(0.005)
+    db.close()
+
+
+def online(n: int, version: int, batch: int, pause: float):
+    from backend import migrations
+
+    m = migrations.Migration(
+        version,
+        f"bench_status_{version}",
+        lambda conn: conn.execute(
+            f"ALTER TABLE users ADD COLUMN status{version} INTEGER"
+        ),
+        migrations.sql_backfill(
+            f"status{version} = frequency", f"status{version} IS NULL"
+        ),
+    )
+    steps = migrations.MIGRATIONS + [
+        migrations.Migration(v, f"bench_{v}", lambda conn: None)
+        for v in range(migrations.head() + 1, version)
+    ]
+    lat, errors = [], []
+    stop = threading.Event()
+    th = threading.Thread(target=probe, args=(n, stop, lat, errors))
+    th.start()
+    time.sleep(0.2)
+    t = time.perf_counter()
+    migrations.migrate(steps + [m], batch=batch, pause=pause)
+    elapsed = time.perf_counter() - t
+    stop.set()
+    th.join()
+    lat.sort()
+    return elapsed, lat, len(errors)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=1000000)
+    ap.add_argument("--batches", default="5000,0")
+    ap.add_argument("--pause", type=float, default=0.01)
+    args = ap.parse_args()
+    path = os.path.join(tempfile.mkdtemp(), "data.db")
+    os.environ["DB_PATH"] = path
+    t = time.perf_counter()
+    seed_legacy(path, args.users)
+    print(f"seeded {args.users} legacy rows in {time.perf_counter() - t:.1f} s")
+    from backend import db, migrations
+
+    t = time.perf_counter()
+    db.init_db()
+    print(
+        f"migrate legacy -> v{migrations.current()[0]}: {time.perf_counter() - t:8.2f} s"
+    )
+    print(
+        f"startup check: PRAGMA/CREATE IF NOT EXISTS {per_call(legacy_check, 200) * 1e6:8.1f} us"
+        f"  schema_version {per_call(db.init_db, 2000) * 1e6:8.1f} us"
+    )
+    version = migrations.head()
+    for batch in [int(b) for b in args.batches.split(",")]:
+        version += 1
+        size = batch or args.users
+        elapsed, lat, errors = online(args.users, version, size, args.pause)
+        label = f"batch={batch}" if batch else "single transaction"
+        print(
+            f"backfill {label:20} {elapsed:7.2f} s  {args.users / elapsed:10.0f} rows/s"
+            f"  probe p50/p95/max {lat[len(lat) // 2] * 1000:6.1f} / {lat[int(len(lat) * 0.95)] * 1000:6.1f} / {lat[-1] * 1000:7.1f} ms  ({len(lat)} ops, {errors} locked)"
+        )
+
+
+if __name__ == "__main__":
+    main()
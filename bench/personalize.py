@@ -0,0 +1,105 @@
+import os
+import json
+import random
+import argparse
+import datetime
+import tempfile
+from .fake_model import FakeModelServer
+
+_NAMES = [
+    "小雨",
+    "阿杰",
+    "晓明",
+    "婷婷",
+    "子涵",
+    "浩然",
+    "欣怡",
+    "宇轩",
+    "思远",
+    "佳怡",
+]
+
+
+def seed(users: int, names: int, today: datetime.date):
+    from backend.db import _freq_to_int, _sal_to_int, init_db, upsert_users
+
+    init_db()
+    rng = random.Random(0)
+    pool = [f"{_NAMES[i % len(_NAMES)]}{i // len(_NAMES) or ''}" for i in range(names)]
+    rows = []
+    for i in range(users):
+        birthday = rng.random() < 0.05
+        rows.append(
+            (
+                f"user{i}@example.com",
+                _freq_to_int(rng.choice(["monthly", "weekly"])),
+                _sal_to_int(rng.choice(["哥哥", "姐姐"])),
+                rng.randint(1970, 2005) if birthday else None,
+                today.month if birthday else None,
+                today.day if birthday else None,
+                rng.choice(pool) if rng.random() < 0.75 else None,
+                0,
+            )
+        )
+    upsert_users(rows)
+
+
+def run(root: str, concurrency: int):
+    import mailer.mailer as m
+    from mailer import artifacts
+
+    os.chdir(os.path.join(root, f"c{concurrency}"))
+    artifacts._store = None
+    os.environ["GEN_CONCURRENCY"] = str(concurrency)
+    m.generate_today_cache()
+    with open(os.path.join("cache", f"{m._date_str(m._today())}.gen.json")) as f:
+        return json.load(f)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=2000)
+    ap.add_argument("--names", type=int, default=40)
+    ap.add_argument("--concurrency", type=int, default=16)
+    ap.add_argument("--chat-latency", type=float, default=0.05)
+    ap.add_argument("--image-latency", type=float, default=0.2)
+    args = ap.parse_args()
+    tmp = tempfile.mkdtemp()
+    for c in {1, args.concurrency}:
+        os.makedirs(os.path.join(tmp, f"c{c}", "cache"))
+    today = datetime.datetime(2024, 1, 1)
+    os.environ.update(
+        DB_PATH=os.path.join(tmp, "data", "data.db"),
+        GEN_CACHE="off",
+        GEN_PERSONALIZE="1",
+        IMG_RATE_PER_MINUTE="6000",
+        MODEL_KEY="bench",
+        GEN_PRICE_PROMPT="0.002",
+        GEN_PRICE_COMPLETION="0.008",
+        GEN_PRICE_IMAGE="0.04",
+    )
+    import mailer.mailer as m
+
+    m._today = lambda: today
+    m.get_today_holiday = lambda d=None: None
+    m.get_upcoming_events = lambda days=7, today=None: []
+    with FakeModelServer(args.chat_latency, args.image_latency) as fake:
+        os.environ["MODEL_URL"] = fake.url + "/v1"
+        seed(args.users, args.names, today.date())
+        serial = run(tmp, 1)
+        concurrent = run(tmp, args.concurrency)
+    naive = args.users * (3 * args.chat_latency + args.image_latency)
+    print(
+        f"recipients={serial['recipients']} variants={serial['variants']} "
+        f"chat calls={serial['chat_calls']} image calls={serial['image_calls']} "
+        f"est. cost={serial['estimated_cost']}"
+    )
+    print(f"per-user serial (est.): {naive:8.2f} s")
+    for r, c in ((serial, 1), (concurrent, args.concurrency)):
+        print(
+            f"concurrency={c:<3d}        {r['elapsed']:8.2f} s  {r['variants_per_second']:8.1f} variants/s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import os
+import time
+import argparse
+import tempfile
+from collections import Counter
+
+
+def per_check(n: int, ips: int) -> float:
+    from backend import ratelimit
+
+    keys = [
+        (f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}", f"user{i}@example.com")
+        for i in range(ips)
+    ]
+    t = time.perf_counter()
+    for i in range(n):
+        ip, email = keys[i % ips]
+        ratelimit.limit("code", ip, email)
+    return (time.perf_counter() - t) / n
+
+
+def _reset(store: str):
+    from backend import ratelimit
+
+    os.environ["RATE_LIMIT_STORE"] = store
+    ratelimit._limiter = None
+
+
+def flood(requests: int) -> tuple[Counter, Counter, str | None]:
+    from fastapi.testclient import TestClient
+    from backend.app import app
+
+    sends = Counter()
+    guesses = Counter()
+    retry = None
+    with TestClient(app) as client:
+        for i in range(requests):
+            r = client.post(
+                "/verify/send", json={"email": f"user{i}@example.com", "action": "x"}
+            )
+            sends[r.status_code] += 1
+            retry = r.headers.get("retry-after") or retry
+        os.environ["RATE_LIMIT_PROXY"] = "1"
+        for i in range(requests):
+            r = client.post(
+                "/unsubscribe",
+                json={"email": "victim@example.com", "code": f"{i:06d}"},
+                headers={"X-Forwarded-For": f"10.0.{i >> 8 & 255}.{i & 255}"},
+            )
+            guesses[r.status_code] += 1
+    return sends, guesses, retry
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--checks", type=int, default=200000)
+    ap.add_argument("--ips", type=int, default=1000000)
+    ap.add_argument("--max-keys", type=int, default=100000)
+    ap.add_argument("--requests", type=int, default=200)
+    args = ap.parse_args()
+    tmp = tempfile.mkdtemp()
+    os.environ.update(
+        DB_PATH=os.path.join(tmp, "data.db"),
+        RATE_LIMIT_DB_PATH=os.path.join(tmp, "ratelimit.db"),
+        RATE_LIMIT_MAX_KEYS=str(args.max_keys),
+        METRICS="0",
+    )
+    from backend import ratelimit
+
+    os.environ["RATE_LIMIT"] = "0"
+    print(f"disabled          {per_check(args.checks, 1000) * 1e6:7.2f} us/check")
+    os.environ["RATE_LIMIT"] = "1"
+    for store, ips, checks in [
+        ("memory", 1000, args.checks),
+        ("memory", args.ips, args.ips),
+        ("sqlite", 1000, args.checks // 10),
+    ]:
+        _reset(store)
+        us = per_check(checks, ips) * 1e6
+        print(
+            f"{store:7} {ips:8} ips {us:7.2f} us/check  ({len(ratelimit.get_limiter())} buckets held)"
+        )
+    _reset("memory")
+    sends, guesses, retry = flood(args.requests)
+    print(
+        f"one IP, {args.requests} /verify/send: {dict(sends)} (Retry-After {retry} s)"
+    )
+    print(
+        f"one email, {args.requests} code guesses from {args.requests} IPs: {dict(guesses)}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import os
+import sys
+import time
+import argparse
+import datetime
+import tempfile
+import threading
+from mailer.scheduler import Scheduler, SimClock, Task
+
+
+def check(history, start, stopped, resumed, timeout: float) -> dict[str, bool]:
+    runs = {}
+    for i, (name, slot, status, started, finished) in enumerate(history):
+        runs.setdefault((name, slot.date()), []).append((i, status, started, finished))
+
+    def last(name, day):
+        return runs.get((name, day), [(None, None, None, None)])[-1]
+
+    days = sorted({d for n, d in runs if n == "generate"})
+    sends_wait = True
+    for day in days:
+        i, status, started, _ = last("send", day)
+        if status != "ok":
+            continue
+        g, gstatus, _, gfinished = last("generate", day)
+        sends_wait = sends_wait and gstatus == "ok" and g < i and gfinished <= started
+    missed = [
+        d
+        for d in days
+        if stopped < datetime.datetime.combine(d, datetime.time(6)) <= resumed
+    ]
+    caught_up = bool(missed) and all(
+        last("generate", d)[1] == "ok" and last("generate", d)[2] >= resumed
+        for d in missed
+    )
+    hung = start.date() + datetime.timedelta(days=4)
+    _, status, started, finished = last("generate", hung)
+    abandoned = (
+        status == "timeout"
+        and (finished - started).total_seconds() == timeout
+        and last("send", hung)[1] == "skipped"
+        and last("generate", hung + datetime.timedelta(days=1))[1] == "ok"
+    )
+    flaky = [
+        r[1]
+        for r in runs.get(("generate", start.date() + datetime.timedelta(days=2)), [])
+    ]
+    return {
+        "send waits for generate": sends_wait,
+        "missed 06:00 caught up after restart": caught_up,
+        "timed-out run abandoned, next day runs": abandoned,
+        "failed run retried": flaky == ["failed", "ok"],
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--days", type=int, default=7)
+    args = ap.parse_args()
+    if args.days < 6:
+        ap.error("--days must be at least 6 to cover the timeout scenario")
+    state = os.path.join(tempfile.mkdtemp(), "scheduler.json")
+    start = datetime.datetime(2024, 1, 1, 7, 30)
+    clock = SimClock(start)
+    hang = threading.Event()
+    calls = {"generate": 0, "send": 0}
+
+    def generate():
+        calls["generate"] += 1
+        day = (clock.now().date() - start.date()).days
+        if day == 2 and calls["generate"] % 2:
+            raise RuntimeError("model unavailable")
+        if day == 4:
+            hang.wait()
+
+    def send():
+        calls["send"] += 1
+
+    def tasks():
+        return [
+            Task("generate", generate, "0 6 * * *", timeout=3600, retries=1),
+            Task("send", send, "0 8 * * *", after=["generate"], timeout=3600),
+            Task("report", lambda: None, "*/30 * * * *"),
+        ]
+
+    t = time.perf_counter()
+    first = Scheduler(tasks(), clock=clock, state_path=state)
+    first.run(until=start.replace(hour=5) + datetime.timedelta(days=args.days // 2))
+    stopped = clock.now()
+    clock.advance(3 * 3600)
+    resumed = clock.now()
+    restarted = Scheduler(tasks(), clock=clock, state_path=state)
+    restarted.run(until=start + datetime.timedelta(days=args.days))
+    wall = time.perf_counter() - t
+    hang.set()
+
+    for name, slot, status, started, finished in first.history + restarted.history:
+        if name != "report":
+            print(f"{name:9s} slot {slot}  {status:8s} ran {started} -> {finished}")
+    reports = sum(1 for h in first.history + restarted.history if h[0] == "report")
+    print(f"report runs:        {reports}")
+    print(f"simulated:          {args.days} days in {wall * 1000:.1f} ms wall time")
+    results = check(first.history + restarted.history, start, stopped, resumed, 3600)
+    for name, ok in results.items():
+        print(f"{name:40s} {'ok' if ok else 'FAIL'}")
+    if not all(results.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+import os
+import sys
+import json
+import argparse
+import datetime
+import tempfile
+from mailer.scheduler import SimClock
+from .smtp_sink import SMTPSink
+
+
+def write_cache(day: datetime.date, recipients: int, items: int):
+    os.makedirs("cache", exist_ok=True)
+    image = os.path.join("cache", "image.png")
+    with open(image, "wb") as f:
+        f.write(b"\x89PNG" + b"\0" * 1024)
+    per = -(-recipients // items)
+    cache = {
+        "date": str(day),
+        "items": [
+            {
+                "type": "general",
+                "salutation": f"s{i}",
+                "subject": "早上好",
+                "text": "今天也要开心。",
+                "image_path": image,
+                "recipients": [
+                    f"d{day:%m%d}u{j}@example.com"
+                    for j in range(i * per, min(recipients, (i + 1) * per))
+                ],
+            }
+            for i in range(items)
+        ],
+    }
+    with open(os.path.join("cache", f"{day}.json"), "w", encoding="utf-8") as f:
+        json.dump(cache, f, ensure_ascii=False)
+
+
+class Probe:
+    def __init__(self, sim: SimClock, every: float):
+        self.sim = sim
+        self.every = every
+        self.next = None
+        self.waits = []
+        self.shaper = None
+
+    def sleep(self, seconds: float):
+        end = self.sim.now() + datetime.timedelta(seconds=seconds)
+        while True:
+            if self.next is None:
+                self.next = self.sim.now() + datetime.timedelta(seconds=self.every)
+            if self.next > end:
+                break
+            self.sim.advance((self.next - self.sim.now()).total_seconds())
+            self.waits.append(self.shaper.try_acquire(1, "verify", priority=True))
+            self.next = None
+        self.sim.advance((end - self.sim.now()).total_seconds())
+
+
+def peaks(path: str, limits: dict[int, int], kind: str = "%") -> dict[int, int]:
+    from backend.db import connect
+
+    rows = (
+        connect(path)
+        .execute("SELECT at, n FROM sends WHERE kind LIKE ? ORDER BY at", (kind,))
+        .fetchall()
+    )
+    out = {}
+    for seconds in limits:
+        best = used = lo = 0
+        for at, n in rows:
+            used += n
+            while rows[lo][0] <= at - seconds:
+                used -= rows[lo][1]
+                lo += 1
+            best = max(best, used)
+        out[seconds] = best
+    return out
+
+
+def run_day(sim, day: datetime.date, recipients: int, items: int, sink) -> dict:
+    from mailer import mailer
+
+    write_cache(day, recipients, items)
+    sim._now = datetime.datetime.combine(day, datetime.time(8))
+    mailer._today = lambda: datetime.datetime(day.year, day.month, day.day)
+    before = sink.recipients
+    start = sim.now()
+    mailer.send_cached_for_today()
+    with open(os.path.join("cache", f"{day}.timings.json"), "r", encoding="utf-8") as f:
+        report = json.load(f)["send"][-1]
+    return {
+        "delivered": sink.recipients - before,
+        "sent": report["sent"],
+        "backlog": report["backlog"],
+        "deferred": report["deferred"],
+        "hours": (sim.now() - start).total_seconds() / 3600,
+    }
+
+
+def check(
+    days: list[dict], peak: dict, bulk: dict, shares: dict, limits: dict, waits: list
+) -> dict[str, bool]:
+    first, second = days
+    return {
+        "budgets never exceeded": all(peak[s] <= limits[s] for s in limits),
+        "bulk leaves the reserve free": all(bulk[s] <= shares[s] for s in limits),
+        "every recipient delivered or deferred": all(
+            d["delivered"] + d["deferred"] == d["new"] + d["backlog"] for d in days
+        ),
+        "backlog drains before new mail": second["backlog"]
+        == min(first["deferred"], second["delivered"]),
+        "verification sent at once during bulk": bool(waits)
+        and all(w <= 0 for w in waits),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--day1", type=int, default=12000)
+    ap.add_argument("--day2", type=int, default=3000)
+    ap.add_argument("--items", type=int, default=4)
+    ap.add_argument("--batch", type=int, default=100)
+    ap.add_argument("--per-minute", type=int, default=60)
+    ap.add_argument("--per-hour", type=int, default=1500)
+    ap.add_argument("--per-day", type=int, default=8000)
+    ap.add_argument("--reserve", type=float, default=0.1)
+    ap.add_argument("--window", type=float, default=4 * 3600)
+    ap.add_argument("--verify-every", type=float, default=420)
+    args = ap.parse_args()
+    os.chdir(tempfile.mkdtemp())
+    limits = {60: args.per_minute, 3600: args.per_hour, 86400: args.per_day}
+    with SMTPSink() as sink:
+        os.environ.update(
+            SMTP_SERVER=sink.host,
+            SMTP_PORT=str(sink.port),
+            SMTP_SSL="0",
+            SMTP_EMAIL="bench@example.com",
+            SMTP_KEY="x",
+            SMTP_POOL_SIZE="1",
+            SMTP_BATCH_SIZE=str(args.batch),
+            SMTP_SEND_WINDOW=str(args.window),
+            ARTIFACT_STORE="off",
+        )
+        from backend import shaper
+
+        sim = SimClock(datetime.datetime(2024, 1, 1, 8))
+        probe = Probe(sim, args.verify_every)
+        probe.shaper = shaper._shaper = shaper.Shaper(
+            path=os.path.abspath("shaper.db"),
+            limits=limits,
+            reserve=args.reserve,
+            clock=lambda: sim.now().timestamp(),
+            sleep=probe.sleep,
+        )
+        print(
+            f"budgets {args.per_minute}/min {args.per_hour}/h {args.per_day}/day, "
+            f"{args.reserve:.0%} reserved for verification, window {args.window / 3600:.1f} h"
+        )
+        day = datetime.date(2024, 1, 1)
+        days = []
+        for i, n in enumerate([args.day1, args.day2]):
+            probe.next = None
+            res = run_day(sim, day + datetime.timedelta(days=i), n, args.items, sink)
+            days.append({"new": n, **res})
+            print(
+                f"day {i + 1}: {n:6d} new  delivered {res['delivered']:6d} "
+                f"(backlog first {res['backlog']:5d})  deferred {res['deferred']:5d}  "
+                f"over {res['hours']:.1f} simulated h"
+            )
+        print(f"backlog left: {shaper._shaper.backlog()}")
+        peak = peaks("shaper.db", limits)
+        bulk = peaks("shaper.db", limits, "bulk")
+        shares = {s: int(n * (1 - args.reserve)) for s, n in limits.items()}
+        print(
+            "peak use:     "
+            + "  ".join(f"{s}s {p}/{limits[s]}" for s, p in peak.items())
+        )
+        waits = probe.waits
+        print(
+            f"verification: {len(waits)} arrivals during bulk, {sum(1 for w in waits if w <= 0)} sent at once, "
+            f"max wait {max(waits, default=0):.0f} s"
+        )
+    results = check(days, peak, bulk, shares, limits, waits)
+    for name, ok in results.items():
+        print(f"{name:40s} {'ok' if ok else 'FAIL'}")
+    if not all(results.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+from .fake_model import _PNG
+from .smtp_sink import SMTPSink
+
+
+def _setup(root: str, recipients: int) -> str:
+    os.makedirs(os.path.join(root, "cache"), exist_ok=True)
+    image = os.path.join(root, "cache", "general.png")
+    with open(image, "wb") as f:
+        f.write(_PNG)
+    path = os.path.join(root, "cache", "2024-01-01.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "date": "2024-01-01",
+                "items": [
+                    {
+                        "key": "general:姐姐",
+                        "type": "general",
+                        "salutation": "姐姐",
+                        "recipients": [
+                            f"user{i}@example.com" for i in range(recipients)
+                        ],
+                        "subject": "bench",
+                        "text": "亲爱的姐姐：\n" + "今天也要开心。\n" * 40,
+                        "image_path": image,
+                        "content_type": "image/png",
+                    }
+                ],
+            },
+            f,
+            ensure_ascii=False,
+        )
+    return path
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--recipients", type=int, default=100000)
+    ap.add_argument("--shards", default="1,2,4,8")
+    ap.add_argument("--latency", type=float, default=0.02)
+    ap.add_argument("--batch-size", type=int, default=50)
+    ap.add_argument("--pool-size", type=int, default=4)
+    args = ap.parse_args()
+    root = tempfile.mkdtemp()
+    os.chdir(root)
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    with SMTPSink(latency=args.latency) as sink:
+        os.environ.update(
+            DB_PATH=os.path.join(root, "data", "data.db"),
+            SMTP_SERVER=sink.host,
+            SMTP_PORT=str(sink.port),
+            SMTP_SSL="0",
+            SMTP_EMAIL="bench@example.com",
+            SMTP_KEY="x",
+            SMTP_BATCH_SIZE=str(args.batch_size),
+            SMTP_POOL_SIZE=str(args.pool_size),
+        )
+        from mailer import shards
+        from mailer.mailer import _deliver_cache
+
+        print(
+            f"recipients={args.recipients} batch={args.batch_size} pool/process={args.pool_size} sink latency={args.latency * 1000:.0f}ms cpus={os.cpu_count()}"
+        )
+        base = None
+        for n in [int(x) for x in args.shards.split(",")]:
+            run_root = os.path.join(root, f"run{n}")
+            path = _setup(run_root, args.recipients)
+            before = sink.recipients
+            t = time.perf_counter()
+            if n == 1:
+                with open(path, "r", encoding="utf-8") as f:
+                    report = _deliver_cache(
+                        json.load(f), path[: -len(".json")] + ".sent.jsonl"
+                    )
+                sent = report["sent"]
+            else:
+                sent = sum(r.get("sent", 0) for r in shards.run(path, n, processes=n))
+            elapsed = time.perf_counter() - t
+            assert sent == args.recipients == sink.recipients - before
+            base = base or elapsed
+            print(
+                f"shards={n:<3d} {elapsed:8.2f} s  {sent / elapsed:10.0f} recipients/s  speedup {base / elapsed:5.2f}x"
+            )
+        print(f"sink connections={sink.connections} messages={sink.messages}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import time
+import threading
+import socketserver
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def _reply(self, line: str):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        sink = self.server.sink
+        with sink.lock:
+            sink.connections += 1
+        self._reply("220 sink ESMTP")
+        rcpts = 0
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            cmd = line.decode("utf-8", "replace").strip().upper()
+            if cmd.startswith("EHLO"):
+                self.wfile.write(
+                    b"250-sink\r\n250-AUTH PLAIN LOGIN\r\n250 8BITMIME\r\n"
+                )
+            elif cmd.startswith("HELO"):
+                self._reply("250 sink")
+            elif cmd.startswith("AUTH"):
+                with sink.lock:
+                    sink.logins += 1
+                self._reply("235 ok")
+            elif cmd.startswith("MAIL"):
+                rcpts = 0
+                self._reply("250 ok")
+            elif cmd.startswith("RCPT"):
+                rcpts += 1
+                self._reply("250 ok")
+            elif cmd == "DATA":
+                self._reply("354 go ahead")
+                size = 0
+                while True:
+                    chunk = self.rfile.readline()
+                    if not chunk or chunk == b".\r\n":
+                        break
+                    size += len(chunk)
+                if sink.latency:
+                    time.sleep(sink.latency)
+                with sink.lock:
+                    sink.messages += 1
+                    sink.recipients += rcpts
+                    sink.bytes += size
+                self._reply("250 queued")
+            elif cmd == "QUIT":
+                self._reply("221 bye")
+                return
+            else:
+                self._reply("250 ok")
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class SMTPSink:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0):
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.logins = 0
+        self.messages = 0
+        self.recipients = 0
+        self.bytes = 0
+        self._server = _Server((host, port), _Handler)
+        self._server.sink = self
+        self.host, self.port = self._server.server_address[:2]
+
+    def __enter__(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+if __name__ == "__main__":
+    import os
+
+    with SMTPSink(port=int(os.environ.get("SMTP_PORT", "2525"))) as sink:
+        print(f"SMTP sink listening on {sink.host}:{sink.port}")
+        try:
+            while True:
+                time.sleep(5)
+                print(
+                    f"connections={sink.connections} messages={sink.messages} recipients={sink.recipients}"
+                )
+        except KeyboardInterrupt:
+            pass
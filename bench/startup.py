@@ -0,0 +1,98 @@
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENTRIES = {
+    "api": ("backend.app", 900, ["requests", "openai", "lunar_python"]),
+    "mailer": ("mailer.mailer", 200, ["requests", "openai", "lunar_python", "smtplib"]),
+    "clock": ("clock", 40, ["mailer.mailer", "requests", "openai", "lunar_python"]),
+    "db": ("backend.db", 40, []),
+}
+
+
+def _parse(stderr: str):
+    mods = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = line[len("import time:") :].split("|")
+        try:
+            self_us, cum_us = int(parts[0]), int(parts[1])
+        except ValueError:
+            continue
+        mods[parts[2].strip()] = (self_us, cum_us)
+    return mods
+
+
+def importtime(module: str) -> tuple[dict, bool]:
+    cwd = tempfile.mkdtemp(prefix="startup-")
+    env = {**os.environ, "PYTHONPATH": _ROOT}
+    env.pop("DB_PATH", None)
+    p = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=cwd,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if p.returncode:
+        raise RuntimeError(f"importing {module} failed:\n{p.stderr[-2000:]}")
+    return _parse(p.stderr), not os.listdir(cwd)
+
+
+def measure(repeat: int = 5, scale: float = 1.0) -> dict:
+    out = {}
+    for label, (module, budget, forbidden) in ENTRIES.items():
+        runs = [importtime(module) for _ in range(repeat)]
+        best, clean = min(runs, key=lambda r: r[0][module][1])
+        ms = best[module][1] / 1000
+        loaded = [m for m in forbidden if m in best]
+        top = sorted(best.items(), key=lambda kv: kv[1][0], reverse=True)[:5]
+        out[label] = {
+            "module": module,
+            "ms": round(ms, 1),
+            "budget_ms": budget * scale,
+            "modules": len(best),
+            "eager": loaded,
+            "side_effects": not all(c for _, c in runs),
+            "top_self_ms": {m: round(t[0] / 1000, 1) for m, t in top},
+            "ok": ms <= budget * scale and not loaded and all(c for _, c in runs),
+        }
+    return out
+
+
+def report(results: dict) -> bool:
+    ok = True
+    for label, r in results.items():
+        ok = ok and r["ok"]
+        notes = []
+        if r["eager"]:
+            notes.append("eagerly imports " + ", ".join(r["eager"]))
+        if r["side_effects"]:
+            notes.append("writes files on import")
+        print(
+            f"{r['module']:16} {r['ms']:8.1f} ms  budget {r['budget_ms']:6.0f} ms  {'ok' if r['ok'] else 'OVER'}  {'; '.join(notes)}"
+        )
+    return ok
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--scale", type=float, default=1.0)
+    ap.add_argument("--json", action="store_true")
+    args = ap.parse_args()
+    results = measure(args.repeat, args.scale)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    if not report(results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import os
+import time
+import random
+import argparse
+import datetime
+import tempfile
+import tracemalloc
+
+
+def seed(n: int, d: datetime.date):
+    from backend import db
+
+    db.init_db()
+    rnd = random.Random(0)
+
+    def rows():
+        for i in range(n):
+            if rnd.random() < 0.002:
+                m, day = d.month, d.day
+            else:
+                m, day = rnd.randint(1, 12), rnd.randint(1, 28)
+            yield (
+                f"user{i}@example.com",
+                rnd.randint(0, 2),
+                rnd.randint(0, 1),
+                rnd.randint(1950, 2010),
+                m,
+                day,
+            )
+
+    with db.transaction() as conn:
+        conn.executemany(
+            "INSERT INTO users (email, frequency, salutation, birth_year, birth_month, birth_day) VALUES (?, ?, ?, ?, ?, ?)",
+            rows(),
+        )
+
+
+def legacy(d: datetime.date):
+    from backend import db
+
+    users = db.list_users()
+    bday_groups = db.list_birthday_today_group()
+    bday_today = {r["email"] for recs in bday_groups.values() for r in recs}
+    targets = [u for u in users if u["frequency"] in ("monthly", "holiday")]
+    targets = [u for u in targets if u["email"] not in bday_today]
+    general = {"哥哥": [], "姐姐": []}
+    for u in targets:
+        general[u["salutation"]].append(u["email"])
+    ages = {}
+    for byear, recs in bday_groups.items():
+        for sal in ["哥哥", "姐姐"]:
+            emails = {r["email"] for r in recs if r["salutation"] == sal}
+            for u in users:
+                if u["email"] in emails and u.get("birth_year"):
+                    ages[(sal, byear)] = d.year - int(u["birth_year"])
+                    break
+    return sum(map(len, general.values())), len(ages)
+
+
+def streaming(d: datetime.date):
+    from backend import db
+
+    general = {
+        sal: [
+            e
+            for batch in db.iter_email_batches(["monthly", "holiday"], sal, d)
+            for e in batch
+        ]
+        for sal in ["哥哥", "姐姐"]
+    }
+    groups = list(db.iter_birthday_groups(d))
+    return sum(map(len, general.values())), len(groups)
+
+
+def measure(fn, *args):
+    tracemalloc.start()
+    t = time.perf_counter()
+    res = fn(*args)
+    elapsed = time.perf_counter() - t
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return res, elapsed, peak
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=1000000)
+    args = ap.parse_args()
+    os.environ["DB_PATH"] = os.path.join(tempfile.mkdtemp(), "data.db")
+    d = datetime.date.today()
+    t = time.perf_counter()
+    seed(args.users, d)
+    print(f"seeded {args.users} users in {time.perf_counter() - t:.1f} s")
+    for name, fn in [("list_users + scan", legacy), ("streaming queries", streaming)]:
+        (targets, groups), elapsed, peak = measure(fn, d)
+        print(
+            f"{name:18} {elapsed:8.2f} s  peak {peak / 1024 / 1024:8.1f} MiB  targets={targets} birthday groups={groups}"
+        )
+
+
+if __name__ == "__main__":
+    main()
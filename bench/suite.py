@@ -0,0 +1,406 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import datetime
+import platform
+import tempfile
+import subprocess
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from .fake_calendar import FakeCalendarServer
+from .fake_model import FakeModelServer
+from .smtp_sink import SMTPSink
+from . import startup
+from .verify_queue import serve
+
+SIZES = {"1k": 1000, "100k": 100000, "1m": 1000000}
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _git(*args) -> str:
+    try:
+        return subprocess.run(
+            ["git", *args], cwd=_ROOT, capture_output=True, text=True, timeout=30
+        ).stdout.strip()
+    except Exception:
+        return ""
+
+
+def _stats(lat: list[float], elapsed: float) -> dict:
+    lat = sorted(lat)
+    return {
+        "requests": len(lat),
+        "elapsed": round(elapsed, 4),
+        "rps": round(len(lat) / elapsed, 1),
+        "p50_ms": round(lat[len(lat) // 2] * 1000, 2),
+        "p95_ms": round(lat[int(len(lat) * 0.95)] * 1000, 2),
+        "max_ms": round(lat[-1] * 1000, 2),
+    }
+
+
+def seed(n: int, d: datetime.date, birthday_share: float = 0.003):
+    from backend import db
+
+    db.init_db()
+    rnd = random.Random(0)
+
+    def rows():
+        for i in range(n):
+            if rnd.random() < birthday_share:
+                m, day = d.month, d.day
+            else:
+                m, day = rnd.randint(1, 12), rnd.randint(1, 28)
+            yield (
+                f"user{i}@example.com",
+                rnd.randint(0, 2),
+                rnd.randint(0, 1),
+                rnd.randint(1950, 2010),
+                m,
+                day,
+                f"用户{i}" if rnd.random() < 0.5 else None,
+            )
+
+    with db.transaction() as conn:
+        conn.executemany(
+            "INSERT INTO users (email, frequency, salutation, birth_year, birth_month, birth_day, name) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            rows(),
+        )
+
+
+def db_queries(n: int, d: datetime.date, lookups: int) -> dict:
+    from backend import db
+
+    t = time.perf_counter()
+    recipients = sum(
+        len(batch)
+        for sal in ["哥哥", "姐姐"]
+        for batch in db.iter_email_batches(["monthly", "holiday"], sal, d)
+    )
+    scan = time.perf_counter() - t
+    t = time.perf_counter()
+    groups = sum(1 for _ in db.iter_birthday_groups(d))
+    birthdays = time.perf_counter() - t
+    rnd = random.Random(1)
+    emails = [f"user{rnd.randrange(n)}@example.com" for _ in range(lookups)]
+    t = time.perf_counter()
+    for e in emails:
+        db.get_user(e)
+    lookup = time.perf_counter() - t
+    return {
+        "general_recipients": recipients,
+        "general_scan_seconds": round(scan, 4),
+        "birthday_groups": groups,
+        "birthday_groups_seconds": round(birthdays, 4),
+        "get_user_per_second": round(lookups / lookup, 1),
+    }
+
+
+def _last_timings(d: datetime.date, section: str) -> dict:
+    path = os.path.join("cache", f"{d:%Y-%m-%d}.timings.json")
+    with open(path, "r", encoding="utf-8") as f:
+        runs = json.load(f)[section]
+    return runs[-1]
+
+
+def generate(d: datetime.date, model: FakeModelServer) -> dict:
+    from mailer.mailer import generate_today_cache
+
+    calls = model.calls
+    t = time.perf_counter()
+    cache = generate_today_cache()
+    elapsed = time.perf_counter() - t
+    run = _last_timings(d, "generate")
+    return {
+        "elapsed": round(elapsed, 4),
+        "items": len(cache["items"]),
+        "recipients": sum(len(i["recipients"]) for i in cache["items"]),
+        "model_calls": model.calls - calls,
+        "timings": run["timings"],
+        "counters": run["counters"],
+    }
+
+
+def send(d: datetime.date, sink: SMTPSink) -> dict:
+    from mailer.mailer import send_cached_for_today
+
+    before = sink.recipients, sink.messages, sink.connections
+    t = time.perf_counter()
+    send_cached_for_today()
+    elapsed = time.perf_counter() - t
+    run = _last_timings(d, "send")
+    sent = sink.recipients - before[0]
+    return {
+        "elapsed": round(elapsed, 4),
+        "recipients": sent,
+        "recipients_per_second": round(sent / elapsed, 1),
+        "messages": sink.messages - before[1],
+        "connections": sink.connections - before[2],
+        "sent": run.get("sent"),
+        "failed": run.get("failed"),
+        "shards": run.get("shards", 1),
+        "timings": run["timings"],
+    }
+
+
+def _call(method: str, url: str, body: dict | None = None):
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(
+        url, data=data, method=method, headers={"Content-Type": "application/json"}
+    )
+    t = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req) as r:
+            r.read()
+            status = r.status
+    except urllib.error.HTTPError as e:
+        e.read()
+        status = e.code
+    return time.perf_counter() - t, status
+
+
+def _load(clients: int, calls: list) -> dict:
+    t = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as ex:
+        res = list(ex.map(lambda c: _call(*c), calls))
+    elapsed = time.perf_counter() - t
+    out = _stats([lat for lat, _ in res], elapsed)
+    statuses = {}
+    for _, s in res:
+        statuses[str(s)] = statuses.get(str(s), 0) + 1
+    out["status"] = statuses
+    return out
+
+
+def api(requests: int, clients: int, port: int) -> dict:
+    from backend.app import app
+    from backend.mail_queue import verification_queue
+    from backend.verify import generate_code
+
+    server = serve(app, port)
+    base = f"http://127.0.0.1:{port}"
+    out = {}
+    try:
+        out["health"] = _load(clients, [("GET", base + "/health")] * requests)
+        out["verify_send"] = _load(
+            clients,
+            [
+                (
+                    "POST",
+                    base + "/verify/send",
+                    {"email": f"verify{i}@example.com", "action": "subscribe"},
+                )
+                for i in range(requests)
+            ],
+        )
+        codes = [
+            generate_code(f"new{i}@example.com", "subscribe") for i in range(requests)
+        ]
+        out["subscribe"] = _load(
+            clients,
+            [
+                (
+                    "POST",
+                    base + "/subscribe",
+                    {
+                        "email": f"new{i}@example.com",
+                        "frequency": "monthly",
+                        "salutation": "姐姐",
+                        "birthday": "1990/1/1",
+                        "code": code,
+                    },
+                )
+                for i, code in enumerate(codes)
+            ],
+        )
+        out["metrics"] = _load(clients, [("GET", base + "/metrics")] * 50)
+        t = time.perf_counter()
+        verification_queue.join()
+        out["verify_send"]["queue_drain_seconds"] = round(time.perf_counter() - t, 4)
+    finally:
+        server.should_exit = True
+    return out
+
+
+def run(args) -> dict:
+    n = SIZES.get(args.size.lower()) or int(args.size)
+    d = datetime.date.fromisoformat(args.date)
+    root = tempfile.mkdtemp(prefix="suite-")
+    os.chdir(root)
+    sys.path.insert(0, _ROOT)
+    os.environ.setdefault("CALENDAR_INDEX_DIR", os.path.join(root, "index"))
+    os.environ.update(
+        DB_PATH=os.path.join(root, "data", "data.db"),
+        GEN_CACHE="off",
+        GEN_CONCURRENCY=str(args.gen_concurrency),
+        IMG_RATE_PER_MINUTE="60000",
+        IMG_BURST=str(args.gen_concurrency),
+        SEND_SHARDS=str(args.shards),
+        METRICS="1",
+        RATE_LIMIT_IP="1000000/1",
+        RATE_LIMIT_SEND_IP="1000000/1",
+    )
+    holidays = {
+        f"{d + datetime.timedelta(days=i):%Y-%m-%d}": "基准节" for i in range(0, 8, 3)
+    }
+    result = {
+        "commit": _git("rev-parse", "HEAD"),
+        "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+        "started": datetime.datetime.now().isoformat(timespec="seconds"),
+        "size": args.size,
+        "users": n,
+        "date": args.date,
+        "machine": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "params": {
+            k: v for k, v in vars(args).items() if k not in ("cmd", "out", "func")
+        },
+        "scenarios": {},
+    }
+    scenarios = result["scenarios"]
+    scenarios["startup"] = startup.measure(args.startup_repeat, args.startup_scale)
+    print("startup measured")
+    with FakeModelServer(
+        args.chat_latency, args.image_latency
+    ) as model, FakeCalendarServer(holidays, args.calendar_latency) as cal, SMTPSink(
+        latency=args.smtp_latency
+    ) as sink:
+        os.environ.update(
+            MODEL_URL=model.url + "/v1",
+            MODEL_KEY="bench",
+            CALENDAR_API_URL=cal.url,
+            CALENDAR_API_KEY=cal.key,
+            SMTP_SERVER=sink.host,
+            SMTP_PORT=str(sink.port),
+            SMTP_SSL="0",
+            SMTP_EMAIL="bench@example.com",
+            SMTP_KEY="x",
+        )
+        from mailer import calendar_index, mailer
+
+        mailer._today = lambda: datetime.datetime(d.year, d.month, d.day)
+        for y in {d.year, (d + datetime.timedelta(days=8)).year}:
+            calendar_index.year_table(y)
+        t = time.perf_counter()
+        seed(n, d)
+        scenarios["seed"] = {
+            "elapsed": round(time.perf_counter() - t, 4),
+            "rows_per_second": round(n / (time.perf_counter() - t), 1),
+        }
+        print(f"seeded {n} users in {scenarios['seed']['elapsed']:.1f} s")
+        scenarios["db"] = db_queries(n, d, args.lookups)
+        print("db queries done")
+        scenarios["generate"] = generate(d, model)
+        scenarios["generate"]["calendar_calls"] = cal.calls
+        print(f"generate done in {scenarios['generate']['elapsed']:.1f} s")
+        scenarios["send"] = send(d, sink)
+        print(f"send done in {scenarios['send']['elapsed']:.1f} s")
+        scenarios["api"] = api(args.requests, args.clients, args.port)
+        print("api load done")
+    result["startup_ok"] = all(r["ok"] for r in scenarios["startup"].values())
+    result["elapsed"] = round(sum(s.get("elapsed", 0) for s in scenarios.values()), 4)
+    return result
+
+
+_HEADLINE = [
+    ("startup.api", "ms", -1),
+    ("startup.mailer", "ms", -1),
+    ("startup.clock", "ms", -1),
+    ("seed", "rows_per_second", 1),
+    ("db", "general_scan_seconds", -1),
+    ("db", "birthday_groups_seconds", -1),
+    ("db", "get_user_per_second", 1),
+    ("generate", "elapsed", -1),
+    ("send", "recipients_per_second", 1),
+    ("api.health", "rps", 1),
+    ("api.health", "p95_ms", -1),
+    ("api.verify_send", "rps", 1),
+    ("api.verify_send", "p95_ms", -1),
+    ("api.subscribe", "rps", 1),
+    ("api.subscribe", "p95_ms", -1),
+]
+
+
+def _get(result: dict, path: str, key: str):
+    node = result["scenarios"]
+    for part in path.split("."):
+        node = node.get(part, {})
+    return node.get(key)
+
+
+def summary(result: dict):
+    print(
+        f"commit {result['commit'][:10]}{' (dirty)' if result['dirty'] else ''}  users={result['users']}  cpus={result['machine']['cpus']}"
+    )
+    for path, key, _ in _HEADLINE:
+        v = _get(result, path, key)
+        if v is not None:
+            print(f"  {path + '.' + key:36} {v:>12}")
+    print("startup budget:")
+    startup.report(result["scenarios"]["startup"])
+
+
+def compare(a: dict, b: dict):
+    if a["users"] != b["users"] or a["machine"] != b["machine"]:
+        print("warning: runs differ in size or machine; numbers are not comparable")
+    print(f"{'metric':38} {a['commit'][:10]:>12} {b['commit'][:10]:>12}   change")
+    for path, key, better in _HEADLINE:
+        x, y = _get(a, path, key), _get(b, path, key)
+        if x is None or y is None:
+            continue
+        change = (y - x) / x * 100 if x else 0.0
+        mark = ""
+        if abs(change) >= 5:
+            mark = "  better" if change * better > 0 else "  worse"
+        print(f"{path + '.' + key:38} {x:>12} {y:>12} {change:+7.1f}%{mark}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    r = sub.add_parser("run")
+    r.add_argument("--size", default="1k")
+    r.add_argument("--out", default="")
+    r.add_argument("--date", default="2024-01-01")
+    r.add_argument("--chat-latency", type=float, default=0.05)
+    r.add_argument("--image-latency", type=float, default=0.1)
+    r.add_argument("--calendar-latency", type=float, default=0.02)
+    r.add_argument("--smtp-latency", type=float, default=0.005)
+    r.add_argument("--gen-concurrency", type=int, default=8)
+    r.add_argument("--shards", type=int, default=1)
+    r.add_argument("--lookups", type=int, default=10000)
+    r.add_argument("--requests", type=int, default=500)
+    r.add_argument("--clients", type=int, default=16)
+    r.add_argument("--port", type=int, default=8766)
+    r.add_argument("--startup-repeat", type=int, default=5)
+    r.add_argument("--startup-scale", type=float, default=1.0)
+    c = sub.add_parser("compare")
+    c.add_argument("base")
+    c.add_argument("head")
+    args = ap.parse_args()
+    if args.cmd == "compare":
+        with open(args.base, "r", encoding="utf-8") as f:
+            a = json.load(f)
+        with open(args.head, "r", encoding="utf-8") as f:
+            b = json.load(f)
+        compare(a, b)
+        return
+    out = os.path.abspath(args.out) if args.out else ""
+    result = run(args)
+    summary(result)
+    if out:
+        with open(out, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"results written to {out}")
+    if not result["startup_ok"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
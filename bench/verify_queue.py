@@ -0,0 +1,87 @@
+import os
+import json
+import time
+import argparse
+import tempfile
+import threading
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from .smtp_sink import SMTPSink
+
+
+def serve(app, port: int):
+    import uvicorn
+
+    server = uvicorn.Server(
+        uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning")
+    )
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return server
+
+
+def post(url: str, body: dict):
+    req = urllib.request.Request(
+        url,
+        data=json.dumps(body).encode(),
+        headers={"Content-Type": "application/json"},
+    )
+    t = time.perf_counter()
+    with urllib.request.urlopen(req) as r:
+        r.read()
+    return time.perf_counter() - t
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests", type=int, default=500)
+    ap.add_argument("--clients", type=int, default=32)
+    ap.add_argument("--smtp-latency", type=float, default=0.05)
+    ap.add_argument("--port", type=int, default=8765)
+    args = ap.parse_args()
+    tmp = tempfile.mkdtemp()
+    os.environ.update(
+        DB_PATH=os.path.join(tmp, "data.db"), RATE_LIMIT_SEND_IP="1000000/1"
+    )
+    with SMTPSink(latency=args.smtp_latency) as sink:
+        os.environ.update(
+            SMTP_SERVER=sink.host,
+            SMTP_PORT=str(sink.port),
+            SMTP_SSL="0",
+            SMTP_EMAIL="bench@example.com",
+            SMTP_KEY="x",
+        )
+        from backend.app import app
+        from backend.mail_queue import verification_queue
+
+        server = serve(app, args.port)
+        url = f"http://127.0.0.1:{args.port}/verify/send"
+        t = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.clients) as ex:
+            lat = sorted(
+                ex.map(
+                    lambda i: post(
+                        url, {"email": f"user{i}@example.com", "action": "subscribe"}
+                    ),
+                    range(args.requests),
+                )
+            )
+        accepted = time.perf_counter() - t
+        verification_queue.join()
+        drained = time.perf_counter() - t
+        stats = verification_queue.stats()
+        server.should_exit = True
+    print(f"requests:          {args.requests} from {args.clients} clients")
+    print(
+        f"request p50/p95:   {lat[len(lat) // 2] * 1000:.1f} / {lat[int(len(lat) * 0.95)] * 1000:.1f} ms"
+    )
+    print(f"accept throughput: {args.requests / accepted:.1f} req/s")
+    print(
+        f"queue drained in:  {drained:.2f} s ({sink.messages} mails, {sink.connections} SMTP connections)"
+    )
+    print(f"queue stats:       {json.dumps(stats)}")
+
+
+if __name__ == "__main__":
+    main()
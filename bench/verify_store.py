@@ -0,0 +1,39 @@
+import os
+import time
+import argparse
+import tempfile
+from backend.verify import MemoryCodeStore, SqliteCodeStore
+
+
+def run(store, n: int):
+    emails = [f"user{i}@example.com" for i in range(n)]
+    t = time.perf_counter()
+    codes = [store.issue(e, "subscribe") for e in emails]
+    issue = time.perf_counter() - t
+    outstanding = len(store)
+    t = time.perf_counter()
+    ok = sum(store.check(e, "subscribe", c) for e, c in zip(emails, codes))
+    check = time.perf_counter() - t
+    assert ok == n, ok
+    return issue, check, outstanding
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--codes", type=int, default=100000)
+    args = ap.parse_args()
+    stores = {
+        "memory": MemoryCodeStore(resend=0, max_size=args.codes, sweep_interval=0),
+        "sqlite": SqliteCodeStore(
+            path=os.path.join(tempfile.mkdtemp(), "verify.db"), resend=0
+        ),
+    }
+    for name, store in stores.items():
+        issue, check, outstanding = run(store, args.codes)
+        print(
+            f"{name:7} outstanding={outstanding:7}  generate {args.codes / issue:10.0f}/s  verify {args.codes / check:10.0f}/s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,65 @@
-from mailer.mailer import generate_today_cache, send_cached_for_today
-import datetime
-import time
+import os
+from mailer.scheduler import Scheduler, Task
+
+
+def generate_today_cache():
+    from mailer.mailer import generate_today_cache
+
+    return generate_today_cache()
+
+
+def generate_lookahead():
+    from mailer.mailer import generate_lookahead
+
+    return generate_lookahead()
+
+
+def collect_artifacts():
+    from mailer.artifacts import gc
+
+    return gc()
+
+
+def send_cached_for_today():
+    from mailer.mailer import send_cached_for_today
+
+    return send_cached_for_today()
+
 
 tasks = [
-    ((6, 0, 0), generate_today_cache),
-    ((8, 0, 0), send_cached_for_today),
+    Task(
+        "generate",
+        generate_today_cache,
+        os.environ.get("GENERATE_SCHEDULE", "0 6 * * *"),
+        timeout=float(os.environ.get("GENERATE_TIMEOUT", "7200")),
+        retries=2,
+        catchup=18 * 3600,
+    ),
+    Task(
+        "send",
+        send_cached_for_today,
+        os.environ.get("SEND_SCHEDULE", "0 8 * * *"),
+        after=["generate"],
+        timeout=float(os.environ.get("SEND_TIMEOUT", "14400")),
+        retries=2,
+        catchup=16 * 3600,
+    ),
+    Task(
+        "lookahead",
+        generate_lookahead,
+        os.environ.get("LOOKAHEAD_SCHEDULE", "0 1 * * *"),
+        timeout=float(os.environ.get("LOOKAHEAD_BUDGET", "14400")) + 3600,
+        retries=1,
+        catchup=3 * 3600,
+    ),
+    Task(
+        "gc",
+        collect_artifacts,
+        os.environ.get("ARTIFACT_GC_SCHEDULE", "30 3 * * *"),
+        timeout=3600,
+        catchup=24 * 3600,
+    ),
 ]
 
-while True:
-    for (hh, mm, ss), task in tasks:
-        now = datetime.datetime.now()
-        if now.hour * 3600 + now.minute * 60 + now.second < hh * 3600 + mm * 60 + ss:
-            target = now.replace(hour=hh, minute=mm, second=ss, microsecond=0)
-            delta = (target - now).total_seconds()
-            print(
-                f"Sleeping for {delta} seconds until {hh:02}:{mm:02}:{ss:02} to run {task.__name__}"
-            )
-            time.sleep(delta)
-            print(f"Running task {task.__name__} at {datetime.datetime.now()}")
-            task()
-    # wait for next day
-    now = datetime.datetime.now()
-    target = now.replace(
-        hour=0, minute=0, second=0, microsecond=0
-    ) + datetime.timedelta(days=1)
-    delta = (target - now).total_seconds()
-    print(f"Sleeping for {delta} seconds until midnight for next day's tasks")
-    time.sleep(delta)
+if __name__ == "__main__":
+    Scheduler(tasks).run()
@@ -8,3 +8,65 @@ export SMTP_EMAIL="yourforeversister@qq.com"
 export SMTP_KEY=""
 export CALENDAR_API_URL=""
 export CALENDAR_API_KEY=""
+export SMTP_SSL=1
+export SMTP_POOL_SIZE=4
+export SMTP_BATCH_SIZE=30
+export SMTP_RETRIES=3
+export GEN_CONCURRENCY=4
+export IMG_RATE_PER_MINUTE=1.7
+export IMG_BURST=1
+export CALENDAR_CACHE_TTL=21600
+export VERIFY_MAIL_WORKERS=2
+export VERIFY_QUEUE_SIZE=10000
+export VERIFY_STORE=memory
+export VERIFY_MAX_CODES=100000
+export VERIFY_MAX_ATTEMPTS=5
+export VERIFY_RESEND_SECONDS=60
+export VERIFY_MAIL_MAX_WAIT=120
+export DB_BUSY_TIMEOUT=5000
+export GEN_CACHE=on
+export GEN_CACHE_MAX_BYTES=2147483648
+export HTTP_RETRIES=3
+export HTTP_BACKOFF=0.5
+export HTTP_POOL_SIZE=16
+export CB_THRESHOLD=5
+export CB_COOLDOWN=60
+export MAIL_IMAGE_FORMAT=""
+export MAIL_IMAGE_WIDTH=0
+export MAIL_IMAGE_QUALITY=85
+export GENERATE_SCHEDULE="0 6 * * *"
+export SEND_SCHEDULE="0 8 * * *"
+export GENERATE_TIMEOUT=7200
+export SEND_TIMEOUT=14400
+export SCHEDULER_WORKERS=4
+export SCHEDULER_CATCHUP=43200
+export SEND_SHARDS=1
+export SEND_PROCESSES=0
+export GEN_PERSONALIZE=0
+export GEN_PRICE_PROMPT=0
+export GEN_PRICE_COMPLETION=0
+export GEN_PRICE_IMAGE=0
+export METRICS=1
+export DB_MIGRATE_BATCH=5000
+export DB_MIGRATE_PAUSE=0.01
+export LOOKAHEAD_SCHEDULE="0 1 * * *"
+export LOOKAHEAD_DAYS=3
+export LOOKAHEAD_BUDGET=14400
+export ARTIFACT_STORE=pack
+export ARTIFACT_RETENTION_DAYS=90
+export ARTIFACT_COMPACT_RATIO=0.25
+export ARTIFACT_GC_SCHEDULE="30 3 * * *"
+export RATE_LIMIT=1
+export RATE_LIMIT_STORE=memory
+export RATE_LIMIT_MAX_KEYS=100000
+export RATE_LIMIT_PROXY=0
+export RATE_LIMIT_IP="30/60"
+export RATE_LIMIT_EMAIL="10/600"
+export RATE_LIMIT_SEND_IP="5/60"
+export RATE_LIMIT_SEND_EMAIL="3/600"
+export SMTP_PER_MINUTE=40
+export SMTP_PER_HOUR=1000
+export SMTP_PER_DAY=10000
+export SMTP_PRIORITY_RESERVE=0.1
+export SMTP_SEND_WINDOW=12600
+export SMTP_BACKLOG_DAYS=3
@@ -0,0 +1,320 @@
+import os
+import re
+import json
+import mmap
+import fcntl
+import struct
+import hashlib
+import datetime
+import threading
+from contextlib import contextmanager
+from backend import metrics
+
+_MAGIC = b"YFSA"
+_HEAD = struct.Struct(">4sc32sQH")
+_DATE = re.compile(r"(\d{4}-\d{2}-\d{2})")
+
+
+def _mode():
+    return os.environ.get("ARTIFACT_STORE", "pack")
+
+
+def _root():
+    return os.environ.get("ARTIFACT_DIR", os.path.join(os.getcwd(), "cache", "store"))
+
+
+def _retention_days():
+    return int(os.environ.get("ARTIFACT_RETENTION_DAYS", "90"))
+
+
+def _compact_ratio():
+    return float(os.environ.get("ARTIFACT_COMPACT_RATIO", "0.25"))
+
+
+@contextmanager
+def _locked(path: str):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    while True:
+        f = open(path, "ab")
+        fcntl.flock(f, fcntl.LOCK_EX)
+        if os.fstat(f.fileno()).st_ino == os.stat(path).st_ino:
+            break
+        f.close()
+    try:
+        yield f
+    finally:
+        f.close()
+
+
+class Pack:
+    def __init__(self, path: str):
+        self.path = path
+        self.blobs: dict[bytes, tuple[int, int, str]] = {}
+        self.names: dict[str, bytes] = {}
+        self.size = 0
+        self._stat = None
+        self._mm = None
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        self.blobs.clear()
+        self.names.clear()
+        self.size = 0
+        self._mm = None
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            self._stat = None
+            return
+        self._stat = (st.st_ino, st.st_size)
+        with open(self.path, "rb") as f:
+            self._scan(f, 0)
+
+    def _scan(self, f, offset: int):
+        total = os.fstat(f.fileno()).st_size
+        f.seek(offset)
+        while True:
+            head = f.read(_HEAD.size)
+            if len(head) < _HEAD.size:
+                break
+            magic, kind, digest, length, meta_len = _HEAD.unpack(head)
+            meta = f.read(meta_len)
+            if magic != _MAGIC or len(meta) < meta_len:
+                break
+            start = offset + _HEAD.size + meta_len
+            if start + length > total:
+                break
+            f.seek(length, os.SEEK_CUR)
+            if kind == b"B":
+                self.blobs[digest] = (start, length, meta.decode("utf-8"))
+            else:
+                self.names[meta.decode("utf-8")] = digest
+            offset = start + length
+        self.size = offset
+
+    def _refresh(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        if self._stat == (st.st_ino, st.st_size):
+            return
+        if self._stat and self._stat[0] == st.st_ino and st.st_size >= self.size:
+            with open(self.path, "rb") as f:
+                self._scan(f, self.size)
+            self._stat = (st.st_ino, st.st_size)
+            self._mm = None
+        else:
+            self._load()
+
+    def _append(self, records: list[tuple[bytes, bytes, bytes, bytes]]):
+        with _locked(self.path) as f:
+            self._refresh()
+            end = self.size
+            f.truncate(end)
+            for kind, digest, meta, data in records:
+                f.write(_HEAD.pack(_MAGIC, kind, digest, len(data), len(meta)))
+                f.write(meta)
+                f.write(data)
+                start = end + _HEAD.size + len(meta)
+                if kind == b"B":
+                    self.blobs[digest] = (start, len(data), meta.decode("utf-8"))
+                else:
+                    self.names[meta.decode("utf-8")] = digest
+                end = start + len(data)
+            f.flush()
+            os.fsync(f.fileno())
+        self.size = end
+        st = os.stat(self.path)
+        self._stat = (st.st_ino, st.st_size)
+
+    def put(self, name: str, data: bytes, ctype: str) -> str:
+        digest = hashlib.sha256(data).digest()
+        with self._lock:
+            self._refresh()
+            records = []
+            if digest in self.blobs:
+                metrics.inc("artifact_puts", result="dedupe")
+            else:
+                metrics.inc("artifact_puts", result="new")
+                records.append((b"B", digest, ctype.encode("utf-8"), data))
+            if self.names.get(name) != digest:
+                records.append((b"N", digest, name.encode("utf-8"), b""))
+            if records:
+                with metrics.timer("file_write_seconds", kind="artifact"):
+                    self._append(records)
+        return digest.hex()
+
+    def view(self, digest: str) -> tuple[memoryview, str] | None:
+        key = bytes.fromhex(digest)
+        with self._lock:
+            if key not in self.blobs:
+                self._refresh()
+            entry = self.blobs.get(key)
+            if entry is None:
+                return None
+            start, length, ctype = entry
+            if self._mm is None or len(self._mm) < start + length:
+                with open(self.path, "rb") as f:
+                    self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            return memoryview(self._mm)[start : start + length], ctype
+
+    def _live(self) -> set[bytes]:
+        live = set(self.names.values())
+        with open(self.path, "rb") as f:
+            for digest in list(live):
+                start, length, ctype = self.blobs.get(digest, (0, 0, ""))
+                if ctype != "application/json":
+                    continue
+                f.seek(start)
+                for item in json.loads(f.read(length)).get("items", []):
+                    if item.get("image_digest"):
+                        live.add(bytes.fromhex(item["image_digest"]))
+        return live
+
+    def garbage(self) -> float:
+        with self._lock:
+            self._refresh()
+            live = self._live()
+            dead = sum(n for d, (_, n, _) in self.blobs.items() if d not in live)
+            return dead / self.size if self.size else 0.0
+
+    def compact(self) -> int:
+        tmp = self.path + ".compact"
+        with _locked(self.path), self._lock:
+            self._refresh()
+            before = self.size
+            live = self._live()
+            with open(self.path, "rb") as src, open(tmp, "wb") as dst:
+                for digest, (start, length, ctype) in self.blobs.items():
+                    if digest not in live:
+                        continue
+                    meta = ctype.encode("utf-8")
+                    dst.write(_HEAD.pack(_MAGIC, b"B", digest, length, len(meta)))
+                    dst.write(meta)
+                    src.seek(start)
+                    dst.write(src.read(length))
+                for name, digest in self.names.items():
+                    meta = name.encode("utf-8")
+                    dst.write(_HEAD.pack(_MAGIC, b"N", digest, 0, len(meta)))
+                    dst.write(meta)
+                dst.flush()
+                os.fsync(dst.fileno())
+            os.replace(tmp, self.path)
+            self._load()
+            return before - self.size
+
+
+class ArtifactStore:
+    def __init__(self, root: str | None = None):
+        self.root = root or _root()
+        self._packs: dict[str, Pack] = {}
+        self._lock = threading.Lock()
+
+    def _pack(self, date: str) -> Pack:
+        month = date[:7]
+        pack = self._packs.get(month)
+        if pack is None:
+            with self._lock:
+                pack = self._packs.get(month)
+                if pack is None:
+                    pack = self._packs[month] = Pack(
+                        os.path.join(self.root, f"{month}.pack")
+                    )
+        return pack
+
+    def put(self, date: str, name: str, data: bytes, ctype: str) -> str:
+        return self._pack(date).put(f"{name}/{date}", data, ctype)
+
+    def put_file(self, date: str, name: str, path: str, ctype: str) -> str:
+        with open(path, "rb") as f:
+            return self.put(date, name, f.read(), ctype)
+
+    def get(self, date: str, digest: str) -> memoryview | None:
+        res = self._pack(date).view(digest)
+        return res[0] if res else None
+
+    def has(self, date: str, digest: str) -> bool:
+        return self._pack(date).view(digest) is not None
+
+    def put_json(self, date: str, name: str, obj) -> str:
+        data = json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+        return self.put(date, name, data.encode("utf-8"), "application/json")
+
+    def get_json(self, date: str, name: str):
+        pack = self._pack(date)
+        with pack._lock:
+            pack._refresh()
+            digest = pack.names.get(f"{name}/{date}")
+        if digest is None:
+            return None
+        view = self.get(date, digest.hex())
+        return json.loads(bytes(view)) if view is not None else None
+
+    def months(self) -> list[str]:
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(
+            e.name[: -len(".pack")]
+            for e in os.scandir(self.root)
+            if e.name.endswith(".pack")
+        )
+
+    def prune(self, before: str) -> list[str]:
+        removed = []
+        for month in self.months():
+            if month < before[:7]:
+                os.unlink(os.path.join(self.root, f"{month}.pack"))
+                with self._lock:
+                    self._packs.pop(month, None)
+                removed.append(month)
+        return removed
+
+    def compact(self, ratio: float | None = None) -> dict[str, int]:
+        ratio = _compact_ratio() if ratio is None else ratio
+        out = {}
+        for month in self.months():
+            pack = self._pack(month)
+            if pack.garbage() >= ratio:
+                out[month] = pack.compact()
+        return out
+
+
+def gc(today: datetime.date | None = None, cache_dir: str = "cache") -> dict:
+    today = today or datetime.date.today()
+    cutoff = (today - datetime.timedelta(days=_retention_days())).isoformat()
+    store = get_store()
+    removed_files = 0
+    if os.path.isdir(cache_dir):
+        for e in os.scandir(cache_dir):
+            m = _DATE.search(e.name)
+            if e.is_file() and m and m.group(1) < cutoff:
+                os.unlink(e.path)
+                removed_files += 1
+    with metrics.timer("artifact_gc_seconds"):
+        report = {
+            "cutoff": cutoff,
+            "files": removed_files,
+            "packs": store.prune(cutoff),
+            "compacted": store.compact(),
+        }
+    print(
+        f"Artifact gc: removed {removed_files} files and {len(report['packs'])} packs before {cutoff}, "
+        f"reclaimed {sum(report['compacted'].values())} bytes by compaction"
+    )
+    return report
+
+
+_store = None
+
+
+def enabled() -> bool:
+    return _mode() != "off"
+
+
+def get_store() -> ArtifactStore:
+    global _store
+    if _store is None:
+        _store = ArtifactStore()
+    return _store
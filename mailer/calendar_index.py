@@ -0,0 +1,184 @@
+import os
+import json
+import time
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from . import clients
+from .manifest import atomic_write_json
+
+_VERSION = 1
+_lock = threading.Lock()
+_years: dict[int, dict[str, dict]] = {}
+_remote: dict[str, dict] | None = None
+
+
+def _csv_path():
+    return os.path.join(os.getcwd(), "data", "festivals.csv")
+
+
+def _index_dir():
+    return os.environ.get("CALENDAR_INDEX_DIR", os.path.join(os.getcwd(), "cache"))
+
+
+def _remote_ttl():
+    return float(os.environ.get("CALENDAR_CACHE_TTL", "21600"))
+
+
+def _csv_signature(path: str):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+
+def _read_csv(path: str) -> dict[str, list[str]]:
+    out: dict[str, list[str]] = {}
+    if not os.path.isfile(path):
+        return out
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            parts = line.split(",")
+            if len(parts) >= 2:
+                out.setdefault(parts[0], []).append(parts[1])
+    return out
+
+
+def _safe(fn):
+    try:
+        return fn() or []
+    except Exception:
+        return []
+
+
+def build_year(year: int) -> dict[str, dict]:
+    from lunar_python import Solar
+
+    csv = _read_csv(_csv_path())
+    days = {}
+    d = datetime.date(year, 1, 1)
+    while d.year == year:
+        lunar = Solar.fromYmd(d.year, d.month, d.day).getLunar()
+        festivals = list(_safe(lunar.getFestivals))
+        jq = _safe(lunar.getJieQi)
+        jq = [jq] if jq else []
+        entry = {}
+        holiday = festivals + list(_safe(lunar.getOtherFestivals)) + jq
+        if holiday:
+            entry["holiday"] = holiday[0]
+        if jq or festivals:
+            entry["event"] = (jq + festivals)[0]
+        if d.strftime("%m-%d") in csv:
+            entry["csv"] = csv[d.strftime("%m-%d")]
+        if entry:
+            days[d.isoformat()] = entry
+        d += datetime.timedelta(days=1)
+    return days
+
+
+def year_table(year: int) -> dict[str, dict]:
+    table = _years.get(year)
+    if table is not None:
+        return table
+    with _lock:
+        if year in _years:
+            return _years[year]
+        path = os.path.join(_index_dir(), f"calendar-{year}.json")
+        sig = _csv_signature(_csv_path())
+        table = None
+        if os.path.isfile(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    j = json.load(f)
+                if j.get("version") == _VERSION and j.get("csv") == sig:
+                    table = j["days"]
+            except (OSError, ValueError, KeyError):
+                table = None
+        if table is None:
+            table = build_year(year)
+            atomic_write_json(path, {"version": _VERSION, "csv": sig, "days": table})
+        _years[year] = table
+        return table
+
+
+def lookup(d) -> dict:
+    return year_table(d.year).get(d.strftime("%Y-%m-%d"), {})
+
+
+def window(start, days: int):
+    out = []
+    for i in range(days):
+        d = start + datetime.timedelta(days=i)
+        out.append((d.strftime("%Y-%m-%d"), lookup(d)))
+    return out
+
+
+def _remote_path():
+    return os.path.join(_index_dir(), "calendar-remote.json")
+
+
+def _remote_cache():
+    global _remote
+    if _remote is None:
+        try:
+            with open(_remote_path(), "r", encoding="utf-8") as f:
+                _remote = json.load(f)
+        except (OSError, ValueError):
+            _remote = {}
+    return _remote
+
+
+def _parse_remote(j: dict):
+    for k in ["holiday", "festival", "data", "events", "holidays"]:
+        v = j.get(k)
+        if isinstance(v, list) and len(v) > 0:
+            x = v[0]
+            name = x.get("name") or x.get("title") or x.get("festival")
+            if name:
+                return name
+    return j.get("name") or j.get("title")
+
+
+def _fetch_remote(url: str, key: str, date: str):
+    r = clients.request("calendar", "GET", url, params={"date": date, "key": key})
+    if r.status_code != 200:
+        raise RuntimeError(f"calendar api returned {r.status_code}")
+    return _parse_remote(r.json())
+
+
+def remote_names(dates: list[str], url: str, key: str) -> dict[str, str | None]:
+    now = time.time()
+    ttl = _remote_ttl()
+    with _lock:
+        cache = _remote_cache()
+        res = {
+            d: cache[d]["name"]
+            for d in dates
+            if d in cache and now - cache[d]["at"] < ttl
+        }
+    missing = [d for d in dates if d not in res]
+    if not missing:
+        return res
+
+    def fetch(d):
+        try:
+            return d, _fetch_remote(url, key, d), True
+        except Exception:
+            return d, None, False
+
+    with ThreadPoolExecutor(max_workers=len(missing)) as ex:
+        fetched = list(ex.map(fetch, missing))
+    with _lock:
+        cache = _remote_cache()
+        for d, name, ok in fetched:
+            res[d] = name
+            if ok:
+                cache[d] = {"name": name, "at": now}
+        for d in [d for d, v in cache.items() if now - v["at"] >= ttl]:
+            del cache[d]
+        atomic_write_json(_remote_path(), cache)
+    return res
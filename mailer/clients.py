@@ -0,0 +1,234 @@
+import os
+import time
+import random
+import threading
+from typing import TYPE_CHECKING
+from backend import metrics as _metrics
+
+if TYPE_CHECKING:
+    import requests
+
+_IDEMPOTENT = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+_TIMEOUTS = {"chat": 120, "image": 60, "download": 60, "calendar": 15}
+_lock = threading.Lock()
+_session = None
+_openai = None
+_endpoints: dict[str, "Endpoint"] = {}
+
+
+class CircuitOpen(RuntimeError):
+    pass
+
+
+class RetryableStatus(RuntimeError):
+    def __init__(self, response):
+        super().__init__(f"{response.status_code} from {response.url}")
+        self.response = response
+
+
+def _retryable(e: Exception) -> bool:
+    if isinstance(e, RetryableStatus):
+        return True
+    if type(e).__module__.startswith("requests."):
+        import requests
+
+        if isinstance(e, (requests.ConnectionError, requests.Timeout)):
+            return True
+    status = getattr(e, "status_code", None)
+    if status is not None:
+        return status == 429 or status >= 500
+    name = type(e).__name__
+    return name in ("APIConnectionError", "APITimeoutError")
+
+
+def _unsent(e: Exception) -> bool:
+    if isinstance(e, RetryableStatus):
+        return e.response.status_code in (429, 503)
+    if not type(e).__module__.startswith("requests."):
+        return False
+    import requests
+    from urllib3.exceptions import NewConnectionError
+
+    if isinstance(e, requests.ConnectTimeout):
+        return True
+    if not isinstance(e, requests.ConnectionError) or not e.args:
+        return False
+    return isinstance(getattr(e.args[0], "reason", None), NewConnectionError)
+
+
+class Endpoint:
+    def __init__(
+        self,
+        name: str,
+        timeout: float | None = None,
+        retries: int | None = None,
+        threshold: int | None = None,
+        cooldown: float | None = None,
+        sleep=time.sleep,
+    ):
+        env = name.upper()
+        self.name = name
+        self.timeout = timeout or float(
+            os.environ.get(f"HTTP_TIMEOUT_{env}", _TIMEOUTS.get(name, 30))
+        )
+        self.retries = (
+            int(os.environ.get("HTTP_RETRIES", "3")) if retries is None else retries
+        )
+        self.backoff = float(os.environ.get("HTTP_BACKOFF", "0.5"))
+        self.backoff_max = float(os.environ.get("HTTP_BACKOFF_MAX", "20"))
+        self.threshold = threshold or int(os.environ.get("CB_THRESHOLD", "5"))
+        self.cooldown = cooldown or float(os.environ.get("CB_COOLDOWN", "60"))
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._consecutive = 0
+        self._opened_at = None
+        self._trial = False
+        self.calls = 0
+        self.failures = 0
+        self.retried = 0
+        self.rejected = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def _admit(self):
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if time.monotonic() - self._opened_at < self.cooldown or self._trial:
+                self.rejected += 1
+                _metrics.inc("http_client_rejected", endpoint=self.name)
+                raise CircuitOpen(f"circuit open for {self.name}")
+            self._trial = True
+
+    def _record(self, ok: bool, elapsed: float):
+        with self._lock:
+            self.calls += 1
+            self.latency_total += elapsed
+            self.latency_max = max(self.latency_max, elapsed)
+            self._trial = False
+            if ok:
+                self._consecutive = 0
+                self._opened_at = None
+                return
+            self.failures += 1
+            self._consecutive += 1
+            if self._consecutive >= self.threshold:
+                self._opened_at = time.monotonic()
+
+    def call(self, fn, *args, **kwargs):
+        return self._call(fn, _retryable, args, kwargs)
+
+    def call_once(self, fn, *args, **kwargs):
+        return self._call(fn, _unsent, args, kwargs)
+
+    def _call(self, fn, retryable, args, kwargs):
+        attempt = 0
+        while True:
+            self._admit()
+            t = time.perf_counter()
+            try:
+                res = fn(*args, **kwargs)
+            except Exception as e:
+                elapsed = time.perf_counter() - t
+                self._record(False, elapsed)
+                _metrics.observe(
+                    "http_client_seconds", elapsed, endpoint=self.name, outcome="error"
+                )
+                if not retryable(e) or attempt >= self.retries:
+                    raise
+                with self._lock:
+                    self.retried += 1
+                _metrics.inc("http_client_retries", endpoint=self.name)
+                delay = min(self.backoff_max, self.backoff * 2**attempt)
+                self._sleep(random.uniform(0, delay))
+                attempt += 1
+                continue
+            elapsed = time.perf_counter() - t
+            self._record(True, elapsed)
+            _metrics.observe(
+                "http_client_seconds", elapsed, endpoint=self.name, outcome="ok"
+            )
+            return res
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "failures": self.failures,
+                "retries": self.retried,
+                "rejected": self.rejected,
+                "latency_avg": self.latency_total / self.calls if self.calls else 0.0,
+                "latency_max": self.latency_max,
+                "open": self._opened_at is not None,
+            }
+
+
+def endpoint(name: str) -> Endpoint:
+    ep = _endpoints.get(name)
+    if ep is None:
+        with _lock:
+            ep = _endpoints.setdefault(name, Endpoint(name))
+    return ep
+
+
+def session() -> "requests.Session":
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                size = int(os.environ.get("HTTP_POOL_SIZE", "16"))
+                s = requests.Session()
+                adapter = HTTPAdapter(pool_connections=size, pool_maxsize=size)
+                s.mount("http://", adapter)
+                s.mount("https://", adapter)
+                _session = s
+    return _session
+
+
+def openai_client():
+    global _openai
+    if _openai is None:
+        timeout = endpoint("chat").timeout
+        with _lock:
+            if _openai is None:
+                from openai import OpenAI
+
+                _openai = OpenAI(
+                    api_key=os.environ.get("MODEL_KEY", ""),
+                    base_url=os.environ.get("MODEL_URL", ""),
+                    timeout=timeout,
+                    max_retries=0,
+                )
+    return _openai
+
+
+def request(name: str, method: str, url: str, **kwargs) -> "requests.Response":
+    ep = endpoint(name)
+
+    def send():
+        r = session().request(method, url, timeout=ep.timeout, **kwargs)
+        if r.status_code == 429 or r.status_code >= 500:
+            r.close()
+            raise RetryableStatus(r)
+        return r
+
+    if method.upper() in _IDEMPOTENT:
+        return ep.call(send)
+    return ep.call_once(send)
+
+
+def metrics() -> dict:
+    return {name: ep.snapshot() for name, ep in list(_endpoints.items())}
+
+
+def reset():
+    global _session, _openai
+    with _lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+        _openai = None
+        _endpoints.clear()
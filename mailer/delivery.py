@@ -0,0 +1,57 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from backend.smtp import SMTPPool, send_batch
+
+
+def default_batch_size():
+    return max(1, int(os.environ.get("SMTP_BATCH_SIZE", "50")))
+
+
+def batches(recipients: list[str], size: int | None = None):
+    size = size or default_batch_size()
+    for i in range(0, len(recipients), size):
+        yield recipients[i : i + size]
+
+
+def deliver(
+    pool: SMTPPool,
+    sender: str,
+    recipients: list[str],
+    build,
+    batch_size: int | None = None,
+    retries: int | None = None,
+    skip=(),
+    on_batch=None,
+    shaper=None,
+    deadline: float | None = None,
+):
+    report = {"sent": 0, "skipped": 0, "deferred": 0, "refused": {}, "failed": []}
+
+    def run(index, batch):
+        if shaper is not None and not shaper.acquire(len(batch), deadline=deadline):
+            return None
+        refused = send_batch(pool, sender, batch, build(batch), retries)
+        if on_batch is not None:
+            on_batch(index, batch, refused)
+        return refused
+
+    with ThreadPoolExecutor(max_workers=pool.size) as ex:
+        jobs = []
+        for i, batch in enumerate(batches(recipients, batch_size)):
+            if i in skip:
+                report["skipped"] += len(batch)
+                continue
+            jobs.append((batch, ex.submit(run, i, batch)))
+        for batch, fut in jobs:
+            try:
+                refused = fut.result()
+            except Exception as e:
+                report["failed"].append({"recipients": batch, "error": repr(e)})
+                continue
+            if refused is None:
+                report["deferred"] += len(batch)
+                continue
+            for addr, (code, _) in refused.items():
+                report["refused"][addr] = code
+            report["sent"] += len(batch) - len(refused)
+    return report
@@ -0,0 +1,162 @@
+import os
+import json
+import shutil
+import hashlib
+import threading
+from backend import metrics
+from .manifest import atomic_write_bytes
+
+
+def _mode():
+    return os.environ.get("GEN_CACHE", "on")
+
+
+def _root():
+    return os.environ.get("GEN_CACHE_DIR", os.path.join(os.getcwd(), "cache", "gen"))
+
+
+def _max_bytes():
+    return int(os.environ.get("GEN_CACHE_MAX_BYTES", str(2 * 1024**3)))
+
+
+class CacheMiss(RuntimeError):
+    pass
+
+
+class GenCache:
+    def __init__(
+        self,
+        root: str | None = None,
+        max_bytes: int | None = None,
+        mode: str | None = None,
+    ):
+        self.root = root or _root()
+        self.max_bytes = max_bytes or _max_bytes()
+        self.mode = mode or _mode()
+        self.hits = 0
+        self.misses = 0
+        self._size = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(parts: dict) -> str:
+        raw = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key)
+
+    def _files(self):
+        for sub in os.scandir(self.root):
+            if sub.is_dir():
+                for e in os.scandir(sub.path):
+                    if e.is_file() and not e.name.startswith("."):
+                        yield e
+
+    def _total(self) -> int:
+        if self._size is None:
+            self._size = 0
+            if os.path.isdir(self.root):
+                self._size = sum(e.stat().st_size for e in self._files())
+        return self._size
+
+    def get(self, key: str) -> bytes | None:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def put(self, key: str, data: bytes):
+        atomic_write_bytes(self._path(key), data)
+        with self._lock:
+            self._size = self._total() + len(data)
+            if self._size > self.max_bytes:
+                self.evict()
+
+    def evict(self, target: float = 0.9):
+        entries = sorted(
+            ((e.stat().st_mtime, e.stat().st_size, e.path) for e in self._files()),
+        )
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes * target:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            total -= size
+        self._size = total
+
+    def cached(self, parts: dict, produce) -> bytes:
+        if self.mode == "off":
+            return produce()
+        key = self.key(parts)
+        data = self.get(key)
+        if data is not None:
+            with self._lock:
+                self.hits += 1
+            metrics.inc("gen_cache", kind=parts.get("kind"), result="hit")
+            return data
+        with self._lock:
+            self.misses += 1
+        metrics.inc("gen_cache", kind=parts.get("kind"), result="miss")
+        if self.mode == "replay":
+            raise CacheMiss(f"generation cache miss for {parts.get('kind')} {key}")
+        data = produce()
+        self.put(key, data)
+        return data
+
+    def cached_file(self, parts: dict, produce, dest: str):
+        if self.mode == "off":
+            return produce(dest)
+        key = self.key(parts)
+        src = self._path(key)
+        if os.path.isfile(src):
+            _link(src, dest)
+            try:
+                os.utime(src)
+            except OSError:
+                pass
+            with self._lock:
+                self.hits += 1
+            metrics.inc("gen_cache", kind=parts.get("kind"), result="hit")
+            return
+        with self._lock:
+            self.misses += 1
+        metrics.inc("gen_cache", kind=parts.get("kind"), result="miss")
+        if self.mode == "replay":
+            raise CacheMiss(f"generation cache miss for {parts.get('kind')} {key}")
+        produce(dest)
+        _link(dest, src)
+        with self._lock:
+            self._size = self._total() + os.path.getsize(src)
+            if self._size > self.max_bytes:
+                self.evict()
+
+
+def _link(src: str, dest: str):
+    os.makedirs(os.path.dirname(dest) or ".", exist_ok=True)
+    tmp = f"{dest}.{threading.get_ident()}.tmp"
+    try:
+        os.link(src, tmp)
+    except OSError:
+        shutil.copyfile(src, tmp)
+    os.replace(tmp, dest)
+
+
+_cache = None
+
+
+def get_cache() -> GenCache:
+    global _cache
+    if _cache is None:
+        _cache = GenCache()
+    return _cache
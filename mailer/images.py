@@ -0,0 +1,107 @@
+import os
+import tempfile
+from . import clients
+
+_EXT = {
+    "image/png": ".png",
+    "image/jpeg": ".jpg",
+    "image/webp": ".webp",
+    "image/gif": ".gif",
+}
+_PIL_FORMATS = {
+    "jpeg": "image/jpeg",
+    "jpg": "image/jpeg",
+    "webp": "image/webp",
+    "png": "image/png",
+}
+
+
+def sniff(path: str, fallback: str = "image/png") -> str:
+    with open(path, "rb") as f:
+        head = f.read(16)
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head[:3] == b"\xff\xd8\xff":
+        return "image/jpeg"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    return fallback
+
+
+def extension(content_type: str) -> str:
+    return _EXT.get(content_type, ".bin")
+
+
+def _tmp_path(path: str) -> str:
+    d = os.path.dirname(path) or "."
+    os.makedirs(d, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=d, prefix=".tmp-")
+    os.close(fd)
+    return tmp
+
+
+def download(url: str, path: str, chunk: int = 64 * 1024) -> str:
+    ep = clients.endpoint("download")
+
+    def fetch():
+        with clients.session().get(url, stream=True, timeout=ep.timeout) as r:
+            if r.status_code == 429 or r.status_code >= 500:
+                raise clients.RetryableStatus(r)
+            r.raise_for_status()
+            tmp = _tmp_path(path)
+            try:
+                with open(tmp, "wb") as f:
+                    for block in r.iter_content(chunk):
+                        f.write(block)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp, path)
+            except BaseException:
+                if os.path.exists(tmp):
+                    os.unlink(tmp)
+                raise
+            return r.headers.get("Content-Type", "").split(";")[0].strip()
+
+    header = ep.call(fetch)
+    return sniff(path, header or "image/png")
+
+
+def transcode(
+    path: str, fmt: str | None = None, width: int | None = None
+) -> tuple[str, str]:
+    fmt = (fmt if fmt is not None else os.environ.get("MAIL_IMAGE_FORMAT", "")).lower()
+    width = width if width is not None else int(os.environ.get("MAIL_IMAGE_WIDTH", "0"))
+    ctype = sniff(path)
+    if not fmt and not width:
+        return path, ctype
+    try:
+        from PIL import Image
+    except ImportError:
+        print("MAIL_IMAGE_FORMAT/MAIL_IMAGE_WIDTH set but Pillow is not installed")
+        return path, ctype
+    target = _PIL_FORMATS.get(fmt, ctype)
+    with Image.open(path) as im:
+        if width and im.width > width:
+            im = im.resize(
+                (width, max(1, round(im.height * width / im.width))),
+                Image.LANCZOS,
+            )
+        if target == "image/jpeg" and im.mode not in ("RGB", "L"):
+            im = im.convert("RGB")
+        out = os.path.splitext(path)[0] + "_mail" + extension(target)
+        tmp = _tmp_path(out)
+        try:
+            im.save(
+                tmp,
+                format=extension(target)[1:].replace("jpg", "jpeg").upper(),
+                quality=int(os.environ.get("MAIL_IMAGE_QUALITY", "85")),
+                optimize=True,
+            )
+            os.replace(tmp, out)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+    return out, target
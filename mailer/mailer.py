@@ -2,17 +2,28 @@ import os
 import json
 import time
 import datetime
-import requests
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from email.mime.base import MIMEBase
-from email.utils import formataddr
-from email import encoders
-from openai import OpenAI
-from backend.db import list_users, list_birthday_today_group
-from lunar_python import Solar
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from backend import metrics
+from backend.db import (
+    iter_birthday_groups,
+    iter_birthdays,
+    iter_email_batches,
+    iter_recipients,
+    refresh_birthdays,
+)
 from . import prompt as prompt
+from . import artifacts
+from . import calendar_index
+from . import clients
+from . import gencache
+from . import images
+from . import shards
+from backend.shaper import get_shaper, send_window
+from .delivery import SMTPPool, default_batch_size, deliver
+from .manifest import DeliveryLog, Manifest, atomic_write_json, item_key
+from .message import MessageTemplate
+from .ratelimit import TokenBucket
 
 
 def _today():
@@ -38,124 +49,42 @@ def _calendar_client():
     return url, key
 
 
-def get_today_holiday():
-    d = _today()
-    s = Solar.fromYmd(d.year, d.month, d.day)
-    lunar = s.getLunar()
-    names = []
-    try:
-        names += lunar.getFestivals()
-        names += lunar.getOtherFestivals()
-    except Exception:
-        names = []
-    try:
-        jq = lunar.getJieQi()
-        if jq:
-            names.append(jq)
-    except Exception:
-        pass
-    if names:
-        return {"name": names[0]}
+def get_today_holiday(d=None):
+    d = d or _today()
+    entry = calendar_index.lookup(d)
+    if entry.get("holiday"):
+        return {"name": entry["holiday"]}
     url, key = _calendar_client()
     if not url or not key:
-        path = os.path.join(os.getcwd(), "data", "festivals.csv")
-        if os.path.isfile(path):
-            with open(path, "r", encoding="utf-8") as f:
-                for line in f:
-                    line = line.strip()
-                    if not line:
-                        continue
-                    parts = line.split(",")
-                    if len(parts) >= 2 and parts[0] == _date_str(d)[5:]:
-                        return {"name": parts[1]}
-        return None
-    try:
-        r = requests.get(url, params={"date": _date_str(d), "key": key}, timeout=15)
-        if r.status_code != 200:
-            return None
-        j = r.json()
-        for k in ["holiday", "festival", "data", "events", "holidays"]:
-            v = j.get(k)
-            if isinstance(v, list) and len(v) > 0:
-                x = v[0]
-                name = x.get("name") or x.get("title") or x.get("festival")
-                if name:
-                    return {"name": name}
-        name = j.get("name") or j.get("title")
-        if name:
-            return {"name": name}
-    except Exception:
-        return None
-    return None
-
-
-def get_upcoming_events(days=7):
-    res = []
-    for i in range(days):
-        d = _today() + datetime.timedelta(days=i)
-        s = Solar.fromYmd(d.year, d.month, d.day)
-        lunar = s.getLunar()
-        names = []
-        try:
-            jq = lunar.getJieQi()
-            if jq:
-                names.append(jq)
-        except Exception:
-            pass
-        try:
-            names += lunar.getFestivals()
-        except Exception:
-            pass
-        if names:
-            res.append({"date": _date_str(d), "name": names[0]})
+        names = entry.get("csv")
+        return {"name": names[0]} if names else None
+    name = calendar_index.remote_names([_date_str(d)], url, key)[_date_str(d)]
+    return {"name": name} if name else None
+
+
+def get_upcoming_events(days=7, today=None):
+    today = today or _today()
+    res = [
+        {"date": date, "name": e["event"]}
+        for date, e in calendar_index.window(today, days)
+        if e.get("event")
+    ]
     if res:
         return res
     url, key = _calendar_client()
+    ahead = calendar_index.window(today + datetime.timedelta(days=1), days)
     if not url or not key:
-        path = os.path.join(os.getcwd(), "data", "festivals.csv")
-        if os.path.isfile(path):
-            out = []
-            with open(path, "r", encoding="utf-8") as f:
-                for line in f:
-                    line = line.strip()
-                    if not line:
-                        continue
-                    parts = line.split(",")
-                    if len(parts) >= 2:
-                        out.append({"date": parts[0], "name": parts[1]})
-            upcoming = set(
-                _date_str(_today() + datetime.timedelta(days=i))[5:]
-                for i in range(1, days + 1)
-            )
-            return [x for x in out if x["date"] in upcoming]
-        return []
-    try:
-        for i in range(1, days + 1):
-            d = _today() + datetime.timedelta(days=i)
-            r = requests.get(url, params={"date": _date_str(d), "key": key}, timeout=15)
-            if r.status_code != 200:
-                continue
-            j = r.json()
-            name = None
-            for k in ["holiday", "festival", "data", "events", "holidays"]:
-                v = j.get(k)
-                if isinstance(v, list) and len(v) > 0:
-                    x = v[0]
-                    name = x.get("name") or x.get("title") or x.get("festival")
-                    break
-            if not name:
-                name = j.get("name") or j.get("title")
-            if name:
-                res.append({"date": _date_str(d), "name": name})
-    except Exception:
-        pass
-    return res
+        return [
+            {"date": date[5:], "name": name}
+            for date, e in ahead
+            for name in e.get("csv", [])
+        ]
+    names = calendar_index.remote_names([date for date, _ in ahead], url, key)
+    return [{"date": date, "name": names[date]} for date, _ in ahead if names[date]]
 
 
 def _client():
-    key = os.environ.get("MODEL_KEY", "")
-    url = os.environ.get("MODEL_URL", "")
-    return OpenAI(api_key=key, base_url=url)
+    return clients.openai_client()
 
 
 def _model_name():
@@ -166,33 +95,101 @@ def _img_model_name():
     return os.environ.get("IMG_MODEL_NAME", "Kwai-Kolors/Kolors")
 
 
-def _json_prompt_for_image(text: str):
-    client = _client()
-    j = (
-        client.chat.completions.create(
+_usage = {"chat_calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "image_calls": 0}
+_usage_lock = threading.Lock()
+
+
+def _count(**kwargs):
+    with _usage_lock:
+        for k, v in kwargs.items():
+            _usage[k] += v
+
+
+def _chat(client, messages: list[dict], scope: str | None = None, check=None, **kwargs):
+    params = {"max_tokens": 4096, "temperature": 0.7, "stream": False, **kwargs}
+
+    def produce():
+        resp = clients.endpoint("chat").call(
+            client.chat.completions.create,
             model=_model_name(),
-            messages=prompt.img_prompt_messages(text),
-            max_tokens=4096,
-            temperature=0.7,
-            stream=False,
-            response_format={"type": "json_object"},
+            messages=messages,
+            **params,
+        )
+        usage = getattr(resp, "usage", None)
+        _count(
+            chat_calls=1,
+            prompt_tokens=getattr(usage, "prompt_tokens", 0) or 0,
+            completion_tokens=getattr(usage, "completion_tokens", 0) or 0,
         )
-        .choices[0]
-        .message.content
+        content = resp.choices[0].message.content
+        if check is not None:
+            check(content)
+        return content.encode("utf-8")
+
+    parts = {
+        "kind": "chat",
+        "model": _model_name(),
+        "messages": messages,
+        "params": params,
+        "scope": scope or _date_str(_today()),
+    }
+    return gencache.get_cache().cached(parts, produce).decode("utf-8")
+
+
+def _json_prompt_for_image(text: str, client=None, scope: str | None = None):
+    j = _chat(
+        client or _client(),
+        prompt.img_prompt_messages(text),
+        scope,
+        json.loads,
+        response_format={"type": "json_object"},
     )
     return json.loads(j)
 
 
-_last_generate_image_time = 0
+def _gen_concurrency():
+    return max(1, int(os.environ.get("GEN_CONCURRENCY", "4")))
+
+
+_image_bucket = None
+
 
+def _image_limiter():
+    global _image_bucket
+    if _image_bucket is None:
+        _image_bucket = TokenBucket(
+            float(os.environ.get("IMG_RATE_PER_MINUTE", str(60 / 35))) / 60,
+            float(os.environ.get("IMG_BURST", "1")),
+        )
+    return _image_bucket
+
+
+def _generate_image(
+    prompt: str, negative_prompt: str, size: str, dest: str, scope: str | None = None
+):
+    parts = {
+        "kind": "image",
+        "model": _img_model_name(),
+        "prompt": prompt,
+        "negative_prompt": negative_prompt,
+        "size": size,
+        "scope": scope or _date_str(_today()),
+    }
+    gencache.get_cache().cached_file(
+        parts, lambda path: _request_image(prompt, negative_prompt, size, path), dest
+    )
+    return images.sniff(dest)
 
-def _generate_image(prompt: str, negative_prompt: str, size: str):
-    global _last_generate_image_time
-    if time.time() - _last_generate_image_time < 35:
-        time.sleep(max(0, 35 - (time.time() - _last_generate_image_time)))
+
+def _request_image(prompt: str, negative_prompt: str, size: str, dest: str):
+    metrics.observe(
+        "ratelimit_wait_seconds", _image_limiter().acquire(), limiter="image"
+    )
     url = os.environ.get("MODEL_URL", "").rstrip("/") + "/images/generations"
     key = os.environ.get("MODEL_KEY", "")
-    r = requests.post(
+    r = clients.request(
+        "image",
+        "POST",
         url,
         headers={"Authorization": f"Bearer {key}", "Content-Type": "application/json"},
         json={
@@ -201,7 +198,6 @@ def _generate_image(prompt: str, negative_prompt: str, size: str):
             "size": size,
             "negative_prompt": negative_prompt,
         },
-        timeout=60,
     )
     j = r.json()
     data = j.get("data") or []
@@ -210,205 +206,568 @@ def _generate_image(prompt: str, negative_prompt: str, size: str):
     img_url = data[0].get("url")
     if not img_url:
         raise RuntimeError("image url missing")
-    img = requests.get(img_url, timeout=60).content
-    _last_generate_image_time = time.time()
-    return img
-
-
-def _compose_mail(subject: str, text: str, img: bytes, to_name: str, to_email: str):
-    msg = MIMEMultipart("related")
-    msg["From"] = formataddr(["YourForeverSister", os.environ.get("SMTP_EMAIL", "")])
-    msg["To"] = formataddr([to_name, to_email])
-    msg["Subject"] = subject
-    alt = MIMEMultipart("alternative")
-    msg.attach(alt)
-    alt.attach(MIMEText(text, "plain", "utf-8"))
-    html = f'<html><body><p style="white-space: pre-wrap;">{text}</p><img src="cid:img" style="max-width:100%;"></body></html>'
-    alt.attach(MIMEText(html, "html", "utf-8"))
-    mime = MIMEBase("image", "png")
-    mime.set_payload(img)
-    encoders.encode_base64(mime)
-    mime.add_header("Content-ID", "<img>")
-    msg.attach(mime)
-    return msg
-
-
-def _send_bcc(subject: str, text: str, img: bytes, recipients: list[str]):
+    ctype = images.download(img_url, dest)
+    _count(image_calls=1)
+    return ctype
+
+
+def _timed(stage: str, fn, *args, **kwargs):
+    with metrics.timer("gen_stage_seconds", stage=stage):
+        return fn(*args, **kwargs)
+
+
+def _run_job(
+    client,
+    side: ThreadPoolExecutor,
+    manifest: Manifest,
+    job: dict,
+    leads: dict[str, Future] | None = None,
+):
+    scope = manifest.date
+    text = _timed("text", _chat, client, job.pop("messages"), scope).strip()
+    title = None
+    if job["subject"] is None:
+        title = side.submit(
+            _timed, "title", _chat, client, prompt.generate_title_prompt(text), scope
+        )
+    negative = job.pop("negative_prompt")
+    if job.get("image_from"):
+        lead = _timed("image_wait", leads[job["image_from"]].result)
+        for k in ("image_path", "content_type", "original_image_path", "image_digest"):
+            if k in lead:
+                job[k] = lead[k]
+            else:
+                job.pop(k, None)
+    else:
+        jp = _timed("image_prompt", _json_prompt_for_image, text, client, scope)
+        base = os.path.splitext(job["image_path"])[0]
+        ctype = _timed(
+            "image",
+            _generate_image,
+            jp.get("prompt", ""),
+            negative + jp.get("negative_prompt", ""),
+            "1920x1080",
+            base + ".download",
+            scope,
+        )
+        path = base + images.extension(ctype)
+        os.replace(base + ".download", path)
+        job["image_path"], job["content_type"] = _timed(
+            "transcode", images.transcode, path
+        )
+        if manifest.store is not None:
+            job["image_digest"] = manifest.store.put_file(
+                scope, f"image/{job['key']}", job["image_path"], job["content_type"]
+            )
+            for p in {path, job.pop("image_path")}:
+                os.unlink(p)
+        elif job["image_path"] != path:
+            job["original_image_path"] = path
+    if title is not None:
+        job["subject"] = title.result().strip()
+    job["text"] = text
+    manifest.put(job)
+    return job
+
+
+def _send_bcc(
+    pool: SMTPPool, template: MessageTemplate, recipients: list[str], **kwargs
+):
     sender = os.environ.get("SMTP_EMAIL", "")
-    password = os.environ.get("SMTP_KEY", "")
-    server = smtplib.SMTP_SSL(
-        os.environ.get("SMTP_SERVER", ""), int(os.environ.get("SMTP_PORT", 465))
+    return deliver(
+        pool, sender, recipients, lambda batch: template.render(batch[0]), **kwargs
     )
-    server.login(sender, password)
-    to_addr = recipients[0] if recipients else sender
-    msg = _compose_mail(subject, text, img, "You", to_addr)
-    server.sendmail(sender, recipients, msg.as_string())
-    server.quit()
 
 
-def generate_today_cache():
-    users = list_users()
-    today = _today()
+def _jobs_for(today) -> list[dict]:
     is_month_start = today.day == 1
     is_monday = today.weekday() == 0
-    holiday = get_today_holiday()
-    upcoming = get_upcoming_events(7)
-    bday_groups = list_birthday_today_group()
-    bday_today = set()
-    for _, recs in bday_groups.items():
-        for r in recs:
-            bday_today.add(r["email"])
-    targets = []
+    holiday = get_today_holiday(today)
+    upcoming = get_upcoming_events(7, today)
+    freqs = []
     if is_month_start:
-        targets += [u for u in users if u["frequency"] == "monthly"]
+        freqs.append("monthly")
     if is_monday:
-        targets += [u for u in users if u["frequency"] == "weekly"]
+        freqs.append("weekly")
     if holiday:
-        targets += [u for u in users if u["frequency"] == "holiday"]
-    targets = [u for u in targets if u["email"] not in bday_today]
-    groups_general = {"哥哥": [], "姐姐": []}
-    for u in targets:
-        groups_general[u["salutation"]].append(u["email"])
-    groups_birthday = {"哥哥": {}, "姐姐": {}}
-    for byear, recs in bday_groups.items():
-        for r in recs:
-            dct = groups_birthday[r["salutation"]]
-            dct.setdefault(str(byear), []).append(r["email"])
-    client = _client()
-    date_cn = _ymd_cn(today)
-    cache = {"date": _date_str(today), "items": []}
-    for sal in ["哥哥", "姐姐"]:
-        if groups_general[sal]:
-            theme = (
-                "节日问候"
-                if holiday
-                else (
-                    "每月问候"
-                    if is_month_start
-                    else ("每周问候" if is_monday else "日常问候")
-                )
-            )
-            messages = [
-                {"role": "system", "content": prompt.system_prompt(sal)},
-                {
-                    "role": "user",
-                    "content": prompt.general_user_prompt(
-                        date_cn, sal, theme, upcoming
-                    ),
-                },
+        freqs.append("holiday")
+    if _personalize():
+        jobs = _personal_jobs(today, freqs, holiday, upcoming)
+    else:
+        groups_general = {
+            sal: [
+                email
+                for batch in iter_email_batches(freqs, sal, exclude_birthday=today)
+                for email in batch
             ]
-            text = (
-                client.chat.completions.create(
-                    model=_model_name(),
-                    messages=messages,
-                    max_tokens=4096,
-                    temperature=0.7,
-                    stream=False,
+            for sal in ["哥哥", "姐姐"]
+        }
+        date_cn = _ymd_cn(today)
+        jobs = []
+        for sal in ["哥哥", "姐姐"]:
+            if groups_general[sal]:
+                theme = (
+                    "节日问候"
+                    if holiday
+                    else (
+                        "每月问候"
+                        if is_month_start
+                        else ("每周问候" if is_monday else "日常问候")
+                    )
                 )
-                .choices[0]
-                .message.content.strip()
-            )
-            jp = _json_prompt_for_image(text)
-            img = _generate_image(
-                jp.get("prompt", ""),
-                prompt._base_negative_prompt + jp.get("negative_prompt", ""),
-                "1920x1080",
-            )
-            _ensure_dir(os.path.join(os.getcwd(), "cache"))
-            img_path = os.path.join("cache", f"general_{sal}_{_date_str(today)}.png")
-            with open(img_path, "wb") as f:
-                f.write(img)
-            cache["items"].append(
-                {
-                    "type": "general",
-                    "salutation": sal,
-                    "recipients": groups_general[sal],
-                    "subject": (
-                        (holiday["name"] + "快乐！")
-                        if holiday
-                        else (
-                            client.chat.completions.create(
-                                model=_model_name(),
-                                messages=prompt.generate_title_prompt(text),
-                                max_tokens=4096,
-                                temperature=0.7,
-                                stream=False,
-                            )
-                            .choices[0]
-                            .message.content.strip()
-                        )
-                    ),
-                    "text": text,
-                    "image_path": img_path,
-                }
-            )
-    for sal in ["哥哥", "姐姐"]:
-        dct = groups_birthday[sal]
-        for byear, recs in dct.items():
-            ages = []
-            for u in users:
-                if u["email"] in recs and u.get("birth_year"):
-                    try:
-                        ages.append(today.year - int(u["birth_year"]))
-                    except Exception:
-                        pass
-            age = ages[0] if ages else 0
-            messages = [
-                {"role": "system", "content": prompt.system_prompt(sal)},
-                {
-                    "role": "user",
-                    "content": prompt.birthday_user_prompt(date_cn, sal, age),
-                },
-            ]
-            text = (
-                client.chat.completions.create(
-                    model=_model_name(),
-                    messages=messages,
-                    max_tokens=4096,
-                    temperature=0.7,
-                    stream=False,
+                jobs.append(
+                    {
+                        "type": "general",
+                        "salutation": sal,
+                        "recipients": groups_general[sal],
+                        "subject": (holiday["name"] + "快乐！") if holiday else None,
+                        "messages": [
+                            {"role": "system", "content": prompt.system_prompt(sal)},
+                            {
+                                "role": "user",
+                                "content": prompt.general_user_prompt(
+                                    date_cn, sal, theme, upcoming
+                                ),
+                            },
+                        ],
+                        "negative_prompt": prompt._base_negative_prompt,
+                        "image_path": os.path.join(
+                            "cache", f"general_{sal}_{_date_str(today)}.png"
+                        ),
+                    }
                 )
-                .choices[0]
-                .message.content.strip()
-            )
-            jp = _json_prompt_for_image(text)
-            img = _generate_image(
-                jp.get("prompt", ""), jp.get("negative_prompt", ""), "1920x1080"
-            )
-            _ensure_dir(os.path.join(os.getcwd(), "cache"))
-            img_path = os.path.join(
-                "cache", f"birthday_{sal}_{byear}_{_date_str(today)}.png"
-            )
-            with open(img_path, "wb") as f:
-                f.write(img)
-            cache["items"].append(
+        for g in iter_birthday_groups(today):
+            sal, byear, age = g["salutation"], g["group"], g["age"]
+            jobs.append(
                 {
                     "type": "birthday",
                     "salutation": sal,
                     "group": byear,
-                    "recipients": recs,
+                    "recipients": g["recipients"],
                     "subject": "生日快乐！",
-                    "text": text,
-                    "image_path": img_path,
+                    "messages": [
+                        {"role": "system", "content": prompt.system_prompt(sal)},
+                        {
+                            "role": "user",
+                            "content": prompt.birthday_user_prompt(date_cn, sal, age),
+                        },
+                    ],
+                    "negative_prompt": "",
+                    "image_path": os.path.join(
+                        "cache", f"birthday_{sal}_{byear}_{_date_str(today)}.png"
+                    ),
                 }
             )
-    with open(
-        os.path.join("cache", f"{_date_str(today)}.json"), "w", encoding="utf-8"
-    ) as f:
-        json.dump(cache, f, ensure_ascii=False, indent=2)
+    return jobs
+
+
+def _inputs(job: dict) -> str:
+    return gencache.GenCache.key(
+        {
+            k: job.get(k)
+            for k in ("subject", "messages", "negative_prompt", "image_from")
+        }
+    )
+
+
+def _store():
+    return artifacts.get_store() if artifacts.enabled() else None
+
+
+def _plan(today) -> dict:
+    manifest = Manifest(
+        os.path.join("cache", f"{_date_str(today)}.json"), _date_str(today), _store()
+    )
+    order = []
+    pending = []
+    stale = 0
+    leads: dict[str, Future] = {}
+    for job in _jobs_for(today):
+        job = {"key": item_key(job), **job}
+        job["inputs"] = _inputs(job)
+        order.append(job["key"])
+        done = manifest.get(job["key"])
+        if done is not None and done.get("inputs", job["inputs"]) != job["inputs"]:
+            stale += 1
+            done = None
+        if done is None:
+            pending.append(job)
+            continue
+        if done["recipients"] != job["recipients"]:
+            done = {**done, "recipients": job["recipients"]}
+            manifest.put(done)
+        leads[job["key"]] = Future()
+        leads[job["key"]].set_result(done)
+    pending.sort(key=lambda j: bool(j.get("image_from")))
+    return {
+        "day": today,
+        "manifest": manifest,
+        "order": order,
+        "pending": pending,
+        "leads": leads,
+        "stale": stale,
+    }
+
+
+def _run_plans(plans: list[dict], stop_at: float | None = None) -> list[Future]:
+    queue = [
+        (plan, job)
+        for plan in sorted(plans, key=lambda p: p["day"])
+        for job in plan["pending"]
+    ]
+    futures = []
+    if not queue:
+        return futures
+    client = _client()
+    workers = _gen_concurrency()
+    slots = threading.Semaphore(workers)
+    with ThreadPoolExecutor(max_workers=workers) as side, ThreadPoolExecutor(
+        max_workers=workers
+    ) as pool:
+        for plan, job in queue:
+            slots.acquire()
+            if stop_at is not None and time.monotonic() >= stop_at:
+                slots.release()
+                break
+            fut = pool.submit(
+                _run_job, client, side, plan["manifest"], job, plan["leads"]
+            )
+            fut.add_done_callback(lambda _: slots.release())
+            plan["leads"][job["key"]] = fut
+            futures.append(fut)
+    return futures
+
+
+def generate_today_cache():
+    snap = metrics.snapshot()
+    started = time.perf_counter()
+    today = _today()
+    refresh_birthdays(today)
+    plan = _plan(today)
+    before = {**_usage, "hits": gencache.get_cache().hits}
+    t = time.perf_counter()
+    for fut in _run_plans([plan]):
+        fut.result()
+    cache = plan["manifest"].finish(plan["order"])
+    _gen_report(
+        today, cache["items"], len(plan["pending"]), time.perf_counter() - t, before
+    )
+    _write_timings(
+        today,
+        "generate",
+        started,
+        metrics.report(snap),
+        items=len(cache["items"]),
+        stale=plan["stale"],
+    )
+    return cache
+
+
+def _lookahead_days():
+    return max(0, int(os.environ.get("LOOKAHEAD_DAYS", "3")))
+
+
+def _lookahead_budget():
+    return float(os.environ.get("LOOKAHEAD_BUDGET", "14400"))
+
+
+def generate_lookahead(days: int | None = None, budget: float | None = None):
+    snap = metrics.snapshot()
+    started = time.perf_counter()
+    today = _today()
+    refresh_birthdays(today)
+    days = _lookahead_days() if days is None else days
+    budget = _lookahead_budget() if budget is None else budget
+    stop_at = time.monotonic() + budget if budget > 0 else None
+    plans = [_plan(today + datetime.timedelta(days=i)) for i in range(1, days + 1)]
+    futures = _run_plans(plans, stop_at)
+    failed = 0
+    for fut in futures:
+        try:
+            fut.result()
+        except Exception as e:
+            failed += 1
+            print(f"Lookahead job failed: {e!r}")
+    pending = sum(len(p["pending"]) for p in plans)
+    report = _write_timings(
+        today,
+        "lookahead",
+        started,
+        metrics.report(snap),
+        days=days,
+        generated=len(futures) - failed,
+        failed=failed,
+        deferred=pending - len(futures),
+        stale=sum(p["stale"] for p in plans),
+    )
+    print(
+        f"Lookahead over {days} days: generated {report['generated']} of {pending} pending variants "
+        f"({failed} failed, {report['deferred']} deferred) in {report['elapsed']:.1f}s"
+    )
+    return report
+
+
+_timings_lock = threading.Lock()
+
+
+def _write_timings(today, section: str, started: float, timings: dict, **extra):
+    path = os.path.join("cache", f"{_date_str(today)}.timings.json")
+    report = {
+        "started": datetime.datetime.now().isoformat(timespec="seconds"),
+        "elapsed": round(time.perf_counter() - started, 3),
+        **extra,
+        **timings,
+    }
+    with _timings_lock:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {"date": _date_str(today)}
+        data.setdefault(section, []).append(report)
+        atomic_write_json(path, data)
+    return report
+
+
+_THEMES = {"holiday": "节日问候", "monthly": "每月问候", "weekly": "每周问候"}
+
+
+def _personalize():
+    return os.environ.get("GEN_PERSONALIZE", "0") == "1"
+
+
+def _personal_jobs(today, freqs: list[str], holiday, upcoming):
+    date_cn = _ymd_cn(today)
+    variants: dict[str, dict] = {}
+
+    def add(key, email, make):
+        job = variants.get(key)
+        if job is None:
+            job = variants[key] = {"key": key, "recipients": [], **make()}
+        job["recipients"].append(email)
+
+    for r in iter_recipients(freqs, exclude_birthday=today):
+        sal, name, theme = r["salutation"], r["name"], _THEMES[r["frequency"]]
+        add(
+            f"general:{sal}:{theme}:{name or ''}",
+            r["email"],
+            lambda: {
+                "type": "general",
+                "salutation": sal,
+                "theme": theme,
+                "name": name,
+                "subject": (holiday["name"] + "快乐！") if holiday else None,
+                "messages": [
+                    {"role": "system", "content": prompt.system_prompt(sal)},
+                    {
+                        "role": "user",
+                        "content": prompt.general_user_prompt(
+                            date_cn, sal, theme, upcoming, name
+                        ),
+                    },
+                ],
+                "negative_prompt": prompt._base_negative_prompt,
+                "image_path": os.path.join(
+                    "cache", f"general_{sal}_{_date_str(today)}.png"
+                ),
+                "image_group": f"general:{sal}",
+            },
+        )
+    for r in iter_birthdays(today):
+        sal, name, age = r["salutation"], r["name"], r["age"]
+        add(
+            f"birthday:{sal}:{age}:{name or ''}",
+            r["email"],
+            lambda: {
+                "type": "birthday",
+                "salutation": sal,
+                "age": age,
+                "name": name,
+                "subject": "生日快乐！",
+                "messages": [
+                    {"role": "system", "content": prompt.system_prompt(sal)},
+                    {
+                        "role": "user",
+                        "content": prompt.birthday_user_prompt(date_cn, sal, age, name),
+                    },
+                ],
+                "negative_prompt": "",
+                "image_path": os.path.join(
+                    "cache", f"birthday_{sal}_{_date_str(today)}.png"
+                ),
+                "image_group": f"birthday:{sal}",
+            },
+        )
+    groups: dict[str, list[dict]] = {}
+    for job in variants.values():
+        groups.setdefault(job["image_group"], []).append(job)
+    for members in groups.values():
+        lead = max(members, key=lambda j: (len(j["recipients"]), j["key"]))
+        for job in members:
+            if job is not lead:
+                job["image_from"] = lead["key"]
+    return sorted(variants.values(), key=lambda j: j["key"])
+
+
+def _gen_report(today, items: list[dict], generated: int, elapsed: float, before):
+    usage = {k: _usage[k] - before[k] for k in _usage}
+    cost = (
+        usage["prompt_tokens"] / 1000 * float(os.environ.get("GEN_PRICE_PROMPT", "0"))
+        + usage["completion_tokens"]
+        / 1000
+        * float(os.environ.get("GEN_PRICE_COMPLETION", "0"))
+        + usage["image_calls"] * float(os.environ.get("GEN_PRICE_IMAGE", "0"))
+    )
+    report = {
+        "date": _date_str(today),
+        "personalized": _personalize(),
+        "recipients": sum(len(i["recipients"]) for i in items),
+        "variants": len(items),
+        "generated": generated,
+        **usage,
+        "cache_hits": gencache.get_cache().hits - before["hits"],
+        "elapsed": round(elapsed, 3),
+        "variants_per_second": round(generated / elapsed, 2) if elapsed else 0.0,
+        "estimated_cost": round(cost, 6),
+    }
+    atomic_write_json(os.path.join("cache", f"{_date_str(today)}.gen.json"), report)
+    print(
+        f"Generated {generated} of {len(items)} variants for {report['recipients']} recipients in {elapsed:.1f}s "
+        f"({usage['chat_calls']} chat, {usage['image_calls']} image calls, est. cost {report['estimated_cost']})"
+    )
+    return report
+
+
+def _image(date: str, item: dict):
+    if item.get("image_digest"):
+        data = artifacts.get_store().get(date, item["image_digest"])
+        if data is None:
+            raise RuntimeError(
+                f"image {item['image_digest']} for {item_key(item)} missing from the {date} pack"
+            )
+        return data
+    with open(item["image_path"], "rb") as f:
+        return f.read()
+
+
+def _load_cache(path: str):
+    store = _store()
+    date = os.path.basename(path)[: -len(".json")]
+    cache = store.get_json(date, "manifest") if store is not None else None
+    if cache is None and os.path.isfile(path):
+        with open(path, "r", encoding="utf-8") as f:
+            cache = json.load(f)
     return cache
 
 
+def _deliver_cache(
+    cache: dict,
+    log_path: str,
+    deadline: float | None = None,
+):
+    log = DeliveryLog(log_path)
+    pool = SMTPPool()
+    shaper = get_shaper()
+    if deadline is None:
+        deadline = shaper.clock() + send_window()
+    total = {"sent": 0, "failed": 0, "deferred": 0}
+    try:
+        for item in cache.get("items", []):
+            key = item_key(item)
+            recipients = item["recipients"]
+            size = log.batch_size(key, shaper.max_batch(default_batch_size()))
+            recipients = log.freeze(key, size, recipients)
+            done = log.sent(key)
+            if len(done) >= -(-len(recipients) // size):
+                continue
+            template = MessageTemplate(
+                item["subject"],
+                item["text"],
+                _image(cache["date"], item),
+                item.get("content_type", "image/png"),
+            )
+
+            def on_batch(index, batch, refused, key=key, size=size):
+                log.record(key, size, index, len(batch) - len(refused), refused)
+
+            report = _send_bcc(
+                pool,
+                template,
+                recipients,
+                batch_size=size,
+                skip=done,
+                on_batch=on_batch,
+                shaper=shaper,
+                deadline=deadline,
+            )
+            failed = sum(len(x["recipients"]) for x in report["failed"])
+            total["sent"] += report["sent"]
+            total["failed"] += failed
+            total["deferred"] += report["deferred"]
+            if failed:
+                print(
+                    f"Failed to deliver {failed} of {len(recipients)} recipients for {key}"
+                )
+    finally:
+        pool.close()
+        log.close()
+    return total
+
+
+def _send_path(path: str, deadline: float, cache: dict | None = None):
+    n = shards.resolve(path, shards.shard_count())
+    if n > 1:
+        reports = shards.run(path, n, deadline=deadline, cache=cache)
+        total = {
+            k: sum(r.get(k, 0) for r in reports) for k in ("sent", "failed", "deferred")
+        }
+        total["shards"] = len(reports)
+        return total, [r.pop("metrics") for r in reports if "metrics" in r]
+    cache = cache or _load_cache(path)
+    return (
+        _deliver_cache(cache, path[: -len(".json")] + ".sent.jsonl", deadline),
+        [],
+    )
+
+
 def send_cached_for_today():
-    path = os.path.join("cache", f"{_date_str(_today())}.json")
-    if not os.path.isfile(path):
+    today = _today()
+    date = _date_str(today)
+    path = os.path.join("cache", f"{date}.json")
+    cache = _load_cache(path)
+    if cache is None:
         return False
-    with open(path, "r", encoding="utf-8") as f:
-        cache = json.load(f)
-    for item in cache.get("items", []):
-        with open(item["image_path"], "rb") as imf:
-            img = imf.read()
-        _send_bcc(item["subject"], item["text"], img, item["recipients"])
+    snap = metrics.snapshot()
+    started = time.perf_counter()
+    shaper = get_shaper()
+    deadline = shaper.clock() + send_window()
+    parts = []
+    backlog = 0
+    for d in shaper.backlog(date):
+        old = os.path.join("cache", f"{d}.json")
+        if _load_cache(old) is None:
+            shaper.done(d)
+            continue
+        total, extra = _send_path(old, deadline)
+        parts += extra
+        backlog += total["sent"]
+        if total["deferred"]:
+            print(
+                f"Deferred mail for {d} still pending: {total['deferred']} recipients"
+            )
+        else:
+            shaper.done(d)
+    total, extra = _send_path(path, deadline, cache)
+    parts += extra
+    if total["deferred"]:
+        shaper.defer(date)
+        print(
+            f"Deferred {total['deferred']} recipients past the send window or SMTP budget"
+        )
+    timings = metrics.report(snap)
+    if parts:
+        timings = metrics.merge([timings] + parts)
+    _write_timings(today, "send", started, timings, backlog=backlog, **total)
     return True
 
 
@@ -0,0 +1,175 @@
+import os
+import json
+import tempfile
+import threading
+from backend import metrics
+
+
+def atomic_write_bytes(path: str, data: bytes):
+    d = os.path.dirname(path) or "."
+    os.makedirs(d, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=d, prefix=".tmp-")
+    try:
+        with metrics.timer("file_write_seconds", kind="atomic"):
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def atomic_write_json(path: str, obj):
+    atomic_write_bytes(
+        path, json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8")
+    )
+
+
+def _ends_with_newline(path: str) -> bool:
+    with open(path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+def item_key(item: dict) -> str:
+    if item.get("key"):
+        return item["key"]
+    if item["type"] == "birthday":
+        return f"birthday:{item['salutation']}:{item['group']}"
+    return f"{item['type']}:{item['salutation']}"
+
+
+class Manifest:
+    def __init__(self, path: str, date: str, store=None):
+        self.path = path
+        self.date = date
+        self.store = store
+        self.journal = os.path.splitext(path)[0] + ".partial.jsonl"
+        self.items: dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._f = None
+        cache = store.get_json(date, "manifest") if store is not None else None
+        if cache is None and os.path.isfile(path):
+            with open(path, "r", encoding="utf-8") as f:
+                cache = json.load(f)
+        for item in (cache or {}).get("items", []):
+            self.items[item_key(item)] = item
+        if os.path.isfile(self.journal):
+            with open(self.journal, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        item = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.items[item_key(item)] = item
+
+    def get(self, key: str):
+        item = self.items.get(key)
+        if not item:
+            return None
+        if item.get("image_digest") and self.store is not None:
+            return item if self.store.has(self.date, item["image_digest"]) else None
+        path = item.get("image_path")
+        return item if path and os.path.isfile(path) else None
+
+    def put(self, item: dict):
+        line = json.dumps(item, ensure_ascii=False)
+        with self._lock:
+            self.items[item["key"]] = item
+            if self._f is None:
+                self._f = open(self.journal, "a", encoding="utf-8")
+                if self._f.tell() and not _ends_with_newline(self.journal):
+                    self._f.write("\n")
+            with metrics.timer("file_write_seconds", kind="manifest"):
+                self._f.write(line + "\n")
+                self._f.flush()
+                os.fsync(self._f.fileno())
+
+    def finish(self, order: list[str]):
+        with self._lock:
+            cache = self._write([self.items[k] for k in order if k in self.items])
+            if self._f is not None:
+                self._f.close()
+                self._f = None
+            if os.path.isfile(self.journal):
+                os.unlink(self.journal)
+            return cache
+
+    def _write(self, items: list[dict]):
+        cache = {"date": self.date, "items": items}
+        if self.store is not None:
+            self.store.put_json(self.date, "manifest", cache)
+        else:
+            atomic_write_json(self.path, cache)
+        return cache
+
+
+class DeliveryLog:
+    def __init__(self, path: str):
+        self.path = path
+        self._done: dict[str, set[int]] = {}
+        self._sizes: dict[str, int] = {}
+        self._recipients: dict[str, list[str]] = {}
+        self._lock = threading.Lock()
+        if os.path.isfile(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        continue
+                    self._sizes.setdefault(rec["item"], rec["batch_size"])
+                    if "recipients" in rec:
+                        self._recipients.setdefault(rec["item"], rec["recipients"])
+                    else:
+                        self._done.setdefault(rec["item"], set()).add(rec["batch"])
+        self._f = open(path, "a", encoding="utf-8")
+        if self._f.tell() and not _ends_with_newline(path):
+            self._f.write("\n")
+
+    def batch_size(self, key: str, default: int) -> int:
+        return self._sizes.get(key, default)
+
+    def sent(self, key: str) -> set[int]:
+        return self._done.get(key, set())
+
+    def freeze(self, key: str, batch_size: int, recipients: list[str]) -> list[str]:
+        with self._lock:
+            frozen = self._recipients.get(key)
+            if frozen is not None:
+                return frozen
+            if key in self._done:
+                return recipients
+            self._write(
+                {"item": key, "batch_size": batch_size, "recipients": recipients}
+            )
+            self._sizes.setdefault(key, batch_size)
+            self._recipients[key] = recipients
+            return recipients
+
+    def _write(self, rec: dict):
+        with metrics.timer("file_write_seconds", kind="delivery_log"):
+            self._f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            self._f.flush()
+            os.fsync(self._f.fileno())
+
+    def record(self, key: str, batch_size: int, batch: int, sent: int, refused):
+        rec = {
+            "item": key,
+            "batch_size": batch_size,
+            "batch": batch,
+            "sent": sent,
+            "refused": sorted(refused),
+        }
+        with self._lock:
+            self._sizes.setdefault(key, batch_size)
+            self._done.setdefault(key, set()).add(batch)
+            self._write(rec)
+
+    def close(self):
+        self._f.close()
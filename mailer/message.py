@@ -0,0 +1,44 @@
+import os
+from email import encoders
+from email.policy import compat32
+from email.mime.base import MIMEBase
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+from email.utils import formataddr
+
+
+class MessageTemplate:
+    def __init__(
+        self,
+        subject: str,
+        text: str,
+        img: bytes,
+        img_type: str = "image/png",
+        sender: str | None = None,
+    ):
+        sender = sender if sender is not None else os.environ.get("SMTP_EMAIL", "")
+        msg = MIMEMultipart("related")
+        msg["From"] = formataddr(["YourForeverSister", sender])
+        msg["Subject"] = subject
+        alt = MIMEMultipart("alternative")
+        msg.attach(alt)
+        alt.attach(MIMEText(text, "plain", "utf-8"))
+        html = f'<html><body><p style="white-space: pre-wrap;">{text}</p><img src="cid:img" style="max-width:100%;"></body></html>'
+        alt.attach(MIMEText(html, "html", "utf-8"))
+        maintype, _, subtype = img_type.partition("/")
+        mime = MIMEBase(maintype, subtype)
+        mime.set_payload(img)
+        encoders.encode_base64(mime)
+        mime.add_header("Content-ID", "<img>")
+        msg.attach(mime)
+        raw = msg.as_bytes(policy=compat32.clone(linesep="\r\n"))
+        head, _, body = raw.partition(b"\r\n\r\n")
+        self.head = head + b"\r\n"
+        self.body = b"\r\n" + body
+
+    def render(self, to_email: str, to_name: str = "You") -> bytes:
+        to = formataddr((to_name, to_email), charset="utf-8")
+        return b"".join((self.head, b"To: ", to.encode("ascii"), b"\r\n", self.body))
+
+    def __len__(self):
+        return len(self.head) + len(self.body)
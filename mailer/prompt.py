@@ -1,21 +1,35 @@
+from backend.db import clean_name
+
+
 def system_prompt(salutation: str):
     who = "哥哥" if salutation == "哥哥" else "姐姐"
     return f"假如你是一个和{who}分居两地的妹妹，你写邮件时的落款为“你永远的，妹妹”。根据指令内容给你的姐姐写一封中文邮件，要使用信件的格式，内容可以俏皮可爱一些，你习惯自称妹妹，输出使用纯文本格式，不要使用markdown格式，直接输出邮件的内容，不要输出标题。"
 
 
+def _name_hint(salutation: str, name: str | None):
+    name = clean_name(name)
+    return f"{salutation}的名字是{name}，可以在信中亲切地称呼。" if name else ""
+
+
 def general_user_prompt(
-    date_cn: str, salutation: str, theme: str, upcoming: list[dict]
+    date_cn: str,
+    salutation: str,
+    theme: str,
+    upcoming: list[dict],
+    name: str | None = None,
 ):
     ups = (
         "，".join([x["name"] + "(" + x["date"] + ")" for x in upcoming])
         if upcoming
         else "无"
     )
-    return f"今天是{date_cn}。接下来一周的节日或节气：{ups}。请你给你的{salutation}写一封中文{theme}邮件，表达对{salutation}的思念和祝福，内容要温馨亲切，包含生活细节、小故事或新的视角，保持温柔亲密。日期仅供作为背景信息参考，不用刻意在邮件中提及。"
+    return f"今天是{date_cn}。接下来一周的节日或节气：{ups}。请你给你的{salutation}写一封中文{theme}邮件，表达对{salutation}的思念和祝福，内容要温馨亲切，包含生活细节、小故事或新的视角，保持温柔亲密。日期仅供作为背景信息参考，不用刻意在邮件中提及。{_name_hint(salutation, name)}"
 
 
-def birthday_user_prompt(date_cn: str, salutation: str, age: int):
-    return f"今天是你{salutation}的{age}岁生日。请你写一封生日祝福邮件，内容要真挚感人，表达出你对{salutation}的爱和祝福。"
+def birthday_user_prompt(
+    date_cn: str, salutation: str, age: int, name: str | None = None
+):
+    return f"今天是你{salutation}的{age}岁生日。请你写一封生日祝福邮件，内容要真挚感人，表达出你对{salutation}的爱和祝福。{_name_hint(salutation, name)}"
 
 
 def img_prompt_messages(text: str):
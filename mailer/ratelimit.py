@@ -0,0 +1,40 @@
+import time
+import threading
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float = 1, clock=time.monotonic):
+        if rate > 0 and capacity <= 0:
+            raise ValueError(f"token bucket capacity must be positive, got {capacity}")
+        self.rate = rate
+        self.capacity = capacity
+        self._clock = clock
+        self._tokens = capacity
+        self._stamp = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._stamp) * self.rate
+        )
+        self._stamp = now
+
+    def try_acquire(self, tokens: float = 1) -> float:
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            self._refill()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0.0
+            return (tokens - self._tokens) / self.rate
+
+    def acquire(self, tokens: float = 1, sleep=time.sleep) -> float:
+        waited = 0.0
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait <= 0:
+                return waited
+            sleep(wait)
+            waited += wait
@@ -0,0 +1,383 @@
+import os
+import json
+import datetime
+import threading
+from backend import metrics
+from .manifest import atomic_write_json
+
+_ALIASES = {
+    "@hourly": "0 * * * *",
+    "@daily": "0 0 * * *",
+    "@midnight": "0 0 * * *",
+    "@weekly": "0 0 * * 0",
+    "@monthly": "0 0 1 * *",
+}
+_RANGES = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+_DAY = datetime.timedelta(days=1)
+
+
+def _field(spec: str, lo: int, hi: int) -> set[int]:
+    out = set()
+    for part in spec.split(","):
+        step = 1
+        if "/" in part:
+            part, s = part.split("/", 1)
+            step = int(s)
+        if part == "*":
+            a, b = lo, hi
+        elif "-" in part:
+            a, b = (int(x) for x in part.split("-", 1))
+        else:
+            a = b = int(part)
+            if step != 1:
+                b = hi
+        if a < lo or b > hi or a > b or step < 1:
+            raise ValueError(f"cron field out of range: {spec}")
+        out.update(range(a, b + 1, step))
+    return out
+
+
+class Cron:
+    def __init__(self, expr: str):
+        self.expr = expr
+        fields = _ALIASES.get(expr.strip(), expr).split()
+        if len(fields) != 5:
+            raise ValueError(f"cron expression needs 5 fields: {expr}")
+        sets = [_field(f, lo, hi) for f, (lo, hi) in zip(fields, _RANGES)]
+        self.minutes = sorted(sets[0])
+        self.hours = sorted(sets[1])
+        self.doms, self.months = sets[2], sets[3]
+        self.dows = {d % 7 for d in sets[4]}
+        self._dom_any = fields[2] == "*"
+        self._dow_any = fields[4] == "*"
+
+    def _day(self, d: datetime.date) -> bool:
+        if d.month not in self.months:
+            return False
+        dom = d.day in self.doms
+        dow = (d.weekday() + 1) % 7 in self.dows
+        if self._dom_any or self._dow_any:
+            return dom and dow
+        return dom or dow
+
+    def _times(self, reverse: bool = False):
+        hours = reversed(self.hours) if reverse else self.hours
+        for h in hours:
+            for m in reversed(self.minutes) if reverse else self.minutes:
+                yield h, m
+
+    def next_after(self, dt: datetime.datetime) -> datetime.datetime | None:
+        t = dt.replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+        d = t.date()
+        for _ in range(366 * 8):
+            if self._day(d):
+                for h, m in self._times():
+                    c = datetime.datetime.combine(d, datetime.time(h, m))
+                    if c >= t:
+                        return c
+            d += _DAY
+        return None
+
+    def prev(self, dt: datetime.datetime) -> datetime.datetime | None:
+        d = dt.date()
+        for _ in range(366 * 8):
+            if self._day(d):
+                for h, m in self._times(reverse=True):
+                    c = datetime.datetime.combine(d, datetime.time(h, m))
+                    if c <= dt:
+                        return c
+            d -= _DAY
+        return None
+
+
+class Clock:
+    def now(self) -> datetime.datetime:
+        return datetime.datetime.now()
+
+    def wait(self, cond: threading.Condition, seconds: float | None, busy: bool):
+        cond.wait(60 if seconds is None else max(0.0, min(seconds, 60)))
+
+
+class SimClock:
+    def __init__(self, start: datetime.datetime, step: float = 0.05):
+        self._now = start
+        self.step = step
+
+    def now(self) -> datetime.datetime:
+        return self._now
+
+    def advance(self, seconds: float):
+        self._now += datetime.timedelta(seconds=seconds)
+
+    def wait(self, cond: threading.Condition, seconds: float | None, busy: bool):
+        if busy and cond.wait(self.step):
+            return
+        if seconds is not None:
+            self.advance(max(0.0, seconds))
+
+
+class Task:
+    def __init__(
+        self,
+        name: str,
+        fn,
+        schedule: str,
+        after=(),
+        timeout: float | None = None,
+        retries: int = 0,
+        retry_delay: float = 300.0,
+        catchup: float | None = None,
+    ):
+        self.name = name
+        self.fn = fn
+        self.cron = Cron(schedule)
+        self.after = list(after)
+        self.timeout = timeout or None
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.catchup = catchup
+
+
+class _Run:
+    def __init__(self, task: Task, slot, attempt: int, started, deadline):
+        self.task = task
+        self.slot = slot
+        self.attempt = attempt
+        self.started = started
+        self.deadline = deadline
+        self.finished = False
+        self.error = None
+
+
+def _iso(dt):
+    return dt.isoformat() if dt is not None else None
+
+
+def _parse(s):
+    return datetime.datetime.fromisoformat(s) if s else None
+
+
+class Scheduler:
+    def __init__(
+        self,
+        tasks: list[Task],
+        clock=None,
+        state_path: str | None = None,
+        workers: int | None = None,
+        catchup: float | None = None,
+    ):
+        self.tasks = {t.name: t for t in tasks}
+        for t in tasks:
+            for d in t.after:
+                if d not in self.tasks:
+                    raise ValueError(f"{t.name} depends on unknown task {d}")
+        self._check_cycles()
+        self.clock = clock or Clock()
+        self.state_path = state_path or os.environ.get(
+            "SCHEDULER_STATE", os.path.join("cache", "scheduler.json")
+        )
+        self.workers = workers or int(os.environ.get("SCHEDULER_WORKERS", "4"))
+        self.catchup = (
+            float(os.environ.get("SCHEDULER_CATCHUP", "43200"))
+            if catchup is None
+            else catchup
+        )
+        self.history = []
+        self._cond = threading.Condition()
+        self._pending: dict[str, list] = {}
+        self._running: dict[str, _Run] = {}
+        self._abandoned: list[_Run] = []
+        self._stopped = False
+        self._state = self._load()
+
+    def _check_cycles(self):
+        seen, stack = set(), set()
+
+        def visit(name):
+            if name in stack:
+                raise ValueError(f"dependency cycle through {name}")
+            if name in seen:
+                return
+            stack.add(name)
+            for d in self.tasks[name].after:
+                visit(d)
+            stack.discard(name)
+            seen.add(name)
+
+        for name in self.tasks:
+            visit(name)
+
+    def _load(self) -> dict:
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                raw = json.load(f)
+        except (OSError, ValueError):
+            raw = {}
+        return {
+            name: {
+                "attempted": _parse(raw.get(name, {}).get("attempted")),
+                "done": _parse(raw.get(name, {}).get("done")),
+                "status": raw.get(name, {}).get("status"),
+            }
+            for name in self.tasks
+        }
+
+    def _save(self):
+        atomic_write_json(
+            self.state_path,
+            {
+                name: {
+                    "attempted": _iso(s["attempted"]),
+                    "done": _iso(s["done"]),
+                    "status": s["status"],
+                }
+                for name, s in self._state.items()
+            },
+        )
+
+    def _window(self, task: Task) -> datetime.timedelta:
+        return datetime.timedelta(
+            seconds=self.catchup if task.catchup is None else task.catchup
+        )
+
+    def _enqueue_due(self, now):
+        for name, task in self.tasks.items():
+            slot = task.cron.prev(now)
+            if slot is None or now - slot > self._window(task):
+                continue
+            attempted = self._state[name]["attempted"]
+            if attempted is not None and slot <= attempted:
+                continue
+            p = self._pending.get(name)
+            if p is None or p[0] < slot:
+                self._pending[name] = [slot, 0, slot]
+
+    def _deps(self, task: Task, slot) -> str:
+        for d in task.after:
+            dslot = self.tasks[d].cron.prev(slot)
+            if dslot is None:
+                continue
+            s = self._state[d]
+            if s["done"] is not None and s["done"] >= dslot:
+                continue
+            if s["attempted"] is not None and s["attempted"] >= dslot:
+                return "failed"
+            return "waiting"
+        return "ok"
+
+    def _start_ready(self, now):
+        active = len(self._running)
+        for name, (slot, attempt, not_before) in sorted(
+            self._pending.items(), key=lambda kv: kv[1][0]
+        ):
+            if name in self._running or not_before > now:
+                continue
+            if any(r.task.name == name and r.slot == slot for r in self._abandoned):
+                continue
+            task = self.tasks[name]
+            deps = self._deps(task, slot)
+            if deps == "failed":
+                del self._pending[name]
+                self._finish(task, slot, now, now, "skipped")
+                continue
+            if deps != "ok" or active >= self.workers:
+                continue
+            del self._pending[name]
+            deadline = (
+                now + datetime.timedelta(seconds=task.timeout) if task.timeout else None
+            )
+            run = _Run(task, slot, attempt, now, deadline)
+            self._running[name] = run
+            active += 1
+            print(f"Running task {name} for {slot} (attempt {attempt + 1}) at {now}")
+            threading.Thread(target=self._execute, args=(run,), daemon=True).start()
+
+    def _execute(self, run: _Run):
+        try:
+            run.task.fn()
+        except Exception as e:
+            run.error = e
+        with self._cond:
+            run.finished = True
+            self._cond.notify_all()
+
+    def _reap(self, now):
+        self._abandoned = [r for r in self._abandoned if not r.finished]
+        for name, run in list(self._running.items()):
+            if run.finished:
+                del self._running[name]
+                if run.error is None:
+                    self._finish(run.task, run.slot, run.started, now, "ok")
+                else:
+                    print(f"Task {name} failed: {run.error!r}")
+                    self._fail(run, now, "failed")
+            elif run.deadline and now >= run.deadline:
+                del self._running[name]
+                self._abandoned.append(run)
+                print(f"Task {name} timed out after {run.task.timeout}s")
+                self._fail(run, now, "timeout")
+
+    def _fail(self, run: _Run, now, status: str):
+        task = run.task
+        if run.attempt < task.retries and task.name not in self._pending:
+            self._pending[task.name] = [
+                run.slot,
+                run.attempt + 1,
+                now + datetime.timedelta(seconds=task.retry_delay),
+            ]
+            self._record(task.name, run.slot, status, run.started, now)
+            return
+        self._finish(task, run.slot, run.started, now, status)
+
+    def _finish(self, task: Task, slot, started, now, status: str):
+        s = self._state[task.name]
+        s["attempted"] = max(slot, s["attempted"]) if s["attempted"] else slot
+        if status == "ok":
+            s["done"] = max(slot, s["done"]) if s["done"] else slot
+        s["status"] = status
+        self._record(task.name, slot, status, started, now)
+        self._save()
+
+    def _record(self, name: str, slot, status: str, started, now):
+        self.history.append((name, slot, status, started, now))
+        metrics.observe(
+            "scheduler_task_seconds",
+            (now - started).total_seconds(),
+            task=name,
+            status=status,
+        )
+
+    def _next_wake(self, now):
+        wake = [t.cron.next_after(now) for t in self.tasks.values()]
+        wake += [p[2] for p in self._pending.values() if p[2] > now]
+        wake += [r.deadline for r in self._running.values() if r.deadline]
+        wake = [w for w in wake if w is not None]
+        return min(wake) if wake else None
+
+    def step(self):
+        now = self.clock.now()
+        self._reap(now)
+        self._enqueue_due(now)
+        self._start_ready(now)
+        return now
+
+    def run(self, until: datetime.datetime | None = None):
+        with self._cond:
+            while not self._stopped:
+                now = self.step()
+                if until is not None and now >= until:
+                    break
+                wake = self._next_wake(now)
+                if until is not None:
+                    wake = min(wake, until) if wake else until
+                busy = any(not r.finished for r in self._running.values())
+                self.clock.wait(
+                    self._cond,
+                    (wake - now).total_seconds() if wake else None,
+                    busy,
+                )
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
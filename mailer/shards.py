@@ -0,0 +1,107 @@
+import os
+import re
+import glob
+import hashlib
+import threading
+from backend import metrics
+
+
+def shard_count() -> int:
+    return max(1, int(os.environ.get("SEND_SHARDS", "1")))
+
+
+def _processes() -> int:
+    return int(os.environ.get("SEND_PROCESSES", "0")) or os.cpu_count() or 1
+
+
+def shard_of(email: str, n: int) -> int:
+    h = hashlib.blake2b(email.strip().lower().encode("utf-8"), digest_size=8)
+    return int.from_bytes(h.digest(), "big") % n
+
+
+def partition(recipients: list[str], n: int) -> list[list[str]]:
+    out = [[] for _ in range(n)]
+    for r in recipients:
+        out[shard_of(r, n)].append(r)
+    return out
+
+
+def progress_path(path: str, shard: int, n: int) -> str:
+    return f"{path[: -len('.json')]}.shard-{shard:03d}-of-{n:03d}.sent.jsonl"
+
+
+def existing_count(path: str) -> int | None:
+    pattern = f"{glob.escape(path[: -len('.json')])}.shard-*-of-*.sent.jsonl"
+    for p in glob.glob(pattern):
+        m = re.search(r"\.shard-\d+-of-(\d+)\.sent\.jsonl$", p)
+        if m:
+            return int(m.group(1))
+    log = f"{path[: -len('.json')]}.sent.jsonl"
+    if os.path.isfile(log):
+        with open(log, "r", encoding="utf-8") as f:
+            if any('"batch":' in line for line in f):
+                return 1
+    return None
+
+
+def resolve(path: str, n: int) -> int:
+    used = existing_count(path)
+    if used is not None and used != n:
+        print(f"Resuming {path} with {used} shards (SEND_SHARDS={n} ignored)")
+        return used
+    return n
+
+
+def _init():
+    from backend import db, shaper
+    from . import artifacts
+
+    db._local = threading.local()
+    artifacts._store = None
+    if shaper._shaper is not None:
+        shaper._shaper._local = threading.local()
+
+
+def _worker(cache: dict, path: str, shard: int, n: int, deadline: float | None = None):
+    from .mailer import _deliver_cache
+
+    snap = metrics.snapshot()
+    report = _deliver_cache(cache, progress_path(path, shard, n), deadline)
+    return {**report, "metrics": metrics.report(snap)}
+
+
+def run(
+    path: str,
+    n: int,
+    processes: int | None = None,
+    deadline: float | None = None,
+    cache: dict | None = None,
+) -> list[dict]:
+    from concurrent.futures import ProcessPoolExecutor
+    from .mailer import _load_cache
+
+    cache = cache or _load_cache(path)
+    parts = [partition(item["recipients"], n) for item in cache.get("items", [])]
+    caches = [
+        {
+            **cache,
+            "items": [
+                {**item, "recipients": p[k]}
+                for item, p in zip(cache.get("items", []), parts)
+            ],
+        }
+        for k in range(n)
+    ]
+    workers = min(n, processes or _processes())
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init) as ex:
+        futures = [
+            ex.submit(_worker, caches[k], path, k, n, deadline) for k in range(n)
+        ]
+        reports = []
+        for k, fut in enumerate(futures):
+            try:
+                reports.append({"shard": k, **fut.result()})
+            except Exception as e:
+                print(f"Shard {k}/{n} failed: {e!r}")
+                reports.append({"shard": k, "error": repr(e)})
+    return reports